@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Date-range analytics over a user's meal history.
+
+MealAnalytics is built from CalorieTracker's daily totals index. It keeps the
+logged dates sorted alongside prefix sums (calories, days over target and
+the sums needed for a least-squares trend) and sparse tables for min/max,
+so any window is answered with two binary searches and O(1) arithmetic.
+"""
+
+import weakref
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+
+class MealAnalytics:
+    """Range queries over daily calorie totals."""
+
+    def __init__(self, daily_totals: Dict[str, Dict], target: Optional[float] = None):
+        """
+        Args:
+            daily_totals: Date ('YYYY-MM-DD') -> {'calories', 'meals', 'items'}
+            target: Daily calorie target used for over-target counts and streaks
+        """
+        self.target = target
+        self.dates: List[str] = sorted(d for d, totals in daily_totals.items() if totals['meals'] > 0)
+        self.calories: List[float] = [daily_totals[d]['calories'] for d in self.dates]
+        self.ordinals: List[int] = [date.fromisoformat(d).toordinal() for d in self.dates]
+        origin = self.ordinals[0] if self.ordinals else 0
+
+        # prefix[k] covers the first k logged days
+        self.sum_y = [0.0]
+        self.sum_x = [0.0]
+        self.sum_xx = [0.0]
+        self.sum_xy = [0.0]
+        self.over = [0]
+        for ordinal, calories in zip(self.ordinals, self.calories):
+            x = ordinal - origin
+            self.sum_y.append(self.sum_y[-1] + calories)
+            self.sum_x.append(self.sum_x[-1] + x)
+            self.sum_xx.append(self.sum_xx[-1] + x * x)
+            self.sum_xy.append(self.sum_xy[-1] + x * calories)
+            self.over.append(self.over[-1] + (target is not None and calories > target))
+
+        self._min_table = self._sparse_table(min)
+        self._max_table = self._sparse_table(max)
+        self._streaks = self._adherence_runs()
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def _sparse_table(self, pick) -> List[List[float]]:
+        """table[k][i] = pick of calories[i : i + 2**k]."""
+        table = [self.calories]
+        width = 1
+        while 2 * width <= len(self.calories):
+            prev = table[-1]
+            table.append([pick(prev[i], prev[i + width]) for i in range(len(prev) - width)])
+            width *= 2
+        return table
+
+    @staticmethod
+    def _range_pick(table: List[List[float]], pick, i: int, j: int) -> float:
+        """pick over calories[i:j] from two overlapping power-of-two blocks."""
+        level = (j - i).bit_length() - 1
+        row = table[level]
+        return pick(row[i], row[j - (1 << level)])
+
+    def _adherence_runs(self) -> List[int]:
+        """run[k] = length of the on-target streak of consecutive days ending at logged day k."""
+        runs = []
+        for k, calories in enumerate(self.calories):
+            on_target = self.target is not None and calories <= self.target
+            if not on_target:
+                runs.append(0)
+            elif k > 0 and runs[-1] and self.ordinals[k] - self.ordinals[k - 1] == 1:
+                runs.append(runs[-1] + 1)
+            else:
+                runs.append(1)
+        return runs
+
+    def _bounds(self, start: Optional[str], end: Optional[str]) -> tuple:
+        i = bisect_left(self.dates, start) if start else 0
+        j = bisect_right(self.dates, end) if end else len(self.dates)
+        return i, max(i, j)
+
+    def summary(self, start: Optional[str] = None, end: Optional[str] = None) -> Dict:
+        """
+        Aggregate the logged days between start and end (inclusive, 'YYYY-MM-DD').
+
+        Returns:
+            Dictionary with logged_days, total, average, min, max,
+            days_over_target and trend (least-squares kcal/day slope)
+        """
+        i, j = self._bounds(start, end)
+        n = j - i
+        result = {
+            'start': start,
+            'end': end,
+            'logged_days': n,
+            'total': round(self.sum_y[j] - self.sum_y[i], 1),
+            'average': None,
+            'min': None,
+            'max': None,
+            'days_over_target': (self.over[j] - self.over[i]) if self.target is not None else None,
+            'trend': None
+        }
+        if n == 0:
+            return result
+
+        result['average'] = round(result['total'] / n, 1)
+        result['min'] = self._range_pick(self._min_table, min, i, j)
+        result['max'] = self._range_pick(self._max_table, max, i, j)
+
+        sx = self.sum_x[j] - self.sum_x[i]
+        sxx = self.sum_xx[j] - self.sum_xx[i]
+        sy = self.sum_y[j] - self.sum_y[i]
+        sxy = self.sum_xy[j] - self.sum_xy[i]
+        denominator = n * sxx - sx * sx
+        if denominator:
+            result['trend'] = round((n * sxy - sx * sy) / denominator, 2)
+        return result
+
+    def periods(self, period: str = 'week', start: Optional[str] = None, end: Optional[str] = None) -> List[Dict]:
+        """
+        Summaries for each calendar week (Monday start) or month in a window.
+
+        The window is clipped to the span of logged days, so an open-ended
+        or very wide range costs no more than the history itself.
+        """
+        if not self.dates:
+            return []
+        first = max(date.fromisoformat(self.dates[0]), date.fromisoformat(start) if start else date.min)
+        last = min(date.fromisoformat(self.dates[-1]), date.fromisoformat(end) if end else date.max)
+
+        results = []
+        if period == 'week':
+            cursor = first - timedelta(days=first.weekday())
+        elif period == 'month':
+            cursor = first.replace(day=1)
+        else:
+            raise ValueError(f"Unknown period: {period}")
+        while cursor <= last:
+            try:
+                if period == 'week':
+                    following = cursor + timedelta(days=7)
+                else:
+                    following = (cursor.replace(day=28) + timedelta(days=4)).replace(day=1)
+            except OverflowError:
+                following = None  # the period running to date.max
+            period_end = following - timedelta(days=1) if following else date.max
+            summary = self.summary(cursor.isoformat(), period_end.isoformat())
+            summary['period'] = period
+            results.append(summary)
+            if following is None:
+                break
+            cursor = following
+        return results
+
+    def streaks(self, today: Optional[str] = None) -> Dict:
+        """
+        Adherence streaks: consecutive logged days at or under target.
+
+        The current streak counts if it ends today or yesterday (today may not
+        be logged yet).
+        """
+        longest = max(self._streaks, default=0)
+        current = 0
+        if self._streaks:
+            today_ordinal = date.fromisoformat(today).toordinal() if today else date.today().toordinal()
+            if today_ordinal - self.ordinals[-1] <= 1:
+                current = self._streaks[-1]
+        return {'current': current, 'longest': longest}
+
+
+_cache = weakref.WeakKeyDictionary()
+
+
+def get_analytics(tracker) -> MealAnalytics:
+    """
+    Return MealAnalytics for a CalorieTracker, reusing it while the data is unchanged.
+
+    The index is rebuilt when the tracker's storage version or target changes.
+    It covers archived days too, so the first call reads the user's archive.
+    """
+    profile = tracker.data.get('user_profile') or {}
+    key = (tracker.version, profile.get('daily_target'))
+    cached = _cache.get(tracker)
+    if cached is not None and key[0] is not None and cached[0] == key:
+        return cached[1]
+    analytics = MealAnalytics(tracker.history_totals(), profile.get('daily_target'))
+    _cache[tracker] = (key, analytics)
+    return analytics
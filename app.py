@@ -4,24 +4,150 @@ Calorie Deficit Management Web App
 Mobile-friendly Flask application for tracking calories and managing weight loss goals.
 """
 
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session
-from datetime import datetime, timedelta
+from flask import Flask, Response, g, request, redirect, url_for, jsonify, session
+import flask
+from datetime import datetime
+import cProfile
+import io
 import os
 import json
+import random
+import re
+import time
 from calories_app import CalorieCalculator, FoodDatabase, CalorieTracker
+from analytics import get_analytics
+from caching import LRUCache
+from data_layout import get_layout
+import meal_io
+import metrics
+from models import Meal, UserProfile
+import serializers
+from storage import JournalStorage, SQLiteStorage, TrackerStorage, WriteBehindStorage, create_storage
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 # Ensure templates auto-reload during development
 app.config['TEMPLATES_AUTO_RELOAD'] = True
+# Per-user storage backend: 'json' (full rewrite), 'journal' (append-only log) or 'sqlite'
+app.config['STORAGE_BACKEND'] = os.environ.get('CALORIES_STORAGE', 'json')
+app.config['SQLITE_PATH'] = os.environ.get('CALORIES_SQLITE_PATH', 'data/calories.db')
+# Where per-user files live: 'flat' (DATA_DIR/calorie_data_<id>.json) or 'sharded'
+# (hashed subdirectories, for very many users); see data_layout.py
+app.config['DATA_DIR'] = os.environ.get('CALORIES_DATA_DIR', 'data')
+app.config['DATA_LAYOUT'] = os.environ.get('CALORIES_DATA_LAYOUT', 'flat')
+# File format for new writes: 'json', 'compact' or 'binary' (all formats are readable)
+app.config['SERIALIZER'] = os.environ.get('CALORIES_SERIALIZER', 'json')
+# Coalesce writes made within this many seconds into one save (0 writes immediately)
+app.config['WRITE_BEHIND_SECONDS'] = float(os.environ.get('WRITE_BEHIND_SECONDS', 0))
+# Parsed trackers kept in memory per process (0 disables the cache)
+app.config['TRACKER_CACHE_SIZE'] = int(os.environ.get('TRACKER_CACHE_SIZE', 256))
+# Per-route timing and code-section spans, exported at /metrics
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '0') == '1'
+# Fraction of requests to run under cProfile, dumped to PROFILE_DIR
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+
+# Optional large food catalogue file (see food_catalogue.py). Load it before
+# gunicorn forks (--preload) so workers share the mapped pages.
+if os.environ.get('FOOD_CATALOGUE'):
+    FoodDatabase.load_catalogue(os.environ['FOOD_CATALOGUE'])
+
+# Largest list accepted by /api/food-estimate/batch
+MAX_BATCH_ITEMS = 500
+# Most completions returned by /api/food-suggest
+MAX_SUGGESTIONS = 50
+
+# Recently used trackers, reused while their storage version is unchanged
+tracker_cache = LRUCache(app.config['TRACKER_CACHE_SIZE'])
+
+REQUEST_SECONDS = metrics.REGISTRY.histogram('calories_request_duration_seconds',
+                                             'Request latency by route', ['route', 'method'])
+REQUESTS = metrics.REGISTRY.counter('calories_requests', 'Requests by route and status',
+                                    ['route', 'method', 'status'])
+
+
+def enable_instrumentation():
+    """Time tracker loads/saves, parsing, food estimates and template rendering as spans."""
+    metrics.instrument(CalorieTracker, 'load_data')
+    metrics.instrument(CalorieTracker, 'save_data')
+    # apply_event covers the whole mutation (lock, reload, apply, write);
+    # save_event only the storage write (queueing it, for write-behind)
+    metrics.instrument(CalorieTracker, 'apply', 'apply_event')
+    for storage_class in (TrackerStorage, JournalStorage, SQLiteStorage, WriteBehindStorage):
+        metrics.instrument(storage_class, 'record', 'save_event')
+    metrics.instrument(serializers, 'loads', 'parse')
+    metrics.instrument(FoodDatabase, 'estimate_calories')
+    metrics.enable()
+
+
+@metrics.timed('render_template')
+def render_template(template_name, **context):
+    """flask.render_template, timed as a span when instrumentation is on."""
+    return flask.render_template(template_name, **context)
+
+
+@app.before_request
+def start_request_instrumentation():
+    """Start the request timer, span collection and (if sampled) the profiler."""
+    if metrics.enabled():
+        g.request_started = time.perf_counter()
+        metrics.start_request()
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    if rate and random.random() < rate:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def finish_request_instrumentation(response):
+    """Record request metrics, add a Server-Timing header and dump any profile."""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    started = g.pop('request_started', None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        REQUEST_SECONDS.observe(elapsed, (route, request.method))
+        REQUESTS.inc((route, request.method, str(response.status_code)))
+        timings = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in metrics.finish_request()]
+        timings.append(f'total;dur={elapsed * 1000:.2f}')
+        response.headers['Server-Timing'] = ', '.join(timings)
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{request.method}-{slug}.prof"
+        profiler.dump_stats(os.path.join(app.config['PROFILE_DIR'], name))
+    return response
+
+
+if app.config['METRICS_ENABLED']:
+    enable_instrumentation()
+
 
 # Use session-based data file to support multiple users
+@metrics.timed('get_tracker')
 def get_tracker():
     """Get CalorieTracker instance for current session."""
     user_id = session.get('user_id', 'default')
-    data_file = f'data/calorie_data_{user_id}.json'
-    os.makedirs('data', exist_ok=True)
-    return CalorieTracker(data_file)
+    data_file = get_layout(app.config['DATA_LAYOUT'], app.config['DATA_DIR']).path_for(user_id)
+    backend = app.config['STORAGE_BACKEND']
+    cache_key = (backend, data_file)
+    
+    tracker = tracker_cache.get(cache_key)
+    if tracker is not None and tracker.is_current():
+        return tracker
+    
+    if backend == 'sqlite':
+        os.makedirs(os.path.dirname(app.config['SQLITE_PATH']) or '.', exist_ok=True)
+    else:
+        os.makedirs(os.path.dirname(data_file) or '.', exist_ok=True)
+    storage = create_storage(backend, data_file, user_id=user_id, db_path=app.config['SQLITE_PATH'],
+                             write_behind=app.config['WRITE_BEHIND_SECONDS'],
+                             serializer=app.config['SERIALIZER'])
+    tracker = CalorieTracker(data_file, storage)
+    tracker_cache.put(cache_key, tracker)
+    return tracker
 
 
 @app.route('/')
@@ -53,50 +179,31 @@ def setup_profile():
             target = CalorieCalculator.calculate_target_calories(tdee, weight_loss_rate)
             ideal_tdee = CalorieCalculator.calculate_ideal_weight_tdee(weight, ideal_weight, height, age, gender, activity_level)
             
-            # Compute intended vs actual deficit for warning visibility
-            intended_daily_deficit = round(CalorieCalculator.daily_deficit_for_rate(weight_loss_rate), 1)
-            raw_target = tdee - intended_daily_deficit
-            # Gender-aware minimum calorie floor
-            min_safe = 1200 if gender.lower() == 'female' else 1500
-            actual_target = max(raw_target, min_safe)
-            actual_daily_deficit = round(tdee - actual_target, 1)
-            safety_floor_applied = actual_target != raw_target
-
-            # Estimate time to goal using actual deficit
-            weight_to_lose = max(0.0, weight - ideal_weight)
-            calories_needed = weight_to_lose * 7700
-            if actual_daily_deficit > 0 and weight_to_lose > 0:
-                days_to_goal = int((calories_needed / actual_daily_deficit) + 0.9999)
-                weeks_to_goal = round(days_to_goal / 7.0, 1)
-                estimated_goal_date = (datetime.now() + timedelta(days=days_to_goal)).strftime('%Y-%m-%d')
-            else:
-                days_to_goal = None
-                weeks_to_goal = None
-                estimated_goal_date = None
+            # Gender-aware target and time to goal using the actual deficit
+            plan = CalorieCalculator.goal_plan(tdee, weight, ideal_weight, gender, weight_loss_rate)
             
             tracker = get_tracker()
-            tracker.data['user_profile'] = {
-                'weight': weight,
-                'height': height,
-                'age': age,
-                'gender': gender,
-                'activity_level': activity_level,
-                'weight_loss_rate': weight_loss_rate,
-                'ideal_weight': ideal_weight,
-                'bmr': round(bmr, 1),
-                'tdee': round(tdee, 1),
+            tracker.set_profile(UserProfile(
+                weight=weight,
+                height=height,
+                age=age,
+                gender=gender,
+                activity_level=activity_level,
+                weight_loss_rate=weight_loss_rate,
+                ideal_weight=ideal_weight,
+                bmr=round(bmr, 1),
+                tdee=round(tdee, 1),
                 # Store the actual, gender-aware daily target
-                'daily_target': round(actual_target, 1),
-                'ideal_weight_tdee': round(ideal_tdee, 1),
-                'intended_daily_deficit': intended_daily_deficit,
-                'actual_daily_deficit': actual_daily_deficit,
-                'safety_floor_applied': safety_floor_applied,
-                'min_safe_calories': min_safe,
-                'estimated_days_to_goal': days_to_goal,
-                'estimated_weeks_to_goal': weeks_to_goal,
-                'estimated_goal_date': estimated_goal_date
-            }
-            tracker.save_data()
+                daily_target=plan['daily_target'],
+                ideal_weight_tdee=round(ideal_tdee, 1),
+                intended_daily_deficit=plan['intended_daily_deficit'],
+                actual_daily_deficit=plan['actual_daily_deficit'],
+                safety_floor_applied=plan['safety_floor_applied'],
+                min_safe_calories=plan['min_safe_calories'],
+                estimated_days_to_goal=plan['estimated_days_to_goal'],
+                estimated_weeks_to_goal=plan['estimated_weeks_to_goal'],
+                estimated_goal_date=plan['estimated_goal_date']
+            ))
             
             # Store calculation details in session for results page
             session['calculation_results'] = {
@@ -107,19 +214,19 @@ def setup_profile():
                 'tdee': round(tdee, 1),
                 'ideal_tdee': round(ideal_tdee, 1),
                 # Use gender-aware actual values on results page too
-                'raw_target': round(raw_target, 1),
-                'target': round(actual_target, 1),
-                'deficit': round(tdee - actual_target, 1),
+                'raw_target': plan['raw_target'],
+                'target': plan['daily_target'],
+                'deficit': plan['actual_daily_deficit'],
                 'gender': gender,
                 'activity_level': activity_level,
                 'weight_loss_rate': weight_loss_rate,
-                'intended_daily_deficit': intended_daily_deficit,
-                'actual_daily_deficit': actual_daily_deficit,
-                'safety_floor_applied': safety_floor_applied,
-                'min_safe_calories': min_safe,
-                'estimated_days_to_goal': days_to_goal,
-                'estimated_weeks_to_goal': weeks_to_goal,
-                'estimated_goal_date': estimated_goal_date
+                'intended_daily_deficit': plan['intended_daily_deficit'],
+                'actual_daily_deficit': plan['actual_daily_deficit'],
+                'safety_floor_applied': plan['safety_floor_applied'],
+                'min_safe_calories': plan['min_safe_calories'],
+                'estimated_days_to_goal': plan['estimated_days_to_goal'],
+                'estimated_weeks_to_goal': plan['estimated_weeks_to_goal'],
+                'estimated_goal_date': plan['estimated_goal_date']
             }
             
             return redirect(url_for('calculation_results'))
@@ -142,7 +249,7 @@ def dashboard():
     target = profile['daily_target']
     
     meals = tracker.data['meals'].get(today, [])
-    total_consumed = sum(meal['total_calories'] for meal in meals)
+    total_consumed = tracker.consumed_on(today)
     remaining = target - total_consumed
     progress_percent = min(100, (total_consumed / target) * 100) if target > 0 else 0
     
@@ -183,20 +290,14 @@ def log_meal():
         
         if food_items:
             total_calories = sum(item['calories'] for item in food_items)
-            today = datetime.now().strftime('%Y-%m-%d')
-            
-            if today not in tracker.data['meals']:
-                tracker.data['meals'][today] = []
-            
-            meal_entry = {
-                'meal_name': meal_name,
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'items': food_items,
-                'total_calories': round(total_calories, 1)
-            }
+            meal_entry = Meal(
+                meal_name=meal_name,
+                timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                items=food_items,
+                total_calories=round(total_calories, 1)
+            )
             
-            tracker.data['meals'][today].append(meal_entry)
-            tracker.save_data()
+            tracker.add_meal(meal_entry)
         
         return redirect(url_for('dashboard'))
     
@@ -226,10 +327,7 @@ def estimate():
             # Calculate remaining calories
             today = datetime.now().strftime('%Y-%m-%d')
             target = tracker.data['user_profile']['daily_target']
-            total_consumed = sum(
-                meal['total_calories'] 
-                for meal in tracker.data['meals'].get(today, [])
-            )
+            total_consumed = tracker.consumed_on(today)
             remaining = target - total_consumed
     
     return render_template('estimate.html', result=result, remaining=remaining)
@@ -248,6 +346,116 @@ def api_food_estimate():
     return jsonify(estimate)
 
 
+@app.route('/api/food-estimate/batch', methods=['POST'])
+def api_food_estimate_batch():
+    """Estimate a list of {food, amount, unit} items in one request."""
+    payload = request.get_json(silent=True)
+    items = payload.get('items') if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        return jsonify({'error': 'Expected a JSON list of items'}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({'error': f'At most {MAX_BATCH_ITEMS} items per batch'}), 400
+    return jsonify({'results': FoodDatabase.estimate_batch(items)})
+
+
+@app.route('/api/food-suggest')
+def api_food_suggest():
+    """Typeahead completions for a partially typed food name."""
+    query = request.args.get('q', '')
+    try:
+        limit = min(int(request.args.get('limit', 10)), MAX_SUGGESTIONS)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify({'query': query, 'suggestions': FoodDatabase.suggest(query, limit)})
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request and span metrics in the Prometheus text format (METRICS_ENABLED=1)."""
+    if not metrics.enabled():
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/food-estimate/cache-stats')
+def api_food_cache_stats():
+    """Hit/miss counters for the food estimation cache."""
+    return jsonify(FoodDatabase.cache_stats())
+
+
+def _date_arg(name):
+    """Read an optional YYYY-MM-DD query parameter (ValueError if malformed)."""
+    value = request.args.get(name)
+    if value and datetime.strptime(value, '%Y-%m-%d').date().isoformat() != value:
+        raise ValueError(f"Not a zero-padded date: {value}")  # e.g. 2024-1-5
+    return value or None
+
+
+@app.route('/api/analytics/summary')
+def api_analytics_summary():
+    """Total/average/min/max/days over target/trend for a date range."""
+    tracker = get_tracker()
+    try:
+        start, end = _date_arg('start'), _date_arg('end')
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    return jsonify(get_analytics(tracker).summary(start, end))
+
+
+@app.route('/api/analytics/periods')
+def api_analytics_periods():
+    """Weekly or monthly summaries for a date range."""
+    tracker = get_tracker()
+    period = request.args.get('period', 'week')
+    if period not in ('week', 'month'):
+        return jsonify({'error': "period must be 'week' or 'month'"}), 400
+    try:
+        start, end = _date_arg('start'), _date_arg('end')
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    return jsonify(get_analytics(tracker).periods(period, start, end))
+
+
+@app.route('/api/analytics/streaks')
+def api_analytics_streaks():
+    """Current and longest runs of consecutive days within target."""
+    tracker = get_tracker()
+    today = datetime.now().strftime('%Y-%m-%d')
+    return jsonify(get_analytics(tracker).streaks(today))
+
+
+@app.route('/api/meals/import', methods=['POST'])
+def api_meals_import():
+    """Bulk-import meals from an uploaded CSV or JSONL file."""
+    tracker = get_tracker()
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'error': 'File required'}), 400
+    try:
+        fmt = request.form.get('format') or meal_io.detect_format(upload.filename or '')
+        f = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+        result = meal_io.import_meals(tracker, f, fmt)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+
+@app.route('/api/meals/export')
+def api_meals_export():
+    """Stream the meal history as CSV or JSONL."""
+    tracker = get_tracker()
+    fmt = request.args.get('format', 'csv')
+    if fmt not in meal_io.FORMATS:
+        return jsonify({'error': "format must be 'csv' or 'jsonl'"}), 400
+    try:
+        start, end = _date_arg('start'), _date_arg('end')
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(meal_io.iter_export(tracker, fmt, start, end), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=meals.{fmt}'})
+
+
 @app.route('/calculation-results')
 def calculation_results():
     """Show calculation results after profile setup."""
@@ -276,9 +484,7 @@ def delete_meal(meal_index):
     tracker = get_tracker()
     today = datetime.now().strftime('%Y-%m-%d')
     
-    if today in tracker.data['meals'] and 0 <= meal_index < len(tracker.data['meals'][today]):
-        del tracker.data['meals'][today][meal_index]
-        tracker.save_data()
+    tracker.remove_meal(today, meal_index)
     
     return redirect(url_for('dashboard'))
 
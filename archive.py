@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Columnar cold storage for a user's older meal days.
+
+Almost every request reads today's meals, yet every load of a tracker
+document parses and builds the user's whole history. Days older than a
+horizon can be moved out of the document (see CalorieTracker.archive_history
+and archive_history.py) into '<data file>.archive', which stores them column
+by column:
+
+    days                                one per day: date.toordinal(), ascending
+    day_calories, day_meals, day_items  the day's totals
+    day_start                           index of the day's first meal
+    meal_name, meal_time, meal_total    one per meal (time in seconds of the day)
+    meal_start                          index of the meal's first item
+    item_food, item_calories, item_amount_g, item_display, item_match,
+    item_matched_to, item_distance      one per item (-1: key not present)
+    day_int, meal_int, item_int         which numbers were ints (see below)
+
+Every column is an array.array saved as raw bytes, and strings are indexes
+into a per-file table. The file is only read when history is asked for:
+daily_totals() decodes the totals columns (for analytics), and iter_days()
+builds models records for just the days in the requested range.
+
+A meal that does not fit the columns (unknown keys, a timestamp other than
+'YYYY-MM-DD HH:MM:SS' on its own day, non-numeric values) is kept whole
+under 'irregular'. Numbers are stored as doubles, which hold any int the
+columns accept exactly, and a flag byte per day, meal and item records which
+of them were ints so they are restored as ints (item_int: 1 for calories,
+2 for amount_g).
+
+Moving days is crash safe. The archive is written first, and its header
+records the move's generation and how many meals of each day it took; an
+'archive_days' event (see storage.apply_event) then removes them from the
+document. If the process dies in between, reconcile() completes the move in
+memory when the document is next loaded.
+"""
+
+import marshal
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import nullcontext
+from datetime import date
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+from models import FoodItem, Meal, to_dict
+from storage import apply_event, atomic_write, day_totals, file_version
+
+SUFFIX = '.archive'
+MAGIC = b'CALA\x01'
+MARSHAL_VERSION = 4
+_HEADER_SIZE = struct.Struct('<I')
+_COLUMNS = {
+    'days': 'i', 'day_calories': 'd', 'day_meals': 'i', 'day_items': 'i', 'day_start': 'i',
+    'meal_name': 'i', 'meal_time': 'i', 'meal_total': 'd', 'meal_start': 'i',
+    'item_food': 'i', 'item_calories': 'd', 'item_amount_g': 'd', 'item_display': 'i',
+    'item_match': 'i', 'item_matched_to': 'i', 'item_distance': 'i',
+    'day_int': 'B', 'meal_int': 'B', 'item_int': 'B',
+}
+# Int flag column -> column it runs alongside (archives written without flags read as all floats)
+_INT_FLAGS = {'day_int': 'days', 'meal_int': 'meal_name', 'item_int': 'item_food'}
+_ITEM_REQUIRED = frozenset(('food', 'calories', 'amount_g', 'amount_display', 'match'))
+_ITEM_FIELDS = frozenset(FoodItem.FIELDS)
+_MEAL_FIELDS = frozenset(Meal.FIELDS)
+_MAX_INT = 2 ** 31 - 1
+
+
+def archive_path(data_file: str) -> str:
+    """Archive file for a user's data file."""
+    return data_file + SUFFIX
+
+
+def move_event(header: Dict) -> Dict:
+    """The 'archive_days' event removing what an archive's last write took from the document."""
+    return {'op': 'archive_days', 'generation': header['generation'], 'days': header['moved']}
+
+
+def _is_number(value) -> bool:
+    return type(value) is float or (type(value) is int and abs(value) <= 2 ** 53)
+
+
+def _format_time(day: str, seconds: int) -> str:
+    return f'{day} {seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+def _time_of_day(day: str, timestamp) -> Optional[int]:
+    """Seconds into day for a 'YYYY-MM-DD HH:MM:SS' timestamp on day, else None."""
+    if type(timestamp) is not str or len(timestamp) != 19 or not timestamp.startswith(day + ' '):
+        return None
+    try:
+        hours, minutes, seconds = (int(part) for part in timestamp[11:].split(':'))
+    except ValueError:
+        return None
+    seconds += hours * 3600 + minutes * 60
+    return seconds if _format_time(day, seconds) == timestamp else None
+
+
+def _item_row(item) -> Optional[tuple]:
+    item = to_dict(item)
+    keys = item.keys()
+    if not _ITEM_REQUIRED <= keys or not keys <= _ITEM_FIELDS:
+        return None
+    food, display, match = item['food'], item['amount_display'], item['match']
+    matched_to, distance = item.get('matched_to'), item.get('distance', -1)
+    if type(food) is not str or type(display) is not str or type(match) is not str:
+        return None
+    if not _is_number(item['calories']) or not _is_number(item['amount_g']):
+        return None
+    if 'matched_to' in item and type(matched_to) is not str:
+        return None
+    if 'distance' in item and (type(distance) is not int or not 0 <= distance <= _MAX_INT):
+        return None
+    return food, item['calories'], item['amount_g'], display, match, matched_to, distance
+
+
+def _meal_row(day: str, meal) -> Optional[tuple]:
+    """Column values for a meal and its items, or None if it does not fit the columns."""
+    meal = to_dict(meal)
+    if meal.keys() != _MEAL_FIELDS:
+        return None
+    name, items, total = meal['meal_name'], meal['items'], meal['total_calories']
+    seconds = _time_of_day(day, meal['timestamp'])
+    if type(name) is not str or type(items) is not list or not _is_number(total) or seconds is None:
+        return None
+    rows = [_item_row(item) for item in items]
+    if None in rows:
+        return None
+    return name, seconds, total, rows
+
+
+def encode(days: Dict[str, List]) -> Dict:
+    """
+    Columnar body for {date: [meal, ...]} (meals as dicts or records).
+
+    Returns:
+        The marshal-ready body: column bytes, 'strings', 'irregular' and 'byteorder'
+    """
+    columns = {name: array(code) for name, code in _COLUMNS.items()}
+    strings: List[str] = []
+    index: Dict[str, int] = {}
+    irregular = {}
+
+    def ref(value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        position = index.get(value)
+        if position is None:
+            position = index[value] = len(strings)
+            strings.append(value)
+        return position
+
+    for day in sorted(days):
+        meals = days[day]
+        totals = day_totals(meals)
+        columns['days'].append(date.fromisoformat(day).toordinal())
+        columns['day_calories'].append(totals['calories'])
+        columns['day_int'].append(type(totals['calories']) is int)
+        columns['day_meals'].append(totals['meals'])
+        columns['day_items'].append(totals['items'])
+        columns['day_start'].append(len(columns['meal_name']))
+        for meal in meals:
+            columns['meal_start'].append(len(columns['item_food']))
+            row = _meal_row(day, meal)
+            if row is None:
+                irregular[len(columns['meal_name'])] = to_dict(meal)
+                row = (None, -1, 0.0, ())
+            name, seconds, total, items = row
+            columns['meal_name'].append(ref(name))
+            columns['meal_time'].append(seconds)
+            columns['meal_total'].append(total)
+            columns['meal_int'].append(type(total) is int)
+            for food, calories, amount_g, display, match, matched_to, distance in items:
+                columns['item_food'].append(ref(food))
+                columns['item_calories'].append(calories)
+                columns['item_amount_g'].append(amount_g)
+                columns['item_int'].append((type(calories) is int) | (type(amount_g) is int) << 1)
+                columns['item_display'].append(ref(display))
+                columns['item_match'].append(ref(match))
+                columns['item_matched_to'].append(ref(matched_to))
+                columns['item_distance'].append(distance)
+    columns['day_start'].append(len(columns['meal_name']))
+    columns['meal_start'].append(len(columns['item_food']))
+
+    body = {name: column.tobytes() for name, column in columns.items()}
+    body.update(strings=strings, irregular=irregular, byteorder=sys.byteorder)
+    return body
+
+
+def decode(body: Dict) -> Dict:
+    """Columns (as arrays) of an encoded body, with the strings interned."""
+    columns = {}
+    for name, code in _COLUMNS.items():
+        column = array(code)
+        column.frombytes(body.get(name, b'') if name in _INT_FLAGS else body[name])
+        if body['byteorder'] != sys.byteorder:
+            column.byteswap()
+        columns[name] = column
+    for name, alongside in _INT_FLAGS.items():
+        columns[name].frombytes(bytes(len(columns[alongside]) - len(columns[name])))
+    columns['strings'] = [sys.intern(value) for value in body['strings']]
+    columns['irregular'] = body['irregular']
+    return columns
+
+
+def _build_meal(columns: Dict, day: str, position: int) -> Meal:
+    irregular = columns['irregular'].get(position)
+    if irregular is not None:
+        return Meal.from_dict(irregular)
+    strings = columns['strings']
+    items = []
+    for i in range(columns['meal_start'][position], columns['meal_start'][position + 1]):
+        item = FoodItem.__new__(FoodItem)
+        ints = columns['item_int'][i]
+        item.food = strings[columns['item_food'][i]]
+        item.calories = int(columns['item_calories'][i]) if ints & 1 else columns['item_calories'][i]
+        item.amount_g = int(columns['item_amount_g'][i]) if ints & 2 else columns['item_amount_g'][i]
+        item.amount_display = strings[columns['item_display'][i]]
+        item.match = strings[columns['item_match'][i]]
+        matched_to, distance = columns['item_matched_to'][i], columns['item_distance'][i]
+        if matched_to >= 0:
+            item.matched_to = strings[matched_to]
+        if distance >= 0:
+            item.distance = distance
+        item.extra = None
+        items.append(item)
+    meal = Meal.__new__(Meal)
+    meal.meal_name = strings[columns['meal_name'][position]]
+    meal.timestamp = _format_time(day, columns['meal_time'][position])
+    meal.items = items
+    total = columns['meal_total'][position]
+    meal.total_calories = int(total) if columns['meal_int'][position] else total
+    meal.extra = None
+    return meal
+
+
+class ColdArchive:
+    """
+    A user's archive file, read on demand and cached until the file changes.
+
+    An archive that cannot be parsed is moved aside to '<path>.corrupt',
+    under the given lock (the user's storage lock), as JsonFileStorage does
+    with data files. Read-only callers (dry runs, migrations) pass
+    read_only=True and get a ValueError instead, leaving the file where it is.
+    """
+
+    def __init__(self, path: str, read_only: bool = False, locked: Callable[[], ContextManager] = nullcontext):
+        self.path = path
+        self.read_only = read_only
+        self.locked = locked
+        self._version = None
+        self._header: Optional[Dict] = None
+        self._columns: Optional[Dict] = None
+        self._totals: Optional[Dict[str, Dict]] = None
+
+    def version(self) -> Optional[Tuple[int, int, int]]:
+        return file_version(self.path)
+
+    def _parse(self, body: bool) -> Tuple[Dict, Optional[Dict]]:
+        """The file's header and, if body, its columns; ValueError if it cannot be parsed."""
+        with open(self.path, 'rb') as f:
+            try:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError("not an archive file")
+                size, = _HEADER_SIZE.unpack(f.read(_HEADER_SIZE.size))
+                header = marshal.loads(f.read(size))
+                return header, decode(marshal.loads(f.read())) if body else None
+            except (ValueError, EOFError, TypeError, KeyError, struct.error) as e:
+                raise ValueError(f"{self.path} cannot be parsed: {e}") from e
+
+    def _read(self, body: bool) -> Optional[Tuple[Dict, Optional[Dict]]]:
+        version = self.version()
+        if version != self._version:
+            self._version, self._header, self._columns, self._totals = version, None, None, None
+        if version is None:
+            return None
+        if self._header is None or (body and self._columns is None):
+            try:
+                try:
+                    self._header, self._columns = self._parse(body)
+                except ValueError:
+                    if self.read_only:
+                        raise
+                    with self.locked():
+                        # Another worker may have replaced the file since; only move aside what is still unreadable
+                        self._version = self.version()
+                        try:
+                            self._header, self._columns = self._parse(body)
+                        except ValueError:
+                            os.replace(self.path, f"{self.path}.corrupt")
+                            self._version = self._header = self._columns = None
+                            return None
+            except FileNotFoundError:
+                self._version = self._header = self._columns = None
+                return None
+        return self._header, self._columns
+
+    def header(self) -> Optional[Dict]:
+        """
+        The archive's header, or None if there is no archive.
+
+        Keys: 'generation', 'moved' (date -> meals taken by the last write),
+        'first' and 'last' dates, 'days' and 'meals' counts.
+        """
+        read = self._read(body=False)
+        return read[0] if read else None
+
+    def _body(self) -> Optional[Dict]:
+        read = self._read(body=True)
+        return read[1] if read else None
+
+    def reconcile(self, data: Dict) -> bool:
+        """
+        Finish an interrupted move: drop from data what the archive's last write took.
+
+        Returns:
+            True if data changed
+        """
+        header = self.header()
+        if header is None or header['generation'] <= data.get('archive_generation', 0):
+            return False
+        return apply_event(data, move_event(header))
+
+    def daily_totals(self) -> Dict[str, Dict]:
+        """Date -> {'calories', 'meals', 'items'} for every archived day."""
+        columns = self._body()
+        if columns is None:
+            return {}
+        if self._totals is None:
+            self._totals = {
+                date.fromordinal(ordinal).isoformat(): {'calories': int(calories) if ints else calories,
+                                                        'meals': meals, 'items': items}
+                for ordinal, calories, ints, meals, items in zip(columns['days'], columns['day_calories'],
+                                                                  columns['day_int'], columns['day_meals'],
+                                                                  columns['day_items'])}
+        return self._totals
+
+    def iter_days(self, start: Optional[str] = None, end: Optional[str] = None) -> Iterator[Tuple[str, List[Meal]]]:
+        """Yield (date, meals) in date order, optionally limited to start..end inclusive."""
+        columns = self._body()
+        if columns is None:
+            return
+        days = columns['days']
+        first = bisect_left(days, date.fromisoformat(start).toordinal()) if start else 0
+        last = bisect_right(days, date.fromisoformat(end).toordinal()) if end else len(days)
+        day_start = columns['day_start']
+        for i in range(first, last):
+            day = date.fromordinal(days[i]).isoformat()
+            yield day, [_build_meal(columns, day, position) for position in range(day_start[i], day_start[i + 1])]
+
+    def write(self, days: Dict[str, List], generation: int, moved: Dict[str, int], fsync: bool = True):
+        """
+        Replace the archive with days ({date: [meal, ...]}).
+
+        Args:
+            days: Every archived day, the existing ones included
+            generation: Number of this write; the document records the last
+                one it has applied as 'archive_generation'
+            moved: Date -> number of meals this write takes from the document
+        """
+        header = {'generation': generation, 'moved': moved, 'first': min(days, default=None),
+                  'last': max(days, default=None), 'days': len(days),
+                  'meals': sum(len(meals) for meals in days.values())}
+        header_bytes = marshal.dumps(header, MARSHAL_VERSION)
+        content = b''.join((MAGIC, _HEADER_SIZE.pack(len(header_bytes)), header_bytes,
+                            marshal.dumps(encode(days), MARSHAL_VERSION)))
+        atomic_write(self.path, content, fsync=fsync)
+
+    def merge_into(self, data: Dict) -> Dict:
+        """Put every archived meal back into a tracker document (in place), e.g. for export to SQLite."""
+        self.reconcile(data)
+        for day, meals in self.iter_days():
+            data['meals'][day] = meals + data['meals'].get(day, [])
+        data.pop('archive_generation', None)
+        data.pop('daily_totals', None)
+        return data
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Move every user's older meal days into their cold archive.
+
+Usage:
+    python3 archive_history.py [data_dir] [--older-than DAYS] [--dry-run]
+
+Days more than --older-than days old (CALORIES_ARCHIVE_AFTER_DAYS, 90 by
+default) are moved from each data file to its '.archive' companion (see
+archive.py), so loading a user only parses their recent days. History,
+export and analytics still see every day. Files are opened through the
+app's storage settings (CALORIES_STORAGE, CALORIES_SERIALIZER and
+CALORIES_DATA_LAYOUT) and changed under the file lock, so the job can run
+while the app is serving and can simply be run again, e.g. nightly.
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from calories_app import CalorieTracker
+from data_layout import LAYOUTS, get_layout
+from storage import create_storage
+
+DEFAULT_HORIZON_DAYS = 90
+MAX_REPORTED_ERRORS = 50
+
+
+def run(data_dir: str, older_than: int = DEFAULT_HORIZON_DAYS, layout: str = 'flat', storage_kind: str = 'json',
+        serializer: str = 'json', dry_run: bool = False, today: Optional[datetime] = None) -> Dict:
+    """
+    Archive the days older than `older_than` days for every user under data_dir.
+
+    Returns:
+        Counts of users, users_archived, days and meals moved and failed
+        users, up to MAX_REPORTED_ERRORS errors, and elapsed seconds
+    """
+    if storage_kind == 'sqlite':
+        raise ValueError("SQLite storage reads meals by date already and has no archive")
+    before = ((today or datetime.now()) - timedelta(days=older_than)).strftime('%Y-%m-%d')
+    result = {'users': 0, 'users_archived': 0, 'days': 0, 'meals': 0, 'failed': 0, 'errors': []}
+    start = time.perf_counter()
+    for _, path in get_layout(layout, data_dir).iter_users():
+        result['users'] += 1
+        try:
+            tracker = CalorieTracker(path, create_storage(storage_kind, path, serializer=serializer, read_only=dry_run))
+            if dry_run:
+                old = tracker.archivable_days(before)
+                moved = {'days': len(old), 'meals': sum(old.values())}
+            else:
+                moved = tracker.archive_history(before)
+        except (OSError, ValueError) as e:
+            result['failed'] += 1
+            if len(result['errors']) < MAX_REPORTED_ERRORS:
+                result['errors'].append({'path': path, 'error': str(e)})
+            continue
+        result['users_archived'] += bool(moved['days'])
+        result['days'] += moved['days']
+        result['meals'] += moved['meals']
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def main(argv: Optional[List[str]] = None):
+    """Entry point for the archive job."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('data_dir', nargs='?', default=os.environ.get('CALORIES_DATA_DIR', 'data'))
+    parser.add_argument('--older-than', type=int, metavar='DAYS',
+                        default=int(os.environ.get('CALORIES_ARCHIVE_AFTER_DAYS', DEFAULT_HORIZON_DAYS)),
+                        help='archive days more than this many days old')
+    parser.add_argument('--layout', choices=LAYOUTS, default=os.environ.get('CALORIES_DATA_LAYOUT', 'flat'))
+    parser.add_argument('--dry-run', action='store_true', help='count what would move without writing')
+    args = parser.parse_args(argv)
+
+    try:
+        result = run(args.data_dir, args.older_than, args.layout, os.environ.get('CALORIES_STORAGE', 'json'),
+                     os.environ.get('CALORIES_SERIALIZER', 'json'), args.dry_run)
+    except ValueError as e:
+        parser.error(str(e))
+    verb = 'Would archive' if args.dry_run else 'Archived'
+    print(f"✓ {verb} {result['meals']} meals on {result['days']} days for "
+          f"{result['users_archived']} of {result['users']} users in {result['seconds']}s")
+    for error in result['errors']:
+        print(f"  ✗ {error['path']}: {error['error']}")
+    if result['failed']:
+        if result['failed'] > len(result['errors']):
+            print(f"  ... {result['failed'] - len(result['errors'])} more failures")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for the calorie app.
+
+Usage:
+    uvicorn asgi:app
+    hypercorn asgi:app
+
+The Flask views and CalorieTracker do blocking file (or SQLite) I/O, so
+this is a threaded WSGI server behind an ASGI front end, not async I/O.
+Requests go through asgiref's WsgiToAsgi. Each request runs in its own
+worker thread (an asgiref ThreadSensitiveContext per request; asgiref
+would otherwise run every request on one shared thread). At most
+ASGI_THREADS requests (default 32) run at once, and the rest wait on the
+event loop. That lets one process hold many idle keep-alive connections
+without a thread each. Pending write-behind changes are flushed on
+lifespan shutdown.
+"""
+
+import asyncio
+import os
+from typing import Callable, Dict
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from asgiref.wsgi import WsgiToAsgi
+
+from storage import WriteBehindStorage
+
+
+class AsgiApp:
+    """The Flask app as an ASGI 3 application, with lifespan handling."""
+
+    def __init__(self, wsgi_app: Callable, max_workers: int = 32):
+        """
+        Args:
+            wsgi_app: WSGI callable (the Flask app)
+            max_workers: Requests allowed to run at once
+        """
+        self.http = WsgiToAsgi(wsgi_app)
+        self.max_workers = max_workers
+        self.slots = asyncio.Semaphore(max_workers)
+
+    async def __call__(self, scope: Dict, receive: Callable, send: Callable):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            async with self.slots, ThreadSensitiveContext():
+                await self.http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def _lifespan(self, receive: Callable, send: Callable):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # Write out anything still held by write-behind storage
+                await sync_to_async(WriteBehindStorage.flush_all, thread_sensitive=False)()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_app(flask_app=None, max_workers: int = None) -> AsgiApp:
+    """Wrap the Flask app (app.app by default) for an ASGI server."""
+    if flask_app is None:
+        from app import app as flask_app
+    if max_workers is None:
+        max_workers = int(os.environ.get('ASGI_THREADS', 32))
+    return AsgiApp(flask_app, max_workers)
+
+
+app = create_app()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tracker load cost with older days in the columnar archive.
+
+Writes synthetic histories of several lengths, then times loading the
+tracker (what every request that misses the tracker cache pays) before and
+after CalorieTracker.archive_history moves all but the last --keep days to
+the archive, along with the first history_totals() (analytics) and a full
+iter_history() (export) that read the archive. Prints one JSON object per
+history length with file sizes in bytes and times in milliseconds.
+
+Usage:
+    python3 benchmarks/bench_archive.py [--days 365,1825] [--keep 90] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import ColdArchive  # noqa: E402
+from bench_serializers import best_of, synthetic_history  # noqa: E402
+from calories_app import CalorieTracker  # noqa: E402
+from serializers import get_serializer  # noqa: E402
+from storage import JsonFileStorage  # noqa: E402
+
+
+def measure(days: int, keep: int, serializer: str, repeat: int) -> dict:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'calorie_data_bench.json')
+
+        def load():
+            return CalorieTracker(path, JsonFileStorage(path, serializer=get_serializer(serializer)))
+
+        JsonFileStorage(path, serializer=get_serializer(serializer)).save(synthetic_history(days))
+        full_size = os.path.getsize(path)
+        full_load = best_of(repeat, load)
+
+        before = (date(2020, 1, 1) + timedelta(days=days - keep)).isoformat()
+        tracker = load()
+        moved = tracker.archive_history(before)
+
+        def cold_totals():
+            tracker.archive = ColdArchive(tracker.archive.path)
+            return tracker.history_totals()
+
+        return {
+            'days': days,
+            'serializer': serializer,
+            'archived_days': moved['days'],
+            'full_bytes': full_size,
+            'recent_bytes': os.path.getsize(path),
+            'archive_bytes': os.path.getsize(tracker.archive.path),
+            'full_load_ms': full_load,
+            'recent_load_ms': best_of(repeat, load),
+            'history_totals_ms': best_of(repeat, cold_totals),
+            'iter_history_ms': best_of(repeat, lambda: sum(1 for _ in tracker.iter_history())),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--days', default='365,1825', help='comma-separated history lengths')
+    parser.add_argument('--keep', type=int, default=90, help='recent days left in the data file')
+    parser.add_argument('--serializer', default='json')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    for days in (int(d) for d in args.days.split(',')):
+        print(json.dumps(measure(days, args.keep, args.serializer, args.repeat)))
+
+
+if __name__ == '__main__':
+    main()
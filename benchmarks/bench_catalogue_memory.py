@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Per-worker memory of the food catalogue backends, with and without indexes.
+
+For each catalogue size and backend, a fresh process opens the catalogue
+(the dict backend parses it from JSON, as a worker would load it), runs
+exact lookups, gets the partial, fuzzy and completion indexes the first
+non-exact lookup needs (built in memory for the dict backend, read from
+the file for mmap), then runs lookups of each kind. Resident memory is read from
+/proc/self/status after each stage: RssAnon is private to the worker,
+RssFile is the mapped catalogue, which the page cache shares between
+workers. Prints one JSON object per (size, backend) with MiB per stage.
+
+Linux only (needs /proc).
+
+Usage:
+    python3 benchmarks/bench_catalogue_memory.py [--sizes 10000,100000]
+"""
+
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_suggest import synthetic_names  # noqa: E402
+from calories_app import FoodDatabase  # noqa: E402
+from food_catalogue import DictCatalogue, MmapCatalogue, write_catalogue  # noqa: E402
+
+
+def rss_mib() -> dict:
+    """RssAnon and RssFile of this process in MiB."""
+    values = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, rest = line.partition(':')
+            if key in ('RssAnon', 'RssFile'):
+                values[key] = round(int(rest.split()[0]) / 1024, 1)
+    return values
+
+
+def worker(backend: str, json_path: str, fcat_path: str, queue):
+    gc.collect()
+    stages = {'start': rss_mib()}
+    if backend == 'mmap':
+        catalogue = MmapCatalogue(fcat_path)
+    else:
+        with open(json_path) as f:
+            catalogue = DictCatalogue(json.load(f))
+    FoodDatabase.use_catalogue(catalogue)
+    stages['opened'] = rss_mib()
+    names = list(catalogue.names())[::97]
+    for name in names:
+        catalogue.get(name)
+    del names
+    gc.collect()
+    stages['exact_lookups'] = rss_mib()
+    FoodDatabase.get_index()
+    FoodDatabase.get_fuzzy_index()
+    FoodDatabase.get_prefix_index()
+    gc.collect()
+    stages['indexes_built'] = rss_mib()
+    rng = random.Random(1)
+    for name in rng.sample(list(catalogue.names()), 300):
+        FoodDatabase.resolve(f'grilled {name}')
+        FoodDatabase.resolve(name[:-1] + 'x' + name[-1])
+        FoodDatabase.suggest(name[:4])
+    gc.collect()
+    stages['index_lookups'] = rss_mib()
+    queue.put(stages)
+
+
+def measure(size: int, backend: str, workdir: str) -> dict:
+    rng = random.Random(size)
+    json_path = os.path.join(workdir, f'foods_{size}.json')
+    fcat_path = os.path.join(workdir, f'foods_{size}.fcat')
+    if not os.path.exists(json_path):
+        foods = {name: rng.randint(10, 900) for name in synthetic_names(size)}
+        with open(json_path, 'w') as f:
+            json.dump(foods, f)
+        write_catalogue(fcat_path, foods.items(), FoodDatabase.FOOD_ALIASES)
+
+    queue = multiprocessing.get_context('spawn').Queue()
+    process = multiprocessing.get_context('spawn').Process(target=worker, args=(backend, json_path, fcat_path, queue))
+    process.start()
+    stages = queue.get()
+    process.join()
+    start = stages['start']['RssAnon']
+    result = {'catalogue': size, 'backend': backend, 'file_mib': round(os.path.getsize(fcat_path) / 2 ** 20, 1)}
+    for stage, values in stages.items():
+        if stage != 'start':
+            result[f'{stage}_anon_mib'] = round(values['RssAnon'] - start, 1)
+            result[f'{stage}_file_mib'] = values['RssFile']
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default='10000,100000', help='comma-separated catalogue sizes')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in (int(s) for s in args.sizes.split(',')):
+            for backend in ('dict', 'mmap'):
+                print(json.dumps(measure(size, backend, workdir)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Concurrent writer benchmark for CalorieTracker storage backends.
+
+Starts N processes that all log meals for the same user at once, then
+checks that no meal was lost and reports throughput.
+
+Usage:
+    python3 benchmarks/bench_concurrent_writers.py [--backend json] [--writers 1,2,4,8] [--meals 50]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Process
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calories_app import CalorieTracker  # noqa: E402
+from storage import create_storage  # noqa: E402
+
+DATE = '2024-01-01'
+
+
+def make_storage(backend, data_dir):
+    data_file = os.path.join(data_dir, 'calorie_data_bench.json')
+    return data_file, create_storage(backend, data_file, user_id='bench',
+                                     db_path=os.path.join(data_dir, 'calories.db'))
+
+
+def writer(backend, data_dir, writer_id, meals):
+    """Log `meals` meals for the shared user from one process."""
+    data_file, storage = make_storage(backend, data_dir)
+    tracker = CalorieTracker(data_file, storage)
+    for i in range(meals):
+        tracker.add_meal({
+            'meal_name': f'writer{writer_id}-{i}',
+            'timestamp': f'{DATE} 12:00:00',
+            'items': [{'food': 'banana', 'calories': 89, 'amount_g': 100,
+                       'amount_display': '100g', 'match': 'exact'}],
+            'total_calories': 89
+        }, DATE)
+
+
+def run(backend, writers, meals):
+    """Run one configuration and return its result row."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        processes = [Process(target=writer, args=(backend, data_dir, w, meals)) for w in range(writers)]
+        start = time.perf_counter()
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+        elapsed = time.perf_counter() - start
+
+        data_file, storage = make_storage(backend, data_dir)
+        stored = len(CalorieTracker(data_file, storage).data['meals'].get(DATE, []))
+        expected = writers * meals
+        return {
+            'backend': backend,
+            'writers': writers,
+            'meals_per_writer': meals,
+            'expected': expected,
+            'stored': stored,
+            'lost': expected - stored,
+            'seconds': round(elapsed, 3),
+            'writes_per_sec': round(expected / elapsed, 1)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--backend', default='json', choices=['json', 'journal', 'sqlite'])
+    parser.add_argument('--writers', default='1,2,4,8', help='comma-separated writer counts')
+    parser.add_argument('--meals', type=int, default=50, help='meals logged by each writer')
+    args = parser.parse_args()
+
+    for writers in (int(n) for n in args.writers.split(',')):
+        print(json.dumps(run(args.backend, writers, args.meals)))
+
+
+if __name__ == '__main__':
+    main()
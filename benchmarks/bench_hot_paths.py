@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the FoodDatabase and CalorieCalculator hot paths.
+
+Times FoodDatabase.parse_amount, estimate_calories on each match path
+(exact, partial, fuzzy, generic; with the estimate cache on and off) and
+the CalorieCalculator pipeline (scalar per profile and compute_batch)
+against synthetic catalogues of several sizes, so lookup scaling and
+regressions in the matching code show up. Timings are the best of
+--repeat timeit runs, auto-ranged to at least 0.2 s each.
+
+Prints one JSON object per (catalogue size, benchmark). Index build times
+are reported separately, since indexes are built once per process.
+
+Usage:
+    python3 benchmarks/bench_hot_paths.py [--sizes 50,10000,500000] [--backend dict|mmap] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_suggest import synthetic_names  # noqa: E402
+from calories_app import CalorieCalculator, FoodDatabase  # noqa: E402
+from food_catalogue import DictCatalogue, MmapCatalogue, write_catalogue  # noqa: E402
+
+
+def best_usec(fn, repeat: int) -> tuple:
+    """Best per-call time of fn() in microseconds, and the calls per timing run."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return round(best / number * 1e6, 3), number
+
+
+def make_catalogue(size: int, backend: str, workdir: str):
+    """Synthetic catalogue of `size` names with random calories."""
+    rng = random.Random(size)
+    foods = {name: rng.randint(10, 900) for name in synthetic_names(size)}
+    if backend == 'mmap':
+        path = os.path.join(workdir, f'foods_{size}.fcat')
+        write_catalogue(path, foods.items(), FoodDatabase.FOOD_ALIASES)
+        return MmapCatalogue(path), list(foods)
+    return DictCatalogue(foods), list(foods)
+
+
+def lookup_queries(names: list) -> dict:
+    """One query per match path, derived from catalogue names."""
+    rng = random.Random(7)
+    exact = rng.choice(names)
+    # Pick a name whose one-letter typo is not a substring match of anything
+    fuzzy = None
+    index = FoodDatabase.get_index()
+    for name in rng.sample(names, min(len(names), 200)):
+        if len(name) >= 6:
+            candidate = name[:2] + name[3:]
+            if FoodDatabase.catalogue.get(candidate) is None and index.partial(candidate) is None:
+                fuzzy = candidate
+                break
+    return {
+        'exact': exact,
+        'partial': f'grilled {exact} with extra sauce',
+        'fuzzy': fuzzy,
+        'generic': 'qxzv wjkq',
+    }
+
+
+def emit(record: dict):
+    print(json.dumps(record), flush=True)
+
+
+def bench_catalogue(size: int, backend: str, repeat: int, workdir: str):
+    catalogue, names = make_catalogue(size, backend, workdir)
+    FoodDatabase.use_catalogue(catalogue)
+    base = {'catalogue': size, 'backend': backend}
+
+    for label, build in (('food_index', FoodDatabase.get_index), ('fuzzy_index', FoodDatabase.get_fuzzy_index),
+                         ('prefix_index', FoodDatabase.get_prefix_index)):
+        start = time.perf_counter()
+        build()
+        emit(dict(base, benchmark=f'build_{label}', ms=round((time.perf_counter() - start) * 1000, 1)))
+
+    for unit in ('g', 'cup', 'medium', 'unknown'):
+        usec, number = best_usec(lambda: FoodDatabase.parse_amount('1.5', unit), repeat)
+        emit(dict(base, benchmark=f'parse_amount[{unit}]', usec=usec, number=number))
+
+    for path, query in lookup_queries(names).items():
+        if query is None:
+            continue
+        match = FoodDatabase.estimate_calories(query, 150)['match']
+        for cached in (True, False):
+            FoodDatabase.configure_cache(2048 if cached else 0)
+            usec, number = best_usec(lambda: FoodDatabase.estimate_calories(query, 150), repeat)
+            emit(dict(base, benchmark=f'estimate_calories[{path}]', cached=cached, match=match,
+                      usec=usec, number=number))
+    FoodDatabase.configure_cache(2048)
+
+
+def bench_calculator(repeat: int, profiles: int = 10000):
+    rng = random.Random(3)
+    genders = list(CalorieCalculator.GENDER_CODES)
+    activities = list(CalorieCalculator.ACTIVITY_MULTIPLIERS)
+    rates = list(CalorieCalculator.WEEKLY_DEFICITS)
+    people = [(rng.uniform(50, 130), rng.uniform(150, 200), rng.randint(18, 80), rng.choice(genders),
+               rng.choice(activities), rng.choice(rates), rng.uniform(50, 90)) for _ in range(profiles)]
+
+    def scalar():
+        for weight, height, age, gender, activity, rate, ideal in people:
+            bmr = CalorieCalculator.calculate_bmr(weight, height, age, gender)
+            tdee = CalorieCalculator.calculate_tdee(bmr, activity)
+            CalorieCalculator.calculate_target_calories(tdee, rate)
+            CalorieCalculator.calculate_ideal_weight_tdee(weight, ideal, height, age, gender, activity)
+
+    codes = [CalorieCalculator.encode_profile(p[3], p[4], p[5]) for p in people]
+    columns = ([p[0] for p in people], [p[1] for p in people], [p[2] for p in people],
+               [c[0] for c in codes], [c[1] for c in codes], [c[2] for c in codes])
+    ideals = [p[6] for p in people]
+
+    def batch():
+        CalorieCalculator.compute_batch(*columns, ideal_weights=ideals)
+
+    for label, fn in (('calculator_pipeline[scalar]', scalar), ('calculator_pipeline[batch]', batch)):
+        usec, number = best_usec(fn, repeat)
+        emit({'benchmark': label, 'profiles': profiles, 'usec_per_profile': round(usec / profiles, 4),
+              'number': number})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default='50,10000,500000', help='comma-separated catalogue sizes')
+    parser.add_argument('--backend', choices=('dict', 'mmap'), default='dict')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    bench_calculator(args.repeat)
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in (int(n) for n in args.sizes.split(',')):
+            bench_catalogue(size, args.backend, args.repeat, workdir)
+
+
+if __name__ == '__main__':
+    main()
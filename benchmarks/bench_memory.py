@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+In-memory footprint of a loaded tracker document: plain dicts vs models records.
+
+Serializes synthetic histories of several lengths, then measures with
+tracemalloc the memory held by the parsed document as plain dicts and after
+models.from_document converts it to slotted records, along with the time
+the conversion adds to a load. Prints one JSON object per history length
+with total KiB and bytes per meal item (meal and day overhead included).
+
+Usage:
+    python3 benchmarks/bench_memory.py [--days 30,365,1825]
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_serializers import synthetic_history  # noqa: E402
+from models import from_document  # noqa: E402
+
+
+def traced_bytes(build) -> tuple:
+    """Memory still allocated by build()'s result, and the result."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0] - before, result
+    finally:
+        tracemalloc.stop()
+
+
+def measure(days: int) -> dict:
+    content = json.dumps(synthetic_history(days))
+    plain_bytes, plain = traced_bytes(lambda: json.loads(content))
+    record_bytes, _ = traced_bytes(lambda: from_document(json.loads(content)))
+    items = sum(len(meal['items']) for meals in plain['meals'].values() for meal in meals)
+
+    start = time.perf_counter()
+    json.loads(content)
+    parse = time.perf_counter() - start
+    start = time.perf_counter()
+    from_document(json.loads(content))
+    convert = time.perf_counter() - start - parse
+
+    return {
+        'days': days,
+        'items': items,
+        'dict_kib': round(plain_bytes / 1024, 1),
+        'records_kib': round(record_bytes / 1024, 1),
+        'dict_bytes_per_item': round(plain_bytes / items, 1),
+        'records_bytes_per_item': round(record_bytes / items, 1),
+        'saving': f'{1 - record_bytes / plain_bytes:.0%}',
+        'parse_ms': round(parse * 1000, 2),
+        'convert_ms': round(convert * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--days', default='30,365,1825', help='comma-separated history lengths')
+    args = parser.parse_args()
+    for days in (int(d) for d in args.days.split(',')):
+        print(json.dumps(measure(days)))
+
+
+if __name__ == '__main__':
+    main()
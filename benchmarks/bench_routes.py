@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Latency and throughput of the main web routes by history length.
+
+For each synthetic history size (small, medium, multi-year) a set of
+users is seeded and every route is requested in turn, round-robin over
+the users, through Flask's test client or, with --url, a running server.
+Prints one JSON object per (history, route) with p50/p95/p99 latency and
+requests/sec, tagged with the git revision and time so results can be
+collected for trend tracking (--output appends them to a JSONL file).
+
+Usage:
+    python3 benchmarks/bench_routes.py [--requests 200] [--histories small,medium,multi_year]
+    python3 benchmarks/bench_routes.py --url http://127.0.0.1:5000 --data-dir data
+
+(With --url, --data-dir must be the server's data directory.) The storage
+backend is the app's own configuration, so CALORIES_STORAGE and
+CALORIES_SERIALIZER select what is measured in test-client mode.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loadtest import seed_users, session_cookies, summarize  # noqa: E402
+
+HISTORIES = {'small': 7, 'medium': 180, 'multi_year': 1095}
+
+# (name, method, path, form data)
+ROUTES = [
+    ('dashboard', 'GET', '/dashboard', None),
+    ('log_meal', 'POST', '/log-meal', {'meal_name': 'Lunch', 'food[]': ['rice', 'chicken breast'],
+                                       'amount[]': ['1', '1'], 'unit[]': ['bowl', 'serving']}),
+    ('estimate', 'POST', '/estimate', {'food': 'banana', 'amount': '1', 'unit': 'piece'}),
+    ('api_food_estimate', 'GET', '/api/food-estimate?food=grilled+chicken&amount=150', None),
+]
+
+
+def git_revision() -> Optional[str]:
+    """Short hash of the checked-out commit, if this is a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def test_client_sender(flask_app) -> Callable:
+    """Return send(method, path, form, cookie) -> status using Flask's test client."""
+    client = flask_app.test_client()
+
+    def send(method: str, path: str, form: Optional[Dict], cookie: str) -> int:
+        name, value = cookie.split('=', 1)
+        client.set_cookie(name, value)
+        return client.open(path, method=method, data=form).status_code
+
+    return send
+
+
+def http_sender(url: str) -> Callable:
+    """Return send(method, path, form, cookie) -> status over one keep-alive connection."""
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+
+    def send(method: str, path: str, form: Optional[Dict], cookie: str) -> int:
+        headers = {'Cookie': cookie}
+        body = None
+        if form is not None:
+            body = urlencode(form, doseq=True)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        conn.request(method, parts.path.rstrip('/') + path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+
+    return send
+
+
+def bench_route(send: Callable, method: str, path: str, form: Optional[Dict], cookies: List[str],
+                requests: int, warmup: int) -> tuple:
+    """Time `requests` sequential requests after `warmup` untimed ones."""
+    for i in range(warmup):
+        send(method, path, form, cookies[i % len(cookies)])
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    for i in range(requests):
+        cookie = cookies[i % len(cookies)]
+        t0 = time.perf_counter()
+        status = send(method, path, form, cookie)
+        latencies.append(time.perf_counter() - t0)
+        errors += status >= 400
+    return latencies, errors, time.perf_counter() - start
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--histories', default=','.join(HISTORIES), help='comma-separated: ' + ', '.join(HISTORIES))
+    parser.add_argument('--routes', default=','.join(r[0] for r in ROUTES))
+    parser.add_argument('--users', type=int, default=10, help='users per history size')
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--url', help='benchmark a running server instead of the test client')
+    parser.add_argument('--data-dir', help='where to seed users (default: a temporary directory)')
+    parser.add_argument('--output', help='append results to this JSONL file')
+    args = parser.parse_args(argv)
+
+    temp_dir = None
+    if args.data_dir is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        os.chdir(temp_dir.name)
+        data_dir = 'data'
+    else:
+        data_dir = args.data_dir
+
+    import app as web
+    send = http_sender(args.url) if args.url else test_client_sender(web.app)
+    routes = [route for route in ROUTES if route[0] in args.routes.split(',')]
+    meta = {'mode': 'http' if args.url else 'test_client', 'storage': web.app.config['STORAGE_BACKEND'],
+            'serializer': web.app.config['SERIALIZER'], 'git_rev': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds')}
+
+    output = open(args.output, 'a') if args.output else None
+    try:
+        for history in args.histories.split(','):
+            days = HISTORIES[history]
+            cookies = session_cookies(web.app, seed_users(data_dir, args.users, days, prefix=f'{history}_',
+                                                                layout=web.app.config['DATA_LAYOUT']))
+            for name, method, path, form in routes:
+                latencies, errors, elapsed = bench_route(send, method, path, form, cookies,
+                                                         args.requests, args.warmup)
+                result = summarize(name, latencies, errors, elapsed, history=history, days=days,
+                                   method=method, path=path, **meta)
+                line = json.dumps(result)
+                print(line)
+                if output:
+                    output.write(line + '\n')
+    finally:
+        if output:
+            output.close()
+        if temp_dir is not None:
+            os.chdir(os.path.dirname(os.path.abspath(__file__)))
+            temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Load/save latency and file size of the tracker data file formats.
+
+Builds synthetic meal histories of several lengths and times
+JsonFileStorage.save/load with each serializer. Prints one JSON object
+per (history, serializer) pair.
+
+Usage:
+    python3 benchmarks/bench_serializers.py [--days 30,365,1825] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calories_app import FoodDatabase  # noqa: E402
+from serializers import SERIALIZERS  # noqa: E402
+from storage import JsonFileStorage  # noqa: E402
+
+FOODS = [('banana', '1', 'piece'), ('rice', '1', 'bowl'), ('chicken breast', '1', 'serving'),
+         ('iced matcha latte', '1', 'cup'), ('salad', '1', 'medium')]
+
+
+def synthetic_history(days: int, meals_per_day: int = 3, items_per_meal: int = 3) -> dict:
+    """Build a tracker document with `days` days of meals."""
+    start = date(2020, 1, 1)
+    meals = {}
+    for d in range(days):
+        day = (start + timedelta(days=d)).isoformat()
+        meals[day] = []
+        for m in range(meals_per_day):
+            items = []
+            for i in range(items_per_meal):
+                food, amount, unit = FOODS[(d + m + i) % len(FOODS)]
+                items.append(FoodDatabase.estimate_calories(
+                    food, FoodDatabase.parse_amount(amount, unit), f"{amount} {unit}"))
+            meals[day].append({
+                'meal_name': ['breakfast', 'lunch', 'dinner'][m % 3],
+                'timestamp': f"{day} {8 + 5 * m:02d}:00:00",
+                'items': items,
+                'total_calories': round(sum(item['calories'] for item in items), 1)
+            })
+    return {'user_profile': {'weight': 80.0, 'daily_target': 1800.0}, 'meals': meals}
+
+
+def best_of(repeat: int, fn) -> float:
+    """Best wall time of fn() in milliseconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return round(min(times) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--days', default='30,365,1825', help='comma-separated history lengths')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        for days in (int(n) for n in args.days.split(',')):
+            data = synthetic_history(days)
+            for name, serializer in SERIALIZERS.items():
+                storage = JsonFileStorage(os.path.join(data_dir, f'{name}.dat'), fsync=False,
+                                          serializer=serializer)
+                save_ms = best_of(args.repeat, lambda: storage.save(data))
+                load_ms = best_of(args.repeat, storage.load)
+                print(json.dumps({
+                    'days': days,
+                    'serializer': name,
+                    'bytes': os.path.getsize(storage.path),
+                    'save_ms': save_ms,
+                    'load_ms': load_ms
+                }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Latency of food name completion (PrefixIndex.complete) by catalogue size.
+
+Builds synthetic catalogues and times random prefixes of each length,
+cold (first query of a prefix) and warm (repeated). Prints one JSON
+object per (catalogue size, prefix length) pair.
+
+Usage:
+    python3 benchmarks/bench_suggest.py [--sizes 50,10000,100000] [--queries 2000]
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from food_index import PrefixIndex  # noqa: E402
+
+
+def synthetic_names(count: int, seed: int = 1) -> list:
+    """Food-like names of one to three words drawn from a fixed vocabulary."""
+    rng = random.Random(seed)
+    words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+             for _ in range(max(50, count // 20))]
+    return [' '.join(rng.sample(words, rng.randint(1, 3))) for _ in range(count)]
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default='50,10000,100000', help='comma-separated catalogue sizes')
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(2)
+    for size in (int(n) for n in args.sizes.split(',')):
+        names = synthetic_names(size)
+        start = time.perf_counter()
+        index = PrefixIndex(names)
+        build_ms = (time.perf_counter() - start) * 1000
+        for length in (1, 2, 3, 5, 8):
+            prefixes = [name[:length] for name in rng.choices(names, k=args.queries)]
+            for phase in ('cold', 'warm'):
+                if phase == 'cold':
+                    index.cache.clear()
+                samples = []
+                for prefix in prefixes:
+                    start = time.perf_counter()
+                    index.complete(prefix)
+                    samples.append((time.perf_counter() - start) * 1e6)
+                print(json.dumps({
+                    'catalogue': size,
+                    'prefix_length': length,
+                    'phase': phase,
+                    'build_ms': round(build_ms, 1),
+                    'p50_us': round(percentile(samples, 50), 1),
+                    'p99_us': round(percentile(samples, 99), 1),
+                    'max_us': round(max(samples), 1)
+                }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Concurrent load test of the web app: WSGI (app.py) against ASGI (asgi.py).
+
+In-process mode (the default) seeds synthetic users in a temporary data
+directory and drives both entry points at the same concurrency: the Flask
+WSGI callable from client threads and the ASGI wrapper from asyncio tasks.
+--disk-latency-ms adds a sleep to every data file read and write to model
+a slow disk.
+
+With --url, real servers are driven over HTTP instead, e.g.
+
+    gunicorn -w 1 --threads 8 -b :5000 app:app
+    uvicorn --port 8000 asgi:app
+    python3 benchmarks/loadtest.py --url http://127.0.0.1:5000 --url http://127.0.0.1:8000 --data-dir data
+
+(--data-dir must be the servers' data directory so the seeded users exist.)
+
+Prints one JSON object per target with requests/sec and latency percentiles.
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_serializers import synthetic_history  # noqa: E402
+from data_layout import get_layout  # noqa: E402
+from storage import JsonFileStorage  # noqa: E402
+
+DEFAULT_PATHS = ['/dashboard', '/api/food-estimate?food=banana&amount=120', '/api/analytics/summary']
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """pct-th percentile of samples (nearest rank)."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(target: str, latencies: List[float], errors: int, elapsed: float, **extra) -> Dict:
+    """Result record for one target; latencies are in seconds."""
+    result = {'target': target, 'requests': len(latencies), 'errors': errors,
+              'rps': round(len(latencies) / elapsed, 1)}
+    if latencies:
+        for pct in (50, 95, 99):
+            result[f'p{pct}_ms'] = round(percentile(latencies, pct) * 1000, 3)
+        result['max_ms'] = round(max(latencies) * 1000, 3)
+    result.update(extra)
+    return result
+
+
+def seed_users(data_dir: str, users: int, days: int, prefix: str = 'load', layout: str = 'flat') -> List[str]:
+    """Write `users` data files with a profile and `days` of meals; return their ids."""
+    resolver = get_layout(layout, data_dir)
+    profile = {'weight': 80.0, 'height': 180.0, 'age': 30, 'gender': 'male', 'activity_level': 'moderate',
+               'weight_loss_rate': 'moderate', 'ideal_weight': 70.0, 'bmr': 1780.0, 'tdee': 2759.0,
+               'daily_target': 2209.0, 'ideal_tdee': 2542.8, 'created_at': '2024-01-01 00:00:00'}
+    user_ids = []
+    for n in range(users):
+        user_id = f'{prefix}{n}'
+        data = synthetic_history(days)
+        data['user_profile'] = profile
+        path = resolver.path_for(user_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        JsonFileStorage(path, fsync=False).save(data)
+        user_ids.append(user_id)
+    return user_ids
+
+
+def session_cookies(flask_app, user_ids: List[str]) -> List[str]:
+    """Signed session cookie headers selecting each user."""
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    name = flask_app.config['SESSION_COOKIE_NAME']
+    return [f"{name}={serializer.dumps({'user_id': user_id})}" for user_id in user_ids]
+
+
+def slow_disk(latency_ms: float):
+    """Add latency to every data file load and save."""
+    import storage
+
+    delay = latency_ms / 1000
+    load, write = storage.JsonFileStorage.load, storage.atomic_write
+
+    def slow_load(self):
+        time.sleep(delay)
+        return load(self)
+
+    def slow_write(*args, **kwargs):
+        time.sleep(delay)
+        return write(*args, **kwargs)
+
+    storage.JsonFileStorage.load = slow_load
+    storage.atomic_write = slow_write
+
+
+def run_threads(target: str, request: Callable[[str, str], int], requests: List[Tuple[str, str]],
+                concurrency: int, duration: float) -> Dict:
+    """Issue requests from `concurrency` threads for `duration` seconds."""
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(seed: int):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            path, cookie = rng.choice(requests)
+            start = time.perf_counter()
+            try:
+                ok = request(path, cookie) < 400
+            except OSError:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += not ok
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(target, latencies, errors[0], time.perf_counter() - start, concurrency=concurrency)
+
+
+def run_wsgi(flask_app, requests: List[Tuple[str, str]], concurrency: int, duration: float) -> Dict:
+    """Call the WSGI app directly from client threads."""
+    from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+    def request(path: str, cookie: str) -> int:
+        environ = EnvironBuilder(path=path, headers={'Cookie': cookie}).get_environ()
+        app_iter, status, _ = run_wsgi_app(flask_app.wsgi_app, environ, buffered=True)
+        return int(status.split(' ', 1)[0])
+
+    return run_threads('wsgi', request, requests, concurrency, duration)
+
+
+def run_http(url: str, requests: List[Tuple[str, str]], concurrency: int, duration: float) -> Dict:
+    """Drive a running server over keep-alive HTTP connections, one per client thread."""
+    parts = urlsplit(url)
+    local = threading.local()
+
+    def request(path: str, cookie: str) -> int:
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        try:
+            conn.request('GET', parts.path.rstrip('/') + path, headers={'Cookie': cookie})
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            local.conn = None
+            raise OSError('request failed')
+
+    return run_threads(url, request, requests, concurrency, duration)
+
+
+async def _asgi_request(asgi_app, path: str, cookie: str) -> int:
+    """Send one GET through an ASGI app and return the status code."""
+    path, _, query = path.partition('?')
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+             'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+             'root_path': '', 'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+             'client': ('127.0.0.1', 0), 'server': ('localhost', 80)}
+    status = [500]
+    sent = [False]
+
+    async def receive():
+        if sent[0]:
+            await asyncio.sleep(3600)
+        sent[0] = True
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status[0] = message['status']
+
+    await asgi_app(scope, receive, send)
+    return status[0]
+
+
+def run_asgi(asgi_app, requests: List[Tuple[str, str]], concurrency: int, duration: float) -> Dict:
+    """Drive the ASGI app from `concurrency` asyncio tasks on one event loop."""
+    latencies: List[float] = []
+    errors = [0]
+
+    async def client(seed: int, deadline: float):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            path, cookie = rng.choice(requests)
+            start = time.perf_counter()
+            ok = await _asgi_request(asgi_app, path, cookie) < 400
+            latencies.append(time.perf_counter() - start)
+            errors[0] += not ok
+
+    async def main():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(client(i, deadline) for i in range(concurrency)))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return summarize('asgi', latencies, errors[0], time.perf_counter() - start, concurrency=concurrency,
+                     threads=asgi_app.max_workers)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--url', action='append', help='server to test (repeatable); default is in-process')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per target')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--days', type=int, default=90, help='history length of each synthetic user')
+    parser.add_argument('--threads', type=int, default=8, help='ASGI concurrent requests (in-process mode)')
+    parser.add_argument('--disk-latency-ms', type=float, default=0, help='in-process mode only')
+    parser.add_argument('--data-dir', help='where to seed users (default: a temporary directory)')
+    parser.add_argument('--path', action='append', dest='paths', help='request path (repeatable)')
+    args = parser.parse_args(argv)
+
+    paths = args.paths or DEFAULT_PATHS
+    temp_dir = None
+    if args.data_dir is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        os.chdir(temp_dir.name)
+        data_dir = 'data'
+    else:
+        data_dir = args.data_dir
+
+    try:
+        import app as web
+        user_ids = seed_users(data_dir, args.users, args.days, layout=web.app.config['DATA_LAYOUT'])
+        cookies = session_cookies(web.app, user_ids)
+        requests = [(path, cookie) for path in paths for cookie in cookies]
+
+        if args.url:
+            for url in args.url:
+                print(json.dumps(run_http(url, requests, args.concurrency, args.duration)))
+            return
+
+        if args.disk_latency_ms:
+            slow_disk(args.disk_latency_ms)
+        # Measure the apps rather than the per-process tracker cache
+        web.tracker_cache.resize(0)
+        from asgi import AsgiApp
+        print(json.dumps(run_wsgi(web.app, requests, args.concurrency, args.duration)))
+        print(json.dumps(run_asgi(AsgiApp(web.app, args.threads), requests, args.concurrency, args.duration)))
+    finally:
+        if temp_dir is not None:
+            os.chdir(os.path.dirname(os.path.abspath(__file__)))
+            temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,15 +4,51 @@ Calorie Deficit Management App
 Helps users track their daily calorie intake and manage weight loss goals.
 """
 
-import json
 import os
-from datetime import datetime
-from typing import Dict, List, Optional
+import threading
+from array import array
+from contextlib import contextmanager
+from datetime import date as date_type, datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from archive import ColdArchive, archive_path
+from caching import LRUCache
+from food_catalogue import DictCatalogue, FoodCatalogue, MmapCatalogue
+from food_index import FoodIndex, FuzzyIndex, PrefixIndex
+from models import event_records, from_document
+from storage import JsonFileStorage, TrackerStorage, apply_event, sync_daily_totals
 
 
 class CalorieCalculator:
     """Calculate daily calorie targets based on user data."""
     
+    # Activity level -> TDEE multiplier
+    ACTIVITY_MULTIPLIERS = {
+        'sedentary': 1.2,
+        'light': 1.375,
+        'moderate': 1.55,
+        'active': 1.725,
+        'very_active': 1.9
+    }
+    
+    # Calories in 1 kg of body fat
+    KCAL_PER_KG = 7700
+    
+    # Weight loss rate -> weekly deficit
+    WEEKLY_DEFICITS = {
+        'slow': KCAL_PER_KG * 0.25,      # ~275 cal/day
+        'moderate': KCAL_PER_KG * 0.5,   # ~550 cal/day
+        'fast': KCAL_PER_KG * 0.75       # ~825 cal/day
+    }
+    
+    # Gender-aware minimum daily intake for the stored daily target
+    MIN_SAFE_CALORIES = {'female': 1200, 'male': 1500}
+    
+    # Integer codes used by compute_batch (index into these tuples)
+    GENDER_CODES = ('female', 'male')
+    ACTIVITY_CODES = tuple(ACTIVITY_MULTIPLIERS)
+    RATE_CODES = tuple(WEEKLY_DEFICITS)
+    
     @staticmethod
     def calculate_bmr(weight_kg: float, height_cm: float, age: int, gender: str) -> float:
         """
@@ -45,14 +81,7 @@ class CalorieCalculator:
         Returns:
             TDEE in calories per day
         """
-        activity_multipliers = {
-            'sedentary': 1.2,
-            'light': 1.375,
-            'moderate': 1.55,
-            'active': 1.725,
-            'very_active': 1.9
-        }
-        multiplier = activity_multipliers.get(activity_level.lower(), 1.2)
+        multiplier = CalorieCalculator.ACTIVITY_MULTIPLIERS.get(activity_level.lower(), 1.2)
         return bmr * multiplier
     
     @staticmethod
@@ -67,13 +96,7 @@ class CalorieCalculator:
         Returns:
             Target daily calories
         """
-        # 1 kg of fat ≈ 7700 calories
-        deficit_per_week = {
-            'slow': 7700 * 0.25,      # ~275 cal/day
-            'moderate': 7700 * 0.5,   # ~550 cal/day
-            'fast': 7700 * 0.75       # ~825 cal/day
-        }
-        deficit = deficit_per_week.get(weight_loss_rate.lower(), 550) / 7
+        deficit = CalorieCalculator.WEEKLY_DEFICITS.get(weight_loss_rate.lower(), 550) / 7
         target = tdee - deficit
         # Ensure minimum safe calorie intake
         return max(target, 1200 if True else 1500)  # 1200 for female, 1500 for male
@@ -84,12 +107,60 @@ class CalorieCalculator:
         Return the intended daily calorie deficit for the given weight loss rate.
         slow -> ~275/day, moderate -> ~550/day, fast -> ~825/day
         """
-        mapping = {
-            'slow': 7700 * 0.25 / 7,
-            'moderate': 7700 * 0.5 / 7,
-            'fast': 7700 * 0.75 / 7,
+        weekly = CalorieCalculator.WEEKLY_DEFICITS.get(weight_loss_rate.lower(), 7700 * 0.5)
+        return weekly / 7
+    
+    @staticmethod
+    def goal_plan(tdee: float, weight: float, ideal_weight: float, gender: str, weight_loss_rate: str,
+                  start: Optional[datetime] = None) -> Dict:
+        """
+        Derive the daily target and goal estimate stored in a user profile.
+        
+        The target is TDEE less the rate's deficit, raised to the gender-aware
+        safety floor; the time to goal uses the deficit actually achieved.
+        
+        Args:
+            tdee: Total Daily Energy Expenditure
+            weight: Current weight in kg
+            ideal_weight: Goal weight in kg
+            gender: 'male' or 'female'
+            weight_loss_rate: 'slow', 'moderate' or 'fast'
+            start: Date the goal estimate counts from (now by default)
+        
+        Returns:
+            Dictionary with raw_target, daily_target, intended_daily_deficit,
+            actual_daily_deficit, safety_floor_applied, min_safe_calories,
+            estimated_days_to_goal, estimated_weeks_to_goal and
+            estimated_goal_date (the last three None if there is nothing to lose)
+        """
+        intended_daily_deficit = round(CalorieCalculator.daily_deficit_for_rate(weight_loss_rate), 1)
+        raw_target = tdee - intended_daily_deficit
+        min_safe = CalorieCalculator.MIN_SAFE_CALORIES['female' if gender.lower() == 'female' else 'male']
+        actual_target = max(raw_target, min_safe)
+        actual_daily_deficit = round(tdee - actual_target, 1)
+        
+        weight_to_lose = max(0.0, weight - ideal_weight)
+        calories_needed = weight_to_lose * CalorieCalculator.KCAL_PER_KG
+        if actual_daily_deficit > 0 and weight_to_lose > 0:
+            days_to_goal = int((calories_needed / actual_daily_deficit) + 0.9999)
+            weeks_to_goal = round(days_to_goal / 7.0, 1)
+            goal_date = ((start or datetime.now()) + timedelta(days=days_to_goal)).strftime('%Y-%m-%d')
+        else:
+            days_to_goal = None
+            weeks_to_goal = None
+            goal_date = None
+        
+        return {
+            'raw_target': round(raw_target, 1),
+            'daily_target': round(actual_target, 1),
+            'intended_daily_deficit': intended_daily_deficit,
+            'actual_daily_deficit': actual_daily_deficit,
+            'safety_floor_applied': actual_target != raw_target,
+            'min_safe_calories': min_safe,
+            'estimated_days_to_goal': days_to_goal,
+            'estimated_weeks_to_goal': weeks_to_goal,
+            'estimated_goal_date': goal_date
         }
-        return mapping.get(weight_loss_rate.lower(), 7700 * 0.5 / 7)
     
     @staticmethod
     def calculate_ideal_weight_tdee(current_weight: float, ideal_weight: float, height_cm: float, age: int, gender: str, activity_level: str) -> float:
@@ -110,6 +181,95 @@ class CalorieCalculator:
         ideal_bmr = CalorieCalculator.calculate_bmr(ideal_weight, height_cm, age, gender)
         ideal_tdee = CalorieCalculator.calculate_tdee(ideal_bmr, activity_level)
         return ideal_tdee
+    
+    @staticmethod
+    def encode_profile(gender: str, activity_level: str, weight_loss_rate: str) -> tuple:
+        """
+        Convert profile strings to the integer codes used by compute_batch.
+        
+        Unknown values map to -1, which compute_batch treats the same way the
+        scalar methods treat unknown strings: female, a 1.2x activity
+        multiplier and a 550/7 (about 79) kcal/day deficit, which is
+        calculate_target_calories' fallback, not the moderate 550 kcal/day.
+        """
+        gender_code = 1 if gender.lower() == 'male' else 0
+        activity = activity_level.lower()
+        rate = weight_loss_rate.lower()
+        activity_code = CalorieCalculator.ACTIVITY_CODES.index(activity) if activity in CalorieCalculator.ACTIVITY_MULTIPLIERS else -1
+        rate_code = CalorieCalculator.RATE_CODES.index(rate) if rate in CalorieCalculator.WEEKLY_DEFICITS else -1
+        return gender_code, activity_code, rate_code
+    
+    @staticmethod
+    def compute_batch(weights: Sequence[float], heights: Sequence[float], ages: Sequence[int],
+                      gender_codes: Sequence[int], activity_codes: Sequence[int], rate_codes: Sequence[int],
+                      ideal_weights: Optional[Sequence[float]] = None) -> Dict[str, array]:
+        """
+        Calculate BMR, TDEE, target and ideal-weight TDEE for many profiles.
+        
+        A batch convenience API, not a vectorized one: it is a single pure-Python
+        loop over the rows. It saves the scalar path's per-call string parsing
+        and method calls (about half the time per profile in
+        benchmarks/bench_hot_paths.py), but the arithmetic still runs once per row.
+        
+        Inputs are parallel columns of any sequence type (lists, array.array;
+        NumPy arrays work but are iterated element by element). Codes index into
+        GENDER_CODES, ACTIVITY_CODES and RATE_CODES; see encode_profile. Results
+        are identical to calling the scalar methods row by row.
+        
+        Args:
+            weights: Weights in kilograms
+            heights: Heights in centimeters
+            ages: Ages in years
+            gender_codes: 1 for male, anything else for female
+            activity_codes: Index into ACTIVITY_CODES (-1 for unknown)
+            rate_codes: Index into RATE_CODES (-1 for unknown)
+            ideal_weights: Goal weights in kilograms (defaults to weights)
+        
+        Returns:
+            Dictionary of 'bmr', 'tdee', 'target' and 'ideal_tdee' arrays of doubles
+        """
+        n = len(weights)
+        columns = [heights, ages, gender_codes, activity_codes, rate_codes]
+        if ideal_weights is None:
+            ideal_weights = weights
+        columns.append(ideal_weights)
+        if any(len(column) != n for column in columns):
+            raise ValueError("All input columns must have the same length")
+        
+        # Lookup tables replace per-row string parsing; the last slot holds the
+        # default used by the scalar path so that code -1 resolves to it.
+        multipliers = [CalorieCalculator.ACTIVITY_MULTIPLIERS[a] for a in CalorieCalculator.ACTIVITY_CODES] + [1.2]
+        daily_deficits = [CalorieCalculator.WEEKLY_DEFICITS[r] / 7 for r in CalorieCalculator.RATE_CODES] + [550 / 7]
+        gender_offsets = (-161, 5)
+        n_activity = len(multipliers) - 1
+        n_rates = len(daily_deficits) - 1
+        
+        bmr_out = array('d', bytes(8 * n))
+        tdee_out = array('d', bytes(8 * n))
+        target_out = array('d', bytes(8 * n))
+        ideal_out = array('d', bytes(8 * n))
+        
+        for i, (weight, height, age, gender, activity, rate, ideal) in enumerate(
+                zip(weights, heights, ages, gender_codes, activity_codes, rate_codes, ideal_weights)):
+            offset = gender_offsets[1 if gender == 1 else 0]
+            multiplier = multipliers[activity if 0 <= activity < n_activity else n_activity]
+            deficit = daily_deficits[rate if 0 <= rate < n_rates else n_rates]
+            
+            bmr = 10 * weight + 6.25 * height - 5 * age + offset
+            tdee = bmr * multiplier
+            target = tdee - deficit
+            
+            bmr_out[i] = bmr
+            tdee_out[i] = tdee
+            target_out[i] = target if target > 1200 else 1200
+            ideal_out[i] = (10 * ideal + 6.25 * height - 5 * age + offset) * multiplier
+        
+        return {
+            'bmr': bmr_out,
+            'tdee': tdee_out,
+            'target': target_out,
+            'ideal_tdee': ideal_out
+        }
 
 
 class FoodDatabase:
@@ -183,6 +343,174 @@ class FoodDatabase:
         'tea': 1,
     }
     
+    # Other names for catalogue foods, offered as completions by suggest()
+    FOOD_ALIASES = {
+        'egg': 'eggs',
+        'chicken': 'chicken breast',
+        'oatmeal': 'oats',
+        'yoghurt': 'yogurt',
+        'crisps': 'chips',
+        'biscuit': 'cookie',
+        'pop': 'soda',
+        'hamburger': 'burger',
+        'spaghetti': 'pasta',
+        'toast': 'bread',
+    }
+    
+    # Active catalogue backend (FOOD_CALORIES unless use_catalogue() is called)
+    catalogue: FoodCatalogue = DictCatalogue(FOOD_CALORIES)
+    
+    # Lookup index over the catalogue, built on first use
+    _index: Optional[FoodIndex] = None
+    
+    # Misspelling index over the catalogue, built on the first fuzzy lookup
+    _fuzzy_index: Optional[FuzzyIndex] = None
+    
+    # Completion index over the catalogue and aliases, built on first use
+    _prefix_index: Optional[PrefixIndex] = None
+    
+    # Resolved matches keyed on normalized food name: (match, cal_per_100g, matched_to, distance)
+    estimate_cache = LRUCache(int(os.environ.get('FOOD_CACHE_SIZE', 2048)))
+    # (catalogue, catalogue.version()) the indexes and cached matches were built from
+    _cached_catalogue = None
+    
+    @staticmethod
+    def use_catalogue(catalogue: FoodCatalogue):
+        """Switch the database to a different catalogue backend."""
+        FoodDatabase.catalogue = catalogue
+        FoodDatabase._index = None
+        FoodDatabase._fuzzy_index = None
+        FoodDatabase._prefix_index = None
+        FoodDatabase.estimate_cache.clear()
+    
+    @staticmethod
+    def configure_cache(maxsize: int):
+        """Resize the estimation cache (0 disables it)."""
+        FoodDatabase.estimate_cache.resize(maxsize)
+    
+    @staticmethod
+    def cache_stats() -> Dict:
+        """Return estimation cache size, hit/miss/eviction counters and hit rate."""
+        return FoodDatabase.estimate_cache.stats()
+    
+    @staticmethod
+    def load_catalogue(path: str):
+        """Serve foods from a catalogue file built with food_catalogue.write_catalogue."""
+        FoodDatabase.use_catalogue(MmapCatalogue(path))
+    
+    @staticmethod
+    def _current_catalogue() -> FoodCatalogue:
+        """Return the catalogue, first dropping indexes and cached matches if it changed since."""
+        catalogue = FoodDatabase.catalogue
+        state = (catalogue, catalogue.version())
+        if state != FoodDatabase._cached_catalogue:
+            FoodDatabase._index = None
+            FoodDatabase._fuzzy_index = None
+            FoodDatabase._prefix_index = None
+            FoodDatabase.estimate_cache.clear()
+            FoodDatabase._cached_catalogue = state
+        return catalogue
+    
+    @staticmethod
+    def get_index() -> FoodIndex:
+        """Return the food name index, rebuilding it if the catalogue changed."""
+        FoodDatabase._current_catalogue()
+        index = FoodDatabase._index
+        if index is None:
+            index = FoodDatabase.rebuild_index()
+        return index
+    
+    @staticmethod
+    def rebuild_index() -> FoodIndex:
+        """Rebuild the food name index from the catalogue."""
+        catalogue = FoodDatabase._current_catalogue()
+        FoodDatabase._index = catalogue.food_index() or FoodIndex(catalogue.names())
+        FoodDatabase._fuzzy_index = None
+        FoodDatabase._prefix_index = None
+        FoodDatabase.estimate_cache.clear()
+        return FoodDatabase._index
+    
+    @staticmethod
+    def get_fuzzy_index() -> FuzzyIndex:
+        """Return the misspelling index, rebuilding it if the catalogue changed."""
+        catalogue = FoodDatabase._current_catalogue()
+        index = FoodDatabase._fuzzy_index
+        if index is None:
+            index = catalogue.fuzzy_index() or FuzzyIndex(catalogue.names())
+            FoodDatabase._fuzzy_index = index
+        return index
+    
+    @staticmethod
+    def get_prefix_index() -> PrefixIndex:
+        """Return the completion index, rebuilding it if the catalogue changed."""
+        catalogue = FoodDatabase._current_catalogue()
+        index = FoodDatabase._prefix_index
+        if index is None:
+            index = (catalogue.prefix_index(FoodDatabase.FOOD_ALIASES)
+                     or PrefixIndex(catalogue.names(), FoodDatabase.FOOD_ALIASES))
+            FoodDatabase._prefix_index = index
+        return index
+    
+    @staticmethod
+    def suggest(query: str, limit: int = 10) -> List[Dict]:
+        """
+        Complete a partially typed food name.
+        
+        Args:
+            query: Prefix typed so far (matches the start of a name or of any word in it)
+            limit: Maximum number of suggestions
+        
+        Returns:
+            List of {'food', 'calories_per_100g'} dictionaries, best first, with
+            'alias' set when the query matched another name for the food
+        """
+        suggestions = []
+        for name, alias in FoodDatabase.get_prefix_index().complete(query, limit):
+            suggestion = {'food': name, 'calories_per_100g': FoodDatabase.catalogue.get(name)}
+            if alias is not None:
+                suggestion['alias'] = alias
+            suggestions.append(suggestion)
+        return suggestions
+    
+    @staticmethod
+    def resolve(food_lower: str) -> tuple:
+        """
+        Resolve a normalized food name against the catalogue.
+        
+        Results do not depend on the amount, so they are cached per name and
+        dropped whenever the catalogue is swapped or its version() changes.
+        
+        Args:
+            food_lower: Lowercase, stripped food name
+        
+        Returns:
+            Tuple of (match type, calories per 100g, matched catalogue name or
+            None, edit distance for fuzzy matches or None)
+        """
+        catalogue = FoodDatabase._current_catalogue()
+        resolved = FoodDatabase.estimate_cache.get(food_lower)
+        if resolved is not None:
+            return resolved
+        
+        cal_per_100g = catalogue.get(food_lower)
+        if cal_per_100g is not None:
+            resolved = ('exact', cal_per_100g, None, None)
+        else:
+            # First catalogue entry contained in, or containing, the query
+            key = FoodDatabase.get_index().partial(food_lower)
+            if key is not None:
+                resolved = ('approximate', catalogue.get(key), key, None)
+            else:
+                # Closest name within a couple of typos
+                fuzzy = FoodDatabase.get_fuzzy_index().search(food_lower)
+                if fuzzy is not None:
+                    resolved = ('fuzzy', catalogue.get(fuzzy[0]), fuzzy[0], fuzzy[1])
+                else:
+                    resolved = ('generic_estimate', 150, None, None)
+        
+        FoodDatabase.estimate_cache.put(food_lower, resolved)
+        return resolved
+    
     @staticmethod
     def parse_amount(amount_str: str, unit: str = 'g') -> float:
         """
@@ -228,65 +556,272 @@ class FoodDatabase:
         food_lower = food_name.lower().strip()
         display = amount_display if amount_display else f"{amount_g}g"
         
-        # Direct match
-        if food_lower in FoodDatabase.FOOD_CALORIES:
-            cal_per_100g = FoodDatabase.FOOD_CALORIES[food_lower]
-            return {
-                'food': food_name,
-                'calories': round(cal_per_100g * amount_g / 100, 1),
-                'amount_g': amount_g,
-                'amount_display': display,
-                'match': 'exact'
-            }
+        match, cal_per_100g, matched_to, distance = FoodDatabase.resolve(food_lower)
         
-        # Partial match
-        for key, cal_per_100g in FoodDatabase.FOOD_CALORIES.items():
-            if key in food_lower or food_lower in key:
-                return {
-                    'food': food_name,
-                    'calories': round(cal_per_100g * amount_g / 100, 1),
-                    'amount_g': amount_g,
-                    'amount_display': display,
-                    'match': 'approximate',
-                    'matched_to': key
-                }
-        
-        # No match - provide general estimate
-        return {
+        result = {
             'food': food_name,
-            'calories': round(150 * amount_g / 100, 1),
+            'calories': round(cal_per_100g * amount_g / 100, 1),
             'amount_g': amount_g,
             'amount_display': display,
-            'match': 'generic_estimate'
+            'match': match
         }
+        if matched_to is not None:
+            result['matched_to'] = matched_to
+        if distance is not None:
+            result['distance'] = distance
+        return result
+    
+    @staticmethod
+    def estimate_batch(items: Sequence[Dict]) -> List[Dict]:
+        """
+        Estimate calories for a list of {'food', 'amount', 'unit'} objects.
+        
+        Items are handled independently: one that is malformed gets an
+        {'error': ...} entry in its position instead of failing the batch.
+        amount defaults to 100 and unit to 'g'.
+        
+        Args:
+            items: Food items to estimate
+        
+        Returns:
+            One estimate (or error) per item, in order
+        """
+        results = []
+        for item in items:
+            if not isinstance(item, dict):
+                results.append({'error': 'Item must be an object'})
+                continue
+            food = item.get('food')
+            if not isinstance(food, str) or not food.strip():
+                results.append({'error': 'Food name required'})
+                continue
+            amount = item.get('amount', 100)
+            unit = item.get('unit') or 'g'
+            try:
+                float(amount)
+            except (ValueError, TypeError):
+                results.append({'food': food, 'error': f'Invalid amount: {amount}'})
+                continue
+            if not isinstance(unit, str):
+                results.append({'food': food, 'error': f'Invalid unit: {unit}'})
+                continue
+            amount_g = FoodDatabase.parse_amount(amount, unit)
+            amount_display = f"{amount} {unit}" if 'unit' in item else None
+            results.append(FoodDatabase.estimate_calories(food, amount_g, amount_display))
+        return results
+
+
+def _is_iso_date(value: str) -> bool:
+    try:
+        return date_type.fromisoformat(value).isoformat() == value
+    except ValueError:
+        return False
 
 
 class CalorieTracker:
     """Main calorie tracking application."""
     
-    def __init__(self, data_file: str = 'calorie_data.json'):
+    def __init__(self, data_file: str = 'calorie_data.json', storage: Optional[TrackerStorage] = None):
         self.data_file = data_file
+        self.storage = storage if storage is not None else JsonFileStorage(data_file)
+        self.lock = self.storage.lock or threading.RLock()
+        # Days moved out of the document (see archive.py); SQLite already reads by date
+        self.archive = (ColdArchive(archive_path(data_file), self.storage.read_only, self.storage.locked)
+                        if self.storage.keeps_extra_keys else None)
+        self.version = None
         self.data = self.load_data()
     
+    def _stored_version(self):
+        version = self.storage.version()
+        if version is None or self.archive is None:
+            return version
+        return version, self.archive.version()
+    
     def load_data(self) -> Dict:
-        """Load user data from file."""
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'r') as f:
-                    content = f.read().strip()
-                    if content:
-                        return json.loads(content)
-            except (json.JSONDecodeError, IOError):
-                pass
-        return {
-            'user_profile': None,
-            'meals': {}  # Date -> list of meals
-        }
+        """Load user data from storage."""
+        # Read the version first so a concurrent write makes us look stale, not current
+        self.version = self._stored_version()
+        data = from_document(self.storage.load())
+        sync_daily_totals(data)
+        if self.archive is not None:
+            self.archive.reconcile(data)
+        return data
     
     def save_data(self):
-        """Save user data to file."""
-        with open(self.data_file, 'w') as f:
-            json.dump(self.data, f, indent=2)
+        """Save all user data to storage."""
+        with self.lock, self.storage.locked():
+            self.storage.save(self.data)
+            self.version = self._stored_version()
+    
+    def is_current(self) -> bool:
+        """Return True if storage has not changed since this tracker last loaded or saved."""
+        return self.version is not None and self._stored_version() == self.version
+    
+    @contextmanager
+    def _current(self):
+        """Hold the storage lock with self.data reloaded if another worker changed it."""
+        with self.lock, self.storage.locked():
+            stored = self._stored_version()
+            if stored is not None and stored != self.version:
+                self.data = self.load_data()
+            yield
+    
+    def apply(self, event: Dict, check: Optional[Callable[[Dict], bool]] = None) -> bool:
+        """
+        Apply a mutation event (see storage.apply_event) and persist it.
+        
+        The storage lock is held throughout and the data is reloaded first if
+        another worker changed it, so concurrent mutations are applied one
+        after the other instead of overwriting each other.
+        
+        Args:
+            event: Mutation event
+            check: Optional precondition, called with the up-to-date data
+                under the lock; the event is dropped if it returns False
+        
+        Returns:
+            True if the data changed
+        """
+        with self._current():
+            if check is not None and not check(self.data):
+                return False
+            # Storage persists the event as given; memory holds the compact records
+            changed = apply_event(self.data, event_records(event))
+            if changed:
+                self.storage.record(self.data, event)
+                self.version = self._stored_version()
+        return changed
+    
+    def _totals_on(self, date: str) -> Optional[Dict]:
+        if self.data.get('archive_generation'):
+            # Only reads the archive for dates it may hold
+            header = self.archive.header()
+            if header and header['first'] <= date <= header['last']:
+                return self.history_totals().get(date)
+        return self.data['daily_totals'].get(date)
+    
+    def daily_totals(self, date: Optional[str] = None) -> Dict:
+        """
+        Return {'calories', 'meals', 'items'} for a date (today by default).
+        
+        Served from the incrementally maintained index, so the cost does not
+        depend on how many meals were logged.
+        """
+        totals = self._totals_on(date or datetime.now().strftime('%Y-%m-%d'))
+        if totals is None:
+            return {'calories': 0, 'meals': 0, 'items': 0}
+        return dict(totals)
+    
+    def consumed_on(self, date: Optional[str] = None) -> float:
+        """Return total calories logged on a date (today by default)."""
+        totals = self._totals_on(date or datetime.now().strftime('%Y-%m-%d'))
+        return totals['calories'] if totals else 0
+    
+    def history_totals(self) -> Dict[str, Dict]:
+        """
+        Daily totals index covering archived days as well (reads the archive).
+        
+        Returns:
+            Date -> {'calories', 'meals', 'items'}
+        """
+        totals = self.data['daily_totals']
+        archived = self.archive.daily_totals() if self.archive is not None else {}
+        if not archived:
+            return totals
+        merged = dict(archived)
+        for date, entry in totals.items():
+            old = merged.get(date)
+            # Meals can still be logged on an archived day; they stay in the document
+            merged[date] = entry if old is None else {
+                'calories': round(old['calories'] + entry['calories'], 1),
+                'meals': old['meals'] + entry['meals'],
+                'items': old['items'] + entry['items']}
+        return merged
+    
+    def iter_history(self, start: Optional[str] = None, end: Optional[str] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Yield (date, meal) in date order, archived days included.
+        
+        Only the archived days between start and end (inclusive, both
+        optional) are read from the archive.
+        """
+        meals = self.data['meals']
+        recent = sorted(date for date in meals if not ((start and date < start) or (end and date > end)))
+        archived = self.archive.iter_days(start, end) if self.archive is not None else ()
+        i = 0
+        for date, day_meals in archived:
+            while i < len(recent) and recent[i] < date:
+                yield from ((recent[i], meal) for meal in list(meals.get(recent[i], [])))
+                i += 1
+            yield from ((date, meal) for meal in day_meals)
+            if i < len(recent) and recent[i] == date:
+                yield from ((date, meal) for meal in list(meals.get(date, [])))
+                i += 1
+        for date in recent[i:]:
+            yield from ((date, meal) for meal in list(meals.get(date, [])))
+    
+    def archivable_days(self, before: str) -> Dict[str, int]:
+        """Date -> meal count for the non-empty days archive_history(before) would move."""
+        return {date: len(meals) for date, meals in self.data['meals'].items()
+                if date < before and meals and _is_iso_date(date)}
+    
+    def archive_history(self, before: str) -> Dict:
+        """
+        Move the meals of every day before a date into the cold archive.
+        
+        The archive file is written before the document drops the days, so
+        a crash in between loses nothing (see archive.py).
+        
+        Args:
+            before: First date ('YYYY-MM-DD') to keep in the document
+        
+        Returns:
+            {'days', 'meals'} moved
+        
+        Raises:
+            ValueError: If the storage backend cannot keep an archive (SQLite)
+        """
+        if self.archive is None:
+            raise ValueError("SQLite storage reads meals by date already and has no archive")
+        with self._current():
+            moved = self.archivable_days(before)
+            if not moved:
+                return {'days': 0, 'meals': 0}
+            days = dict(self.archive.iter_days())
+            for date in moved:
+                days[date] = days.get(date, []) + self.data['meals'][date]
+            header = self.archive.header() or {'generation': 0}
+            generation = max(header['generation'], self.data.get('archive_generation', 0)) + 1
+            self.archive.write(days, generation, moved)
+            event = {'op': 'archive_days', 'generation': generation, 'days': moved}
+            apply_event(self.data, event)
+            self.storage.record(self.data, event)
+            self.version = self._stored_version()
+        return {'days': len(moved), 'meals': sum(moved.values())}
+    
+    def add_meal(self, meal_entry: Dict, date: Optional[str] = None):
+        """Append a meal to the given date (today by default) and persist it."""
+        date = date or datetime.now().strftime('%Y-%m-%d')
+        self.apply({'op': 'add_meal', 'date': date, 'meal': meal_entry})
+    
+    def add_meals(self, entries: Iterable[Tuple[str, Dict]]) -> int:
+        """
+        Append many (date, meal) pairs and persist them in a single write.
+        
+        Returns:
+            Number of meals added
+        """
+        meals = [[date, meal] for date, meal in entries]
+        self.apply({'op': 'add_meals', 'meals': meals})
+        return len(meals)
+    
+    def remove_meal(self, date: str, index: int) -> bool:
+        """Delete the meal at index on date. Returns False if there was none."""
+        return self.apply({'op': 'delete_meal', 'date': date, 'index': index})
+    
+    def set_profile(self, profile: Dict):
+        """Replace the user profile and persist it."""
+        self.apply({'op': 'set_profile', 'profile': profile})
     
     def setup_profile(self):
         """Set up user profile and calculate daily calorie target."""
@@ -338,7 +873,7 @@ class CalorieTracker:
             
             weight_to_lose = weight - ideal_weight
             
-            self.data['user_profile'] = {
+            self.set_profile({
                 'weight': weight,
                 'height': height,
                 'age': age,
@@ -350,9 +885,7 @@ class CalorieTracker:
                 'tdee': round(tdee, 1),
                 'daily_target': round(target, 1),
                 'ideal_weight_tdee': round(ideal_tdee, 1)
-            }
-            
-            self.save_data()
+            })
             
             print("\n✓ Profile saved!")
             print(f"  Current Weight: {weight} kg")
@@ -391,7 +924,7 @@ class CalorieTracker:
                 match_type = estimate['match']
                 if match_type == 'exact':
                     print(f"  ✓ {estimate['calories']} calories")
-                elif match_type == 'approximate':
+                elif match_type in ('approximate', 'fuzzy'):
                     print(f"  ~ {estimate['calories']} calories (matched to {estimate['matched_to']})")
                 else:
                     print(f"  ? {estimate['calories']} calories (generic estimate)")
@@ -404,10 +937,6 @@ class CalorieTracker:
         
         total_calories = sum(item['calories'] for item in food_items)
         
-        today = datetime.now().strftime('%Y-%m-%d')
-        if today not in self.data['meals']:
-            self.data['meals'][today] = []
-        
         meal_entry = {
             'meal_name': meal_name,
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
@@ -415,8 +944,7 @@ class CalorieTracker:
             'total_calories': round(total_calories, 1)
         }
         
-        self.data['meals'][today].append(meal_entry)
-        self.save_data()
+        self.add_meal(meal_entry)
         
         print(f"\n✓ Logged {meal_name}: {round(total_calories)} calories")
     
@@ -438,12 +966,11 @@ class CalorieTracker:
             return
         
         print("\nMeals:")
-        total_consumed = 0
         for meal in self.data['meals'][today]:
             print(f"  {meal['meal_name']} ({meal['timestamp'].split()[1]}): {round(meal['total_calories'])} cal")
             for item in meal['items']:
                 print(f"    - {item['food']} ({item['amount_g']}g): {round(item['calories'])} cal")
-            total_consumed += meal['total_calories']
+        total_consumed = self.consumed_on(today)
         
         remaining = target - total_consumed
         print(f"\nTotal Consumed: {round(total_consumed)} calories")
@@ -480,6 +1007,8 @@ class CalorieTracker:
             print("Match: Exact match in database")
         elif match_type == 'approximate':
             print(f"Match: Approximate (similar to {estimate['matched_to']})")
+        elif match_type == 'fuzzy':
+            print(f"Match: Spelling corrected to {estimate['matched_to']}")
         else:
             print("Match: Generic estimate (food not in database)")
         
@@ -487,11 +1016,7 @@ class CalorieTracker:
         if self.data.get('user_profile'):
             today = datetime.now().strftime('%Y-%m-%d')
             target = self.data['user_profile']['daily_target']
-            total_consumed = 0
-            
-            if today in self.data['meals']:
-                for meal in self.data['meals'][today]:
-                    total_consumed += meal['total_calories']
+            total_consumed = self.consumed_on(today)
             
             remaining = target - total_consumed
             print(f"\nYour remaining calories today: {round(remaining)}")
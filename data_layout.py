@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Where per-user data files live on disk.
+
+Every user's data file is named calorie_data_<user_id>.json, and its
+companion files ('.journal', '.archive', '.lock' and '.corrupt') sit next
+to it.
+A layout maps a user id to that path and lists the users present:
+
+    flat:    data/calorie_data_<user_id>.json
+    sharded: data/<h0h1>/<h2h3>/calorie_data_<user_id>.json
+
+where h0..h3 are the first hex digits of the SHA-1 of the user id.
+Two levels of 256 directories keep each directory to a few dozen files
+even with millions of users, so lookups, listings and backups stay fast.
+
+Code that needs a user's file should go through get_layout() rather than
+building the path itself.
+Existing directories are converted with migrate_layout.py.
+"""
+
+import hashlib
+import os
+from typing import Iterator, Optional, Tuple
+
+FILE_PREFIX = 'calorie_data_'
+FILE_SUFFIX = '.json'
+JOURNAL_SUFFIX = '.journal'
+LAYOUTS = ('flat', 'sharded')
+
+
+def file_name(user_id: str) -> str:
+    """Data file name (without directory) for user_id."""
+    return f'{FILE_PREFIX}{user_id}{FILE_SUFFIX}'
+
+
+def user_id_from_name(name: str) -> Optional[str]:
+    """User id for a data file name, or None if name is not a user data file."""
+    if name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX):
+        return name[len(FILE_PREFIX):-len(FILE_SUFFIX)]
+    return None
+
+
+def _scan_user_files(directory: str) -> Iterator[Tuple[str, str]]:
+    try:
+        names = {entry.name for entry in os.scandir(directory) if entry.is_file()}
+    except FileNotFoundError:
+        return
+    # A journal-mode user may have a journal but no snapshot yet
+    for name in sorted(names):
+        if name.endswith(JOURNAL_SUFFIX) and name[:-len(JOURNAL_SUFFIX)] not in names:
+            name = name[:-len(JOURNAL_SUFFIX)]
+        user_id = user_id_from_name(name)
+        if user_id is not None:
+            yield user_id, os.path.join(directory, name)
+
+
+class FlatLayout:
+    """All user files directly in data_dir."""
+
+    name = 'flat'
+
+    def __init__(self, data_dir: str = 'data'):
+        self.data_dir = data_dir
+
+    def path_for(self, user_id: str) -> str:
+        """Path of user_id's data file."""
+        return os.path.join(self.data_dir, file_name(user_id))
+
+    def iter_users(self) -> Iterator[Tuple[str, str]]:
+        """Yield (user_id, path) for every data file in the layout, in name order."""
+        return _scan_user_files(self.data_dir)
+
+
+class ShardedLayout(FlatLayout):
+    """User files spread over hashed subdirectories of data_dir."""
+
+    name = 'sharded'
+
+    def __init__(self, data_dir: str = 'data', levels: int = 2, width: int = 2):
+        """
+        Args:
+            data_dir: Root data directory
+            levels: Directory levels below data_dir
+            width: Hex digits of the hash per level (16**width directories per level)
+        """
+        super().__init__(data_dir)
+        self.levels = levels
+        self.width = width
+
+    def shard(self, user_id: str) -> str:
+        """Directory of user_id's data file, relative to data_dir."""
+        digest = hashlib.sha1(user_id.encode('utf-8')).hexdigest()
+        return os.path.join(*(digest[i * self.width:(i + 1) * self.width] for i in range(self.levels)))
+
+    def path_for(self, user_id: str) -> str:
+        return os.path.join(self.data_dir, self.shard(user_id), file_name(user_id))
+
+    def iter_users(self) -> Iterator[Tuple[str, str]]:
+        """Yield (user_id, path) for every data file in the layout, one shard at a time."""
+        def walk(directory: str, depth: int) -> Iterator[Tuple[str, str]]:
+            if depth == self.levels:
+                yield from _scan_user_files(directory)
+                return
+            try:
+                names = sorted(entry.name for entry in os.scandir(directory)
+                               if entry.is_dir() and len(entry.name) == self.width)
+            except FileNotFoundError:
+                return
+            for name in names:
+                yield from walk(os.path.join(directory, name), depth + 1)
+
+        return walk(self.data_dir, 0)
+
+
+def get_layout(name: str = 'flat', data_dir: str = 'data') -> FlatLayout:
+    """
+    Build a layout by name.
+
+    Args:
+        name: 'flat' (default) or 'sharded'
+        data_dir: Root data directory
+    """
+    if name in ('flat', '', None):
+        return FlatLayout(data_dir)
+    if name == 'sharded':
+        return ShardedLayout(data_dir)
+    raise ValueError(f"Unknown data layout: {name}")
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Food catalogue backends for FoodDatabase.
+
+A catalogue maps lowercase food names to calories per 100g and remembers the
+order entries were added in (earlier entries win partial-match ties).
+DictCatalogue wraps an in-memory dict; MmapCatalogue serves a compact,
+memory-mapped file so several worker processes share one copy of the names
+and calories through the OS page cache and nothing is parsed at startup.
+
+With a dict, the partial, fuzzy and completion indexes (food_index.py) are
+built per process on the first lookup that needs them. A catalogue file
+stores them too, as flat arrays that are read in place, so they are shared
+as well (see benchmarks/bench_catalogue_memory.py).
+
+Build a catalogue file from JSON ({"name": kcal, ...}) or CSV (name,kcal):
+
+    python3 food_catalogue.py foods.csv foods.fcat
+"""
+
+import csv
+import json
+import marshal
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from food_index import FoodIndex, FuzzyIndex, PrefixIndex
+
+
+class FoodCatalogue:
+    """Interface shared by all catalogue backends."""
+
+    def get(self, name: str) -> Optional[float]:
+        """Return calories per 100g for an exact (lowercase) name, or None."""
+        raise NotImplementedError
+
+    def names(self) -> Iterator[str]:
+        """Iterate food names in catalogue order."""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def version(self) -> Hashable:
+        """
+        Token that changes whenever names or calories change.
+
+        FoodDatabase drops its indexes and cached matches when it does.
+        Backends that cannot tell fall back to the number of names.
+        """
+        return len(self)
+
+    def food_index(self) -> Optional[FoodIndex]:
+        """Partial-match index stored with the catalogue, or None to build one in memory."""
+        return None
+
+    def fuzzy_index(self) -> Optional[FuzzyIndex]:
+        """Misspelling index stored with the catalogue, or None to build one in memory."""
+        return None
+
+    def prefix_index(self, aliases: Dict[str, str]) -> Optional[PrefixIndex]:
+        """Completion index over the catalogue and aliases stored with it, or None to build one in memory."""
+        return None
+
+
+class DictCatalogue(FoodCatalogue):
+    """
+    Catalogue backed by a plain dict (e.g. FoodDatabase.FOOD_CALORIES).
+
+    Edit it through set() and remove() so cached matches follow; changes
+    made to the dict directly are only noticed when they change its size.
+    """
+
+    def __init__(self, foods: Dict[str, float]):
+        self.foods = foods
+        self._edits = 0
+
+    def get(self, name: str) -> Optional[float]:
+        return self.foods.get(name)
+
+    def names(self) -> Iterator[str]:
+        return iter(self.foods)
+
+    def __len__(self) -> int:
+        return len(self.foods)
+
+    def version(self) -> Hashable:
+        return len(self.foods), self._edits
+
+    def set(self, name: str, calories: float):
+        """Add a food or change its calories per 100g."""
+        self.foods[name] = calories
+        self._edits += 1
+
+    def remove(self, name: str):
+        """Remove a food (KeyError if it is not in the catalogue)."""
+        del self.foods[name]
+        self._edits += 1
+
+
+class StringTable:
+    """
+    Read-only strings stored as concatenated UTF-8 plus offsets.
+
+    Supports len(), indexing (so bisect works when the strings are sorted)
+    and, given a hash table, find() by value in constant time.
+    """
+
+    def __init__(self, data: memoryview, offsets: memoryview, slots: Optional[memoryview] = None):
+        self.data = data
+        self.offsets = offsets
+        self.slots = slots
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def find(self, value: str) -> int:
+        """Position of value, or -1."""
+        key = value.encode('utf-8')
+        slots, data, offsets = self.slots, self.data, self.offsets
+        mask = len(slots) - 1
+        slot = zlib.crc32(key) & mask
+        while True:
+            entry = slots[slot]
+            if entry == 0:
+                return -1
+            if data[offsets[entry - 1]:offsets[entry]] == key:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+
+class RankedNames:
+    """
+    Catalogue names by rank, over the catalogue's sorted string table.
+
+    Indexing by rank gives the name, like the names list of an index built
+    in memory, and get()/`in` map a name back to its rank, like its ranks dict.
+    """
+
+    def __init__(self, table: StringTable, order: memoryview, rank_of: memoryview):
+        self.table = table
+        self.order = order
+        self.rank_of = rank_of
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __getitem__(self, rank: int) -> str:
+        return self.table[self.order[rank]]
+
+    def get(self, name: str, default: Optional[int] = None) -> Optional[int]:
+        # StringTable.find inlined: FoodIndex.contained_in probes every substring of a query
+        key = name.encode('utf-8')
+        table = self.table
+        slots, data, offsets = table.slots, table.data, table.offsets
+        mask = len(slots) - 1
+        slot = zlib.crc32(key) & mask
+        while True:
+            entry = slots[slot]
+            if entry == 0:
+                return default
+            if data[offsets[entry - 1]:offsets[entry]] == key:
+                return self.rank_of[entry - 1]
+            slot = (slot + 1) & mask
+
+    def __contains__(self, name: str) -> bool:
+        return self.table.find(name) >= 0
+
+
+class Postings:
+    """Mapped key -> ascending ranks table, read like a dict of arrays with get()."""
+
+    def __init__(self, keys: StringTable, starts: memoryview, ranks: memoryview):
+        self.keys = keys
+        self.starts = starts
+        self.ranks = ranks
+
+    def get(self, key: str, default=None):
+        position = self.keys.find(key)
+        if position < 0:
+            return default
+        return self.ranks[self.starts[position]:self.starts[position + 1]]
+
+
+class MmapCatalogue(FoodCatalogue):
+    """
+    Read-only catalogue served from a memory-mapped file.
+
+    File layout (native byte order):
+        header    12 bytes: magic, version, byte order, table of contents size
+        contents  marshal: {'meta': {...}, 'sections': {name: (offset, size, typecode)}}
+        sections  array.array columns, each starting on an 8-byte boundary
+
+    Sections, by prefix:
+        name_*     the string table of names (sorted bytewise), with a hash
+                   table for exact lookups; calories, rank_of (sorted position
+                   -> catalogue rank) and order (the inverse) go with it
+        lengths    distinct name lengths, for FoodIndex
+        gram_*     FoodIndex n-gram postings
+        variant_*  FuzzyIndex delete-variant postings
+        term_*     PrefixIndex terms, keys and range-minimum tree
+
+    A string table is '<prefix>_strings' (UTF-8), '<prefix>_offsets' and,
+    for exact lookups, '<prefix>_slots': an open-addressing table (at most
+    a quarter full) of position + 1 keyed on the CRC-32 of the UTF-8 string.
+
+    Everything a lookup reads, the search indexes included, is read from the
+    mapping in place, so worker processes share one copy through the page
+    cache; nothing is parsed at startup.
+    """
+
+    MAGIC = b'FCAT'
+    VERSION = 3
+    HEADER = struct.Struct('<4sBBxxI')
+    ALIGN = 8
+    MARSHAL_VERSION = 4
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            stat = os.fstat(f.fileno())
+        # write_catalogue replaces files rather than rewriting them, so the mapped contents never change
+        self._version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        magic, version, little_endian, contents_size = self.HEADER.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC:
+            raise ValueError(f"{path} is not a food catalogue file")
+        if version != self.VERSION:
+            raise ValueError(f"{path} is in an older catalogue format; rebuild it with food_catalogue.py")
+        if bool(little_endian) != (sys.byteorder == 'little'):
+            raise ValueError(f"{path} was built on a machine with a different byte order")
+
+        pos = self.HEADER.size
+        contents = marshal.loads(self._mmap[pos:pos + contents_size])
+        self.meta: Dict = contents['meta']
+        view = memoryview(self._mmap)
+        self._views = [view[offset:offset + size].cast(code)
+                       for offset, size, code in contents['sections'].values()]
+        self._sections: Dict[str, memoryview] = dict(zip(contents['sections'], self._views))
+        self._views.append(view)
+
+        self._names = self._table('name', hashed=True)
+        self._calories = self._sections['calories']
+        self._ranked = RankedNames(self._names, self._sections['order'], self._sections['rank_of'])
+        self._indexes: Dict[str, object] = {}
+
+    def _table(self, prefix: str, hashed: bool = False) -> StringTable:
+        sections = self._sections
+        return StringTable(sections[f'{prefix}_strings'], sections[f'{prefix}_offsets'],
+                           sections[f'{prefix}_slots'] if hashed else None)
+
+    def get(self, name: str) -> Optional[float]:
+        i = self._names.find(name)
+        return self._calories[i] if i >= 0 else None
+
+    def names(self) -> Iterator[str]:
+        names = self._names
+        for i in self._sections['order']:
+            yield names[i]
+
+    def __len__(self) -> int:
+        return len(self._calories)
+
+    def version(self) -> Hashable:
+        return self._version
+
+    def food_index(self) -> FoodIndex:
+        index = self._indexes.get('food')
+        if index is None:
+            postings = Postings(self._table('gram', hashed=True), self._sections['gram_starts'],
+                                self._sections['gram_ranks'])
+            index = self._indexes['food'] = FoodIndex.from_tables(self._ranked, self._ranked,
+                                                                  self._sections['lengths'], postings)
+        return index
+
+    def fuzzy_index(self) -> FuzzyIndex:
+        index = self._indexes.get('fuzzy')
+        if index is None:
+            variants = Postings(self._table('variant', hashed=True), self._sections['variant_starts'],
+                                self._sections['variant_ranks'])
+            index = self._indexes['fuzzy'] = FuzzyIndex.from_tables(self._ranked, variants,
+                                                                    self.meta['max_distance'])
+        return index
+
+    def prefix_index(self, aliases: Dict[str, str]) -> Optional[PrefixIndex]:
+        if aliases != self.meta['aliases']:
+            return None  # the file was built with other aliases
+        index = self._indexes.get('prefix')
+        if index is None:
+            indexed: Dict[int, List[str]] = {}
+            for alias, target in aliases.items():
+                rank = self._ranked.get(target)
+                if rank is not None and alias not in self._ranked:
+                    indexed.setdefault(rank, []).append(alias)
+            index = self._indexes['prefix'] = PrefixIndex.from_tables(
+                self._ranked, self._table('term'), self._sections['term_keys'], self._sections['term_tree'], indexed)
+        return index
+
+    def close(self):
+        """Release the memory mapping (indexes taken from this catalogue must no longer be used)."""
+        self._indexes.clear()
+        for view in self._views:
+            view.release()
+        self._mmap.close()
+
+
+def _string_sections(prefix: str, encoded: List[bytes], hashed: bool = False) -> Dict[str, array]:
+    """Sections for a string table of already-ordered UTF-8 strings."""
+    offsets = array('I', [0])
+    total = 0
+    for value in encoded:
+        total += len(value)
+        offsets.append(total)
+    sections = {f'{prefix}_strings': array('B', b''.join(encoded)), f'{prefix}_offsets': offsets}
+    if hashed:
+        size = 1
+        while size < 4 * len(encoded):
+            size *= 2
+        slots = array('I', bytes(4 * size))
+        mask = size - 1
+        for position, value in enumerate(encoded):
+            slot = zlib.crc32(value) & mask
+            while slots[slot]:
+                slot = (slot + 1) & mask
+            slots[slot] = position + 1
+        sections[f'{prefix}_slots'] = slots
+    return sections
+
+
+def _posting_sections(prefix: str, postings: Dict[str, array]) -> Dict[str, array]:
+    """Sections for a key -> ranks table: a hashed string table of keys, starts and the ranks."""
+    keys = sorted(key.encode('utf-8') for key in postings)
+    sections = _string_sections(prefix, keys, hashed=True)
+    starts = array('I', [0])
+    ranks = array('i')
+    for key in keys:
+        ranks.extend(postings[key.decode('utf-8')])
+        starts.append(len(ranks))
+    sections[f'{prefix}_starts'] = starts
+    sections[f'{prefix}_ranks'] = ranks
+    return sections
+
+
+def write_catalogue(path: str, foods: Iterable[Tuple[str, float]], aliases: Optional[Dict[str, str]] = None):
+    """
+    Write a catalogue file readable by MmapCatalogue, search indexes included.
+
+    Names are lowercased and stripped. As with a dict literal, a repeated name
+    keeps its first position and its last value.
+
+    Args:
+        path: Destination file
+        foods: (name, calories per 100g) pairs in catalogue order
+        aliases: Alternative name -> catalogue name for completions; the
+            stored completion index is only used with the same aliases
+            (FoodDatabase.FOOD_ALIASES for the app)
+    """
+    entries: Dict[str, float] = {}
+    for name, calories in foods:
+        entries[name.lower().strip()] = float(calories)
+    names = list(entries)
+    aliases = dict(aliases or {})
+
+    encoded = [name.encode('utf-8') for name in names]
+    rank_of = array('I', sorted(range(len(encoded)), key=encoded.__getitem__))
+    order = array('I', bytes(4 * len(encoded)))
+    for position, rank in enumerate(rank_of):
+        order[rank] = position
+    values = list(entries.values())
+
+    sections = _string_sections('name', [encoded[rank] for rank in rank_of], hashed=True)
+    sections['calories'] = array('d', (values[rank] for rank in rank_of))
+    sections['rank_of'] = rank_of
+    sections['order'] = order
+
+    food = FoodIndex(names)
+    sections['lengths'] = array('I', food.lengths)
+    sections.update(_posting_sections('gram', food.postings))
+    del food
+    fuzzy = FuzzyIndex(names)
+    sections.update(_posting_sections('variant', fuzzy.variants))
+    del fuzzy
+    prefix = PrefixIndex(names, aliases)
+    sections.update(_string_sections('term', [term.encode('utf-8') for term in prefix.terms]))
+    sections['term_keys'] = prefix.keys
+    sections['term_tree'] = prefix.tree
+    del prefix
+
+    # Section offsets depend on the size of the contents that list them: repeat until it settles
+    meta = {'max_distance': FuzzyIndex.MAX_DISTANCE, 'aliases': aliases}
+    contents = b''
+    while True:
+        pos = MmapCatalogue.HEADER.size + len(contents)
+        table = {}
+        for name, column in sections.items():
+            pos += -pos % MmapCatalogue.ALIGN
+            size = len(column) * column.itemsize
+            table[name] = (pos, size, column.typecode)
+            pos += size
+        previous, contents = contents, marshal.dumps({'meta': meta, 'sections': table}, MmapCatalogue.MARSHAL_VERSION)
+        if len(contents) == len(previous):
+            break
+
+    header = MmapCatalogue.HEADER.pack(MmapCatalogue.MAGIC, MmapCatalogue.VERSION,
+                                       sys.byteorder == 'little', len(contents))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(contents)
+        for name, column in sections.items():
+            f.write(bytes(table[name][0] - f.tell()))
+            column.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def read_source(path: str) -> Iterator[Tuple[str, float]]:
+    """Read (name, calories) pairs from a JSON object or a two-column CSV file."""
+    if path.endswith('.json'):
+        with open(path, 'r') as f:
+            yield from json.load(f).items()
+        return
+
+    with open(path, 'r', newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            try:
+                yield row[0], float(row[1])
+            except ValueError:
+                continue  # header or malformed row
+
+
+def main():
+    """Convert a JSON/CSV food list into a catalogue file."""
+    if len(sys.argv) != 3:
+        print("Usage: python3 food_catalogue.py <foods.json|foods.csv> <output.fcat>")
+        sys.exit(1)
+    from calories_app import FoodDatabase
+    write_catalogue(sys.argv[2], read_source(sys.argv[1]), FoodDatabase.FOOD_ALIASES)
+    print(f"✓ Wrote {len(MmapCatalogue(sys.argv[2]))} foods to {sys.argv[2]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+Prebuilt lookup indexes for food names.
+FoodIndex answers the partial-match queries used by
+FoodDatabase.estimate_calories without scanning every catalogue entry,
+FuzzyIndex finds misspelled names and PrefixIndex answers typeahead
+completions.
+
+Each index is built from a list of names, or wraps tables built earlier
+(from_tables): MmapCatalogue stores them in the catalogue file so that
+worker processes share one copy instead of building their own.
+"""
+
+import heapq
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from caching import LRUCache
+
+
+class FoodIndex:
+    """
+    Index over food names kept in catalogue (priority) order.
+
+    A partial match is a name that is contained in the query or that contains
+    the query. When several names qualify, the one that comes first in the
+    catalogue wins, which is the same tie-breaking as a linear scan.
+    """
+
+    # Longest n-gram stored in the inverted index
+    MAX_GRAM = 3
+
+    def __init__(self, names: Iterable[str]):
+        """
+        Build the index.
+
+        Args:
+            names: Lowercase food names in catalogue order
+        """
+        self.names: Sequence[str] = []
+        self.ranks: Mapping[str, int] = {}
+        name_lengths = set()
+        grams: Dict[str, List[int]] = {}
+
+        for name in names:
+            if name in self.ranks:
+                continue
+            rank = len(self.names)
+            self.names.append(name)
+            self.ranks[name] = rank
+            name_lengths.add(len(name))
+            for gram in self._grams(name):
+                grams.setdefault(gram, []).append(rank)
+
+        # Ranks are appended in increasing order, so every posting list is sorted
+        self.postings: Mapping[str, Sequence[int]] = {gram: array('i', ranks) for gram, ranks in grams.items()}
+        self.lengths: Sequence[int] = sorted(name_lengths)
+
+    @classmethod
+    def from_tables(cls, names: Sequence[str], ranks: Mapping[str, int], lengths: Sequence[int],
+                    postings: Mapping[str, Sequence[int]]) -> 'FoodIndex':
+        """
+        Wrap prebuilt tables without copying them.
+
+        Args:
+            names: Name of each rank
+            ranks: Name -> rank (needs get() and `in`)
+            lengths: Distinct name lengths, ascending
+            postings: N-gram -> ascending ranks of the names containing it (needs get())
+        """
+        index = cls.__new__(cls)
+        index.names, index.ranks, index.lengths, index.postings = names, ranks, lengths, postings
+        return index
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def _grams(cls, text: str) -> set:
+        """Return the distinct 1- to MAX_GRAM-character substrings of text."""
+        found = set()
+        for size in range(1, cls.MAX_GRAM + 1):
+            for start in range(len(text) - size + 1):
+                found.add(text[start:start + size])
+        return found
+
+    def exact(self, query: str) -> Optional[str]:
+        """Return query if it is a catalogue name, otherwise None."""
+        return query if query in self.ranks else None
+
+    def contained_in(self, query: str) -> Optional[int]:
+        """
+        Find the best-ranked name that is a substring of query.
+
+        Only substrings whose length matches some catalogue name are probed,
+        so the cost depends on the query length rather than the catalogue size.
+
+        Returns:
+            Rank of the matching name, or None
+        """
+        best = None
+        ranks = self.ranks
+        query_len = len(query)
+        for size in self.lengths:
+            if size > query_len:
+                break
+            for start in range(query_len - size + 1):
+                rank = ranks.get(query[start:start + size])
+                if rank is not None and (best is None or rank < best):
+                    best = rank
+                    if best == 0:
+                        return best
+        return best
+
+    def containing(self, query: str, limit: Optional[int] = None) -> Optional[int]:
+        """
+        Find the best-ranked name that contains query as a substring.
+
+        Candidates come from the rarest n-gram of the query and are verified
+        in rank order, stopping at the first hit.
+
+        Args:
+            query: Lowercase search string
+            limit: Only consider ranks below this value
+
+        Returns:
+            Rank of the matching name, or None
+        """
+        if not query:
+            return 0 if self.names and (limit is None or limit > 0) else None
+
+        size = min(len(query), self.MAX_GRAM)
+        candidates = None
+        for start in range(len(query) - size + 1):
+            posting = self.postings.get(query[start:start + size])
+            if posting is None:
+                return None
+            if candidates is None or len(posting) < len(candidates):
+                candidates = posting
+
+        names = self.names
+        for rank in candidates:
+            if limit is not None and rank >= limit:
+                break
+            if query in names[rank]:
+                return rank
+        return None
+
+    def partial(self, query: str) -> Optional[str]:
+        """
+        Find the name a linear partial-match scan would return.
+
+        Args:
+            query: Lowercase, stripped food name
+
+        Returns:
+            Matching catalogue name, or None
+        """
+        best = self.contained_in(query)
+        other = self.containing(query, limit=best)
+        if other is not None:
+            best = other
+        return None if best is None else self.names[best]
+
+
+def edit_distance(a: str, b: str, bound: int) -> int:
+    """
+    Levenshtein distance between a and b, or bound + 1 if it exceeds bound.
+
+    Rows are abandoned as soon as every entry exceeds bound.
+    """
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        if min(current) > bound:
+            return bound + 1
+        previous = current
+    return min(previous[-1], bound + 1)
+
+
+class FuzzyIndex:
+    """
+    Symmetric-delete index for names within a small edit distance.
+
+    Every name is stored under each string obtained by deleting up to
+    max_distance characters from its first PREFIX_LENGTH characters. Two
+    strings within Levenshtein distance d become equal after at most d
+    deletions on each side, and so do their prefixes, so the query's own
+    delete variants look up every candidate directly; candidates are then
+    confirmed with a bounded edit distance over the whole name. Indexing
+    prefixes only keeps the number of variants per name fixed however long
+    the name is.
+
+    Short queries are held to a smaller distance: one edit turns many
+    four-letter words into other foods ('beer' -> 'beef'), so queries need
+    MIN_QUERY characters to be corrected at all and LONG_QUERY for two edits.
+    """
+
+    MAX_DISTANCE = 2
+    PREFIX_LENGTH = 7
+    # Queries shorter than this are not fuzzy-matched; shorter than LONG_QUERY allow one edit
+    MIN_QUERY = 5
+    LONG_QUERY = 8
+
+    def __init__(self, names: Iterable[str], max_distance: int = MAX_DISTANCE):
+        """
+        Build the index.
+
+        Args:
+            names: Lowercase food names in catalogue order
+            max_distance: Largest edit distance that can be matched
+        """
+        self.max_distance = max_distance
+        self.names: Sequence[str] = []
+        seen = set()
+        variants: Dict[str, List[int]] = {}
+        for name in names:
+            if name in seen:
+                continue
+            seen.add(name)
+            rank = len(self.names)
+            self.names.append(name)
+            for variant in self._deletes(name[:self.PREFIX_LENGTH], max_distance):
+                variants.setdefault(variant, []).append(rank)
+        self.variants: Mapping[str, Sequence[int]] = {variant: array('i', ranks)
+                                                      for variant, ranks in variants.items()}
+
+    @classmethod
+    def from_tables(cls, names: Sequence[str], variants: Mapping[str, Sequence[int]],
+                    max_distance: int = MAX_DISTANCE) -> 'FuzzyIndex':
+        """
+        Wrap prebuilt tables without copying them.
+
+        Args:
+            names: Name of each rank
+            variants: Delete variant -> ascending ranks (needs get())
+            max_distance: Distance the variants were built for
+        """
+        index = cls.__new__(cls)
+        index.names, index.variants, index.max_distance = names, variants, max_distance
+        return index
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @staticmethod
+    def _deletes(text: str, distance: int) -> set:
+        """Return text and every string made by deleting up to distance characters."""
+        found = {text}
+        frontier = {text}
+        for _ in range(distance):
+            frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+            found |= frontier
+        return found
+
+    def allowed_distance(self, query: str) -> int:
+        """Edit distance permitted for a query of this length."""
+        if len(query) < self.MIN_QUERY:
+            return 0
+        if len(query) < self.LONG_QUERY:
+            return min(1, self.max_distance)
+        return self.max_distance
+
+    def search(self, query: str) -> Optional[Tuple[str, int]]:
+        """
+        Find the closest name to query.
+
+        Ties on distance go to the name that comes first in the catalogue.
+
+        Args:
+            query: Lowercase, stripped food name
+
+        Returns:
+            Tuple of (name, edit distance), or None if nothing is close enough
+        """
+        bound = self.allowed_distance(query)
+        if bound == 0:
+            return None
+        candidates = set()
+        for variant in self._deletes(query[:self.PREFIX_LENGTH], bound):
+            ranks = self.variants.get(variant)
+            if ranks is not None:
+                candidates.update(ranks)
+
+        best = None
+        for rank in sorted(candidates):
+            distance = edit_distance(query, self.names[rank], bound)
+            if distance <= bound:
+                best = (self.names[rank], distance)
+                if distance == 0:
+                    break
+                bound = distance - 1  # later names must be strictly closer
+        return best
+
+
+class PrefixIndex:
+    """
+    Sorted-array index for prefix completion of food names.
+
+    Every name is indexed under its full text and under each later word
+    ("breast" finds "chicken breast"); aliases are indexed under their own
+    text and complete to the catalogue name they stand for. A query is two
+    binary searches for the range of terms starting with it, then the best
+    entries of that range by (kind, catalogue rank): whole-name matches come
+    before alias matches, which come before later-word matches.
+
+    The best entries are taken from a segment tree of range minimums over
+    the keys: each result costs one O(log n) query, however many terms the
+    prefix covers. Results for short prefixes are also cached.
+    """
+
+    NAME, ALIAS, WORD = range(3)
+
+    # Queries up to this many characters are cached
+    SHORT_PREFIX = 3
+
+    def __init__(self, names: Iterable[str], aliases: Optional[Dict[str, str]] = None,
+                 cache_size: int = 4096):
+        """
+        Build the index.
+
+        Args:
+            names: Lowercase food names in catalogue order
+            aliases: Alternative name -> catalogue name (unknown targets are ignored)
+            cache_size: Number of short-prefix results to cache
+        """
+        self.names: Sequence[str] = []
+        ranks: Dict[str, int] = {}
+        entries: List[Tuple[str, int, int]] = []
+        for name in names:
+            if name in ranks:
+                continue
+            rank = ranks[name] = len(self.names)
+            self.names.append(name)
+            entries.append((name, self.NAME, rank))
+            position = name.find(' ')
+            while position != -1:
+                entries.append((name[position + 1:], self.WORD, rank))
+                position = name.find(' ', position + 1)
+
+        self.aliases: Dict[int, List[str]] = {}
+        for alias, target in (aliases or {}).items():
+            rank = ranks.get(target)
+            if rank is not None and alias not in ranks:
+                entries.append((alias, self.ALIAS, rank))
+                self.aliases.setdefault(rank, []).append(alias)
+
+        entries.sort()
+        count = len(self.names)
+        self.terms: Sequence[str] = [term for term, _, _ in entries]
+        # kind * count + rank, so smaller keys are better suggestions
+        self.keys: Sequence[int] = array('q', (kind * count + rank for _, kind, rank in entries))
+        self.tree: Sequence[int] = self._min_tree(self.keys)
+        self.cache = LRUCache(cache_size)
+
+    @classmethod
+    def from_tables(cls, names: Sequence[str], terms: Sequence[str], keys: Sequence[int], tree: Sequence[int],
+                    aliases: Dict[int, List[str]], cache_size: int = 4096) -> 'PrefixIndex':
+        """
+        Wrap prebuilt tables without copying them.
+
+        Args:
+            names: Name of each rank
+            terms: Sorted indexed terms
+            keys: kind * len(names) + rank for each term
+            tree: Range-minimum tree over keys (see _min_tree)
+            aliases: Rank -> aliases indexed for it
+            cache_size: Number of short-prefix results to cache
+        """
+        index = cls.__new__(cls)
+        index.names, index.terms, index.keys, index.tree, index.aliases = names, terms, keys, tree, aliases
+        index.cache = LRUCache(cache_size)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @staticmethod
+    def _min_tree(keys: array) -> array:
+        """Bottom-up segment tree: tree[n + i] = i, tree[p] = position of the smaller key below p."""
+        n = len(keys)
+        tree = array('i', range(-n, n))  # the first half is overwritten
+        for p in range(n - 1, 0, -1):
+            left, right = tree[2 * p], tree[2 * p + 1]
+            tree[p] = left if keys[left] <= keys[right] else right
+        return tree
+
+    def _range_min(self, lo: int, hi: int) -> int:
+        """Position of the smallest key in keys[lo:hi] (lo < hi)."""
+        keys, tree, n = self.keys, self.tree, len(self.keys)
+        best = -1
+        lo += n
+        hi += n
+        while lo < hi:
+            if lo & 1:
+                if best < 0 or keys[tree[lo]] < keys[best]:
+                    best = tree[lo]
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                if best < 0 or keys[tree[hi]] < keys[best]:
+                    best = tree[hi]
+            lo >>= 1
+            hi >>= 1
+        return best
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Lowercase and collapse whitespace the way catalogue names are written."""
+        return ' '.join(query.lower().split())
+
+    def complete(self, query: str, limit: int = 10) -> List[Tuple[str, Optional[str]]]:
+        """
+        Return up to limit completions of query, best first.
+
+        Args:
+            query: Prefix typed by the user
+            limit: Maximum number of results
+
+        Returns:
+            List of (catalogue name, alias that matched or None)
+        """
+        query = self.normalize(query)
+        if not query or limit <= 0:
+            return []
+        short = len(query) <= self.SHORT_PREFIX
+        if short:
+            cached = self.cache.get((query, limit))
+            if cached is not None:
+                return cached
+
+        lo = bisect_left(self.terms, query)
+        hi = bisect_left(self.terms, query[:-1] + chr(ord(query[-1]) + 1), lo)
+
+        # Best-first over sub-ranges: pop the smallest key, then split its range around it
+        keys = self.keys
+        ranges = []
+
+        def push(start: int, stop: int):
+            if start < stop:
+                position = self._range_min(start, stop)
+                heapq.heappush(ranges, (keys[position], position, start, stop))
+
+        push(lo, hi)
+        count = len(self.names)
+        results = []
+        seen = set()
+        while ranges and len(results) < limit:
+            key, position, start, stop = heapq.heappop(ranges)
+            push(start, position)
+            push(position + 1, stop)
+            kind, rank = divmod(key, count)
+            if rank in seen:
+                continue
+            seen.add(rank)
+            alias = None
+            if kind == self.ALIAS:
+                alias = next(a for a in self.aliases[rank] if a.startswith(query))
+            results.append((self.names[rank], alias))
+
+        if short:
+            self.cache.put((query, limit), results)
+        return results
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Bulk meal import and export.
+
+Usage:
+    python3 meal_io.py import <data_file> <meals.csv|meals.jsonl>
+    python3 meal_io.py export <data_file> <meals.csv|meals.jsonl>
+
+Import files are read a line at a time. CSV files have one row per food
+item with the columns date, meal_name, food, amount and optionally unit
+(default g) and time (HH:MM[:SS]); consecutive rows with the same date,
+meal_name and time form one meal. JSONL files have one meal per line:
+
+    {"date": "2024-01-31", "meal_name": "Lunch", "time": "12:30",
+     "items": [{"food": "rice", "amount": 1, "unit": "bowl"}]}
+
+Foods are resolved through FoodDatabase.estimate_calories in batches and
+every imported meal is committed to the tracker in one write. Rows that
+cannot be parsed are skipped and reported.
+
+Exports are written meal by meal in the same formats, so an export can be
+imported again.
+"""
+
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from calories_app import CalorieTracker, FoodDatabase
+from models import to_dict
+
+FORMATS = ('csv', 'jsonl')
+CSV_FIELDS = ['date', 'time', 'meal_name', 'food', 'amount', 'unit', 'calories', 'match']
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 50
+
+
+def detect_format(path: str) -> str:
+    """Pick 'csv' or 'jsonl' from a file name."""
+    if path.lower().endswith('.csv'):
+        return 'csv'
+    if path.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    raise ValueError(f"Cannot tell the format of {path}; expected .csv or .jsonl")
+
+
+def _normalize_time(value: Optional[str]) -> str:
+    """Return HH:MM:SS for 'HH:MM', 'HH:MM:SS' or a full timestamp (00:00:00 if empty)."""
+    value = (value or '').strip()
+    if not value:
+        return '00:00:00'
+    value = value.split()[-1]
+    for fmt in ('%H:%M:%S', '%H:%M'):
+        try:
+            return datetime.strptime(value, fmt).strftime('%H:%M:%S')
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid time: {value}")
+
+
+def _check_date(value: Optional[str]) -> str:
+    value = (value or '').strip()
+    datetime.strptime(value, '%Y-%m-%d')
+    return value
+
+
+def read_csv(f: TextIO) -> Iterator[Tuple[int, Dict]]:
+    """
+    Yield (line number, raw meal) from a CSV file, grouping consecutive item rows.
+
+    A row that cannot be parsed is yielded as (line number, ValueError).
+    """
+    reader = csv.DictReader(f)
+    missing = {'date', 'meal_name', 'food', 'amount'} - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+
+    current = None
+    current_line = 0
+    for row in reader:
+        line = reader.line_num
+        try:
+            key = (_check_date(row['date']), (row['meal_name'] or '').strip() or 'Meal',
+                   _normalize_time(row.get('time')))
+            food = (row['food'] or '').strip()
+            if not food:
+                raise ValueError("Missing food")
+            item = {'food': food, 'amount': row['amount'], 'unit': (row.get('unit') or 'g').strip()}
+        except ValueError as e:
+            yield line, e
+            continue
+
+        if current is not None and current[0] == key:
+            current[1]['items'].append(item)
+            continue
+        if current is not None:
+            yield current_line, current[1]
+        date, meal_name, time = key
+        current = (key, {'date': date, 'meal_name': meal_name, 'time': time, 'items': [item]})
+        current_line = line
+    if current is not None:
+        yield current_line, current[1]
+
+
+def read_jsonl(f: TextIO) -> Iterator[Tuple[int, Dict]]:
+    """
+    Yield (line number, raw meal) from a JSON Lines file.
+
+    Lines written by export_meals (items with amount_g instead of amount and
+    unit) are accepted too. A line that cannot be parsed is yielded as
+    (line number, ValueError).
+    """
+    for line_num, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict) or not isinstance(record.get('items'), list):
+                raise ValueError("Expected an object with an items list")
+            time = record.get('time') or record.get('timestamp')
+            items = []
+            for item in record['items']:
+                if 'amount' in item:
+                    items.append({'food': str(item['food']), 'amount': item['amount'], 'unit': item.get('unit', 'g')})
+                else:
+                    items.append({'food': str(item['food']), 'amount': item['amount_g'], 'unit': 'g'})
+            meal = {
+                'date': _check_date(record.get('date')),
+                'meal_name': str(record.get('meal_name') or 'Meal'),
+                'time': _normalize_time(time),
+                'items': items
+            }
+        except (ValueError, KeyError, TypeError) as e:
+            yield line_num, ValueError(str(e))
+            continue
+        yield line_num, meal
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+def _resolve_batch(batch: List[Dict]) -> List[Tuple[str, Dict]]:
+    """Estimate every item in a batch of raw meals, computing repeated items once."""
+    estimates: Dict[tuple, Dict] = {}
+    resolved = []
+    for raw in batch:
+        items = []
+        for item in raw['items']:
+            key = (item['food'], str(item['amount']), item['unit'])
+            estimate = estimates.get(key)
+            if estimate is None:
+                amount_g = FoodDatabase.parse_amount(item['amount'], item['unit'])
+                estimate = FoodDatabase.estimate_calories(item['food'], amount_g, f"{item['amount']} {item['unit']}")
+                estimates[key] = estimate
+            items.append(dict(estimate))
+        meal = {
+            'meal_name': raw['meal_name'],
+            'timestamp': f"{raw['date']} {raw['time']}",
+            'items': items,
+            'total_calories': round(sum(item['calories'] for item in items), 1)
+        }
+        resolved.append((raw['date'], meal))
+    return resolved
+
+
+def import_meals(tracker: CalorieTracker, f: TextIO, fmt: str, batch_size: int = BATCH_SIZE) -> Dict:
+    """
+    Import meals from an open CSV or JSONL file into tracker with a single write.
+
+    Args:
+        tracker: Tracker to add the meals to
+        f: Text file opened for reading
+        fmt: 'csv' or 'jsonl'
+        batch_size: Meals resolved per batch
+
+    Returns:
+        Dictionary with the number of meals and items imported, the number of
+        rows skipped and (up to MAX_REPORTED_ERRORS) their errors
+    """
+    if fmt not in READERS:
+        raise ValueError(f"Unknown format: {fmt}")
+
+    resolved: List[Tuple[str, Dict]] = []
+    batch: List[Dict] = []
+    errors = []
+    skipped = 0
+    for line, raw in READERS[fmt](f):
+        if isinstance(raw, ValueError):
+            skipped += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'line': line, 'error': str(raw)})
+            continue
+        batch.append(raw)
+        if len(batch) >= batch_size:
+            resolved.extend(_resolve_batch(batch))
+            batch = []
+    resolved.extend(_resolve_batch(batch))
+
+    if resolved:
+        tracker.add_meals(resolved)
+    return {
+        'meals': len(resolved),
+        'items': sum(len(meal['items']) for _, meal in resolved),
+        'skipped': skipped,
+        'errors': errors
+    }
+
+
+def iter_meals(tracker: CalorieTracker, start: Optional[str] = None,
+               end: Optional[str] = None) -> Iterator[Tuple[str, Dict]]:
+    """Yield (date, meal) in date order, archived days included, optionally limited to start..end inclusive."""
+    return tracker.iter_history(start, end)
+
+
+def iter_export(tracker: CalorieTracker, fmt: str, start: Optional[str] = None,
+                end: Optional[str] = None) -> Iterator[str]:
+    """Yield the export file in chunks of text (one meal per chunk, after a CSV header)."""
+    if fmt == 'jsonl':
+        for date, meal in iter_meals(tracker, start, end):
+            yield json.dumps(dict(to_dict(meal), date=date)) + '\n'
+        return
+    if fmt != 'csv':
+        raise ValueError(f"Unknown format: {fmt}")
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for date, meal in iter_meals(tracker, start, end):
+        time = meal.get('timestamp', '').split(' ')[-1]
+        for item in meal['items']:
+            writer.writerow({
+                'date': date,
+                'time': time,
+                'meal_name': meal['meal_name'],
+                'food': item['food'],
+                'amount': item['amount_g'],
+                'unit': 'g',
+                'calories': item['calories'],
+                'match': item['match']
+            })
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_meals(tracker: CalorieTracker, f: TextIO, fmt: str, start: Optional[str] = None,
+                 end: Optional[str] = None):
+    """Write the tracker's meals to an open text file as CSV or JSONL."""
+    for chunk in iter_export(tracker, fmt, start, end):
+        f.write(chunk)
+
+
+def main(argv: Iterable[str] = None):
+    """Entry point for the import/export tool."""
+    args = list(sys.argv[1:] if argv is None else argv)
+    if len(args) != 3 or args[0] not in ('import', 'export'):
+        print(__doc__.strip().split('\n\n')[1])
+        sys.exit(2)
+    command, data_file, path = args
+    tracker = CalorieTracker(data_file)
+    fmt = detect_format(path)
+
+    if command == 'import':
+        with open(path, newline='', encoding='utf-8') as f:
+            result = import_meals(tracker, f, fmt)
+        print(f"✓ Imported {result['meals']} meals ({result['items']} items) into {data_file}")
+        for error in result['errors']:
+            print(f"  ✗ line {error['line']}: {error['error']}")
+        if result['skipped'] > len(result['errors']):
+            print(f"  ... {result['skipped'] - len(result['errors'])} more rows skipped")
+    else:
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            export_meals(tracker, f, fmt)
+        print(f"✓ Exported meals from {data_file} to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Move per-user data files between directory layouts (see data_layout.py).
+
+Usage:
+    python3 migrate_layout.py [data_dir] [--to sharded] [--from flat] [--workers 16]
+
+Each user's data file and its '.journal', '.archive' and '.corrupt'
+companions are renamed into place on a pool of threads.
+Renames within one file system are metadata-only, so the work is bound by
+directory operations rather than by file sizes.
+Stale '.lock' files are removed.
+Stop the app first, then start it with CALORIES_DATA_LAYOUT set to the new
+layout.
+
+Companions are moved before the data file, so an interrupted run can
+simply be repeated.
+A file whose destination already exists is left in place and reported as
+a failure.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, List, Optional
+
+from data_layout import LAYOUTS, FlatLayout, get_layout
+
+COMPANION_SUFFIXES = ('.journal', '.archive', '.corrupt')
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 50
+
+
+class LayoutMigration:
+    """Move every user from one layout to another."""
+
+    def __init__(self, source: FlatLayout, destination: FlatLayout, workers: int = 16):
+        self.source = source
+        self.destination = destination
+        self.workers = workers
+        self._made_dirs = set()
+        self._lock = threading.Lock()
+
+    def _make_dir(self, directory: str):
+        if directory in self._made_dirs:
+            return
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._made_dirs.add(directory)
+
+    def move_user(self, user_id: str, path: str):
+        """Move one user's files to their destination path (raises OSError on conflict)."""
+        target = self.destination.path_for(user_id)
+        if os.path.abspath(target) == os.path.abspath(path):
+            return
+        self._make_dir(os.path.dirname(target))
+        for suffix in COMPANION_SUFFIXES + ('',):
+            if not os.path.exists(path + suffix):
+                continue
+            if os.path.exists(target + suffix):
+                raise FileExistsError(f"{target + suffix} already exists")
+            os.rename(path + suffix, target + suffix)
+        try:
+            os.remove(f'{path}.lock')
+        except FileNotFoundError:
+            pass
+
+    def _move(self, user: tuple) -> Optional[Dict]:
+        user_id, path = user
+        try:
+            self.move_user(user_id, path)
+        except OSError as e:
+            return {'user_id': user_id, 'path': path, 'error': str(e)}
+        return None
+
+    def run(self, users: Optional[Iterable] = None) -> Dict:
+        """
+        Move all users (or the given (user_id, path) pairs).
+
+        Returns:
+            Dictionary with the number of users moved and failed, the first
+            MAX_REPORTED_ERRORS errors, elapsed seconds and users per second
+        """
+        users = iter(self.source.iter_users() if users is None else users)
+        moved = failed = 0
+        errors: List[Dict] = []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.workers) as executor:
+            # Submit in chunks so millions of users are never all queued at once
+            while True:
+                chunk = list(islice(users, CHUNK_SIZE))
+                if not chunk:
+                    break
+                for error in executor.map(self._move, chunk):
+                    if error is None:
+                        moved += 1
+                        continue
+                    failed += 1
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append(error)
+        elapsed = time.perf_counter() - start
+        return {'moved': moved, 'failed': failed, 'errors': errors, 'seconds': round(elapsed, 3),
+                'users_per_second': round(moved / elapsed, 1) if elapsed else 0.0}
+
+
+def migrate(data_dir: str, to: str = 'sharded', source: str = 'flat', workers: int = 16) -> Dict:
+    """Move every user file in data_dir from the `source` layout to the `to` layout."""
+    return LayoutMigration(get_layout(source, data_dir), get_layout(to, data_dir), workers).run()
+
+
+def main(argv: Optional[List[str]] = None):
+    """Entry point for the layout migration tool."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('data_dir', nargs='?', default='data')
+    parser.add_argument('--to', choices=LAYOUTS, default='sharded')
+    parser.add_argument('--from', dest='source', choices=LAYOUTS, default='flat')
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args(argv)
+    if args.to == args.source:
+        parser.error('--to and --from are the same layout')
+
+    result = migrate(args.data_dir, args.to, args.source, args.workers)
+    print(f"✓ Moved {result['moved']} users to the {args.to} layout in {result['seconds']}s "
+          f"({result['users_per_second']} users/s)")
+    for error in result['errors']:
+        print(f"  ✗ {error['user_id']}: {error['error']}")
+    if result['failed']:
+        if result['failed'] > len(result['errors']):
+            print(f"  ... {result['failed'] - len(result['errors'])} more failures")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+One-shot migration of per-user JSON data files into the SQLite backend.
+
+Usage:
+    python3 migrate_to_sqlite.py [data_dir] [db_path]
+
+Every data/calorie_data_<user_id>.json file is imported in a single
+transaction. Set CALORIES_DATA_LAYOUT=sharded if the files are in the
+sharded layout (see data_layout.py). Run the app with
+CALORIES_STORAGE=sqlite afterwards.
+"""
+
+import os
+import sys
+from typing import Dict, Iterator, Tuple
+
+from archive import ColdArchive, archive_path
+from data_layout import get_layout
+from storage import JournalStorage, SQLiteStorage
+
+
+def iter_user_files(data_dir: str, layout: str = 'flat') -> Iterator[Tuple[str, Dict]]:
+    """Yield (user_id, document) for each user data file in data_dir."""
+    for user_id, path in get_layout(layout, data_dir).iter_users():
+        # JournalStorage also replays any pending journal for journal-mode users;
+        # archived days go back in with the rest, as SQLite reads by date already.
+        # Read-only: an unreadable file stops the migration rather than being moved aside
+        yield user_id, ColdArchive(archive_path(path), read_only=True).merge_into(JournalStorage(path, read_only=True).load())
+
+
+def migrate(data_dir: str, db_path: str, layout: str = 'flat') -> int:
+    """
+    Import all JSON user files from data_dir into the database at db_path.
+
+    Returns:
+        Number of users imported
+    """
+    return SQLiteStorage.import_users(db_path, iter_user_files(data_dir, layout))
+
+
+def main():
+    """Entry point for the migration tool."""
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else 'data'
+    db_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(data_dir, 'calories.db')
+    try:
+        count = migrate(data_dir, db_path, os.environ.get('CALORIES_DATA_LAYOUT', 'flat'))
+    except ValueError as e:
+        print(f"✗ {e}; nothing was imported")
+        sys.exit(1)
+    print(f"✓ Imported {count} users into {db_path}")
+
+
+if __name__ == '__main__':
+    main()
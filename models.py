@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Compact in-memory types for tracker documents.
+
+A parsed document is mostly small dicts: one per meal and one per food
+item, each repeating the same keys ('amount_display', 'match', ...) and
+its own copy of values such as the food name. These classes keep the known
+keys in __slots__ and intern the repeated strings, which brings a loaded
+history to under half its size as dicts (see benchmarks/bench_memory.py).
+That adds up when app.tracker_cache holds hundreds of users with years of
+meals.
+
+    UserProfile  data['user_profile']
+    Meal         each entry of data['meals'][date]
+    FoodItem     each entry of a meal's 'items'
+
+Conversion is lossless: from_dict() keeps keys it does not know about in an
+'extra' dict, and to_dict() gives back the same keys and values. Records
+also answer the read-only dict protocol (record['key'], .get(), 'key' in
+record, dict(record)) and compare equal to the matching dict, so code and
+templates written against plain documents keep working. Files are always
+written as plain JSON-compatible documents: pass to_json as the `default`
+of json.dumps, or use to_document.
+"""
+
+from sys import intern
+from typing import Any, Dict, Iterator, Tuple
+
+_MISSING = object()
+
+
+class Record:
+    """Base class: known keys in slots, anything else in `extra`."""
+
+    __slots__ = ('extra',)
+    FIELDS: Tuple[str, ...] = ()
+    # String fields whose values repeat across records (food names, units,
+    # match kinds); they are interned so every record shares one copy
+    INTERNED: Tuple[str, ...] = ()
+    __hash__ = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls.FIELDS)
+        cls._interned = frozenset(cls.INTERNED)
+
+    def __init__(self, **fields):
+        self._fill(fields)
+
+    def _fill(self, fields: Dict):
+        extra = None
+        field_set, interned = self._field_set, self._interned
+        for key, value in fields.items():
+            if key in field_set:
+                if key in interned and type(value) is str:
+                    value = intern(value)
+                setattr(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from its JSON object (records are returned unchanged)."""
+        if isinstance(data, cls):
+            return data
+        record = cls.__new__(cls)
+        record._fill(data)
+        return record
+
+    def to_dict(self) -> Dict:
+        """The JSON object for this record."""
+        result = {}
+        for name in self.FIELDS:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                result[name] = value
+        if self.extra:
+            result.update(self.extra)
+        return result
+
+    def keys(self) -> Iterator[str]:
+        for name in self.FIELDS:
+            if hasattr(self, name):
+                yield name
+        if self.extra:
+            yield from self.extra
+
+    __iter__ = keys
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._field_set:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.keys())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == to_dict(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+
+class UserProfile(Record):
+    """A user's entered measurements and the targets derived from them."""
+
+    FIELDS = ('weight', 'height', 'age', 'gender', 'activity_level', 'weight_loss_rate', 'ideal_weight',
+              'bmr', 'tdee', 'daily_target', 'ideal_weight_tdee', 'intended_daily_deficit',
+              'actual_daily_deficit', 'safety_floor_applied', 'min_safe_calories',
+              'estimated_days_to_goal', 'estimated_weeks_to_goal', 'estimated_goal_date')
+    __slots__ = FIELDS
+
+
+class FoodItem(Record):
+    """One food in a meal, as returned by FoodDatabase.estimate_calories."""
+
+    FIELDS = ('food', 'calories', 'amount_g', 'amount_display', 'match', 'matched_to', 'distance')
+    INTERNED = ('food', 'amount_display', 'match', 'matched_to')
+    __slots__ = FIELDS
+
+
+class Meal(Record):
+    """A logged meal and its food items."""
+
+    FIELDS = ('meal_name', 'timestamp', 'items', 'total_calories')
+    INTERNED = ('meal_name',)
+    __slots__ = FIELDS
+
+    def _fill(self, fields: Dict):
+        super()._fill(fields)
+        items = getattr(self, 'items', None)
+        if items is not None:
+            self.items = [FoodItem.from_dict(item) for item in items]
+
+    def to_dict(self) -> Dict:
+        result = super().to_dict()
+        if 'items' in result:
+            result['items'] = [to_dict(item) for item in result['items']]
+        return result
+
+
+def to_dict(value):
+    """Plain dict for a record; anything else is returned unchanged."""
+    return value.to_dict() if isinstance(value, Record) else value
+
+
+def to_json(value) -> Dict:
+    """`default` hook for json.dumps that encodes records."""
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def to_document(data: Dict) -> Dict:
+    """Copy of a tracker document with every record replaced by its dict."""
+    document = dict(data)
+    document['user_profile'] = to_dict(data.get('user_profile'))
+    document['meals'] = {date: [to_dict(meal) for meal in meals] for date, meals in data['meals'].items()}
+    return document
+
+
+def from_document(data: Dict) -> Dict:
+    """Convert a tracker document's profile and meals to records, in place."""
+    if data.get('user_profile') is not None:
+        data['user_profile'] = UserProfile.from_dict(data['user_profile'])
+    for meals in data['meals'].values():
+        meals[:] = [Meal.from_dict(meal) for meal in meals]
+    return data
+
+
+def event_records(event: Dict) -> Dict:
+    """Copy of a mutation event (see storage.apply_event) carrying records instead of dicts."""
+    op = event['op']
+    if op == 'add_meal':
+        return dict(event, meal=Meal.from_dict(event['meal']))
+    if op == 'add_meals':
+        return dict(event, meals=[[date, Meal.from_dict(meal)] for date, meal in event['meals']])
+    if op == 'set_profile' and event['profile'] is not None:
+        return dict(event, profile=UserProfile.from_dict(event['profile']))
+    return event
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Dictionary-encoded tracker documents.
+
+In a plain document every meal item is an object repeating its keys and its
+food name, display amount and match kind, so a popular food is stored in
+full thousands of times per file. A packed document stores each distinct
+string once, in a per-file table, and every meal and item as a positional
+row referencing it:
+
+    {"packed": 1,
+     "strings": ["Lunch", "rice", "1 bowl", "exact", ...],
+     "meals": {"2024-01-31": [[0, "12:30:00", 390.0, [[1, 390.0, 300.0, 2, 3], ...]]]},
+     ...other top-level keys unchanged...}
+
+    meal row: [meal_name, time, total_calories, [item row, ...]]
+    item row: [food, calories, amount_g, amount_display, match(, matched_to(, distance))]
+
+String fields are indexes into 'strings'. A meal's timestamp is stored as
+its time of day when it falls on the meal's date. A meal or item that does
+not have exactly this shape (extra keys, missing fields, unusual types) is
+stored as its plain object instead, so packing is always lossless.
+
+Unpacking builds models records directly, with table strings interned.
+Packing saves space, not time: rebuilding the rows costs about what the
+smaller file saves in parsing, so a packed file loads about as fast as
+compact JSON and packed-binary more slowly than binary (see
+benchmarks/bench_serializers.py). References are to the file's own table
+rather than to food catalogue positions, which change whenever the
+catalogue does.
+"""
+
+from sys import intern
+from typing import Callable, Dict, List
+
+from models import FoodItem, Meal, to_dict
+
+FORMAT_VERSION = 1
+_ITEM_KEYS = frozenset(('food', 'calories', 'amount_g', 'amount_display', 'match'))
+_MEAL_KEYS = frozenset(('meal_name', 'timestamp', 'items', 'total_calories'))
+_MISSING = object()
+
+
+def is_packed(data: Dict) -> bool:
+    return isinstance(data, dict) and 'packed' in data and 'strings' in data
+
+
+def _pack_item(item, ref: Callable[[str], int]):
+    if type(item) is FoodItem:
+        if item.extra is not None:
+            return item.to_dict()
+        # Missing slots raise AttributeError, like missing keys below
+        try:
+            food, display, match = item.food, item.amount_display, item.match
+            row = [item.calories, item.amount_g]
+        except AttributeError:
+            return item.to_dict()
+        matched_to = getattr(item, 'matched_to', None)
+        distance = getattr(item, 'distance', _MISSING)
+        optional = hasattr(item, 'matched_to') + (distance is not _MISSING)
+    else:
+        if not _ITEM_KEYS.issubset(item):
+            return item
+        food, display, match = item['food'], item['amount_display'], item['match']
+        row = [item['calories'], item['amount_g']]
+        matched_to = item.get('matched_to')
+        distance = item.get('distance', _MISSING)
+        optional = len(item) - len(_ITEM_KEYS)
+    if type(food) is not str or type(display) is not str or type(match) is not str:
+        return to_dict(item)
+    if optional == 0:
+        return [ref(food), row[0], row[1], ref(display), ref(match)]
+    if optional == 1 and type(matched_to) is str:
+        return [ref(food), row[0], row[1], ref(display), ref(match), ref(matched_to)]
+    if optional == 2 and type(matched_to) is str and distance is not _MISSING:
+        return [ref(food), row[0], row[1], ref(display), ref(match), ref(matched_to), distance]
+    return to_dict(item)
+
+
+def _pack_meal(date: str, meal, ref: Callable[[str], int]):
+    if type(meal) is Meal:
+        if meal.extra is not None:
+            return meal.to_dict()
+        try:
+            name, timestamp, total, items = meal.meal_name, meal.timestamp, meal.total_calories, meal.items
+        except AttributeError:
+            return meal.to_dict()
+    else:
+        if len(meal) != 4 or not _MEAL_KEYS.issubset(meal):
+            return meal
+        name, timestamp, total, items = meal['meal_name'], meal['timestamp'], meal['total_calories'], meal['items']
+    if type(name) is not str or type(timestamp) is not str or type(items) is not list:
+        return to_dict(meal)
+    if timestamp.startswith(date) and timestamp[len(date):len(date) + 1] == ' ' \
+            and ' ' not in timestamp[len(date) + 1:]:
+        timestamp = timestamp[len(date) + 1:]
+    elif ' ' not in timestamp:
+        return to_dict(meal)  # could not be told apart from a time of day
+    return [ref(name), timestamp, total, [_pack_item(item, ref) for item in items]]
+
+
+def pack_document(data: Dict) -> Dict:
+    """Return the packed form of a tracker document (of dicts or records)."""
+    strings: List[str] = []
+    index: Dict[str, int] = {}
+
+    def ref(value: str) -> int:
+        position = index.get(value)
+        if position is None:
+            position = index[value] = len(strings)
+            strings.append(value)
+        return position
+
+    meals = {date: [_pack_meal(date, meal, ref) for meal in day_meals] for date, day_meals in data['meals'].items()}
+    packed = {'packed': FORMAT_VERSION, 'strings': strings}
+    packed.update((key, value) for key, value in data.items() if key != 'meals')
+    packed['user_profile'] = to_dict(data.get('user_profile'))
+    packed['meals'] = meals
+    return packed
+
+
+def _unpack_item(row, strings: List[str]) -> FoodItem:
+    if type(row) is dict:
+        return FoodItem.from_dict(row)
+    item = FoodItem.__new__(FoodItem)
+    item.food = strings[row[0]]
+    item.calories = row[1]
+    item.amount_g = row[2]
+    item.amount_display = strings[row[3]]
+    item.match = strings[row[4]]
+    if len(row) > 5:
+        item.matched_to = strings[row[5]]
+        if len(row) > 6:
+            item.distance = row[6]
+    item.extra = None
+    return item
+
+
+def _unpack_meal(date: str, row, strings: List[str]) -> Meal:
+    if type(row) is dict:
+        return Meal.from_dict(row)
+    meal = Meal.__new__(Meal)
+    meal.meal_name = strings[row[0]]
+    meal.timestamp = row[1] if ' ' in row[1] else f'{date} {row[1]}'
+    meal.total_calories = row[2]
+    meal.items = [_unpack_item(item, strings) for item in row[3]]
+    meal.extra = None
+    return meal
+
+
+def unpack_document(data: Dict) -> Dict:
+    """Return the tracker document for a packed one, with meals as records (others unchanged)."""
+    if not is_packed(data):
+        return data
+    if data['packed'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported packed document version: {data['packed']}")
+    strings = [intern(value) for value in data.pop('strings')]
+    del data['packed']
+    data['meals'] = {date: [_unpack_meal(date, row, strings) for row in rows]
+                     for date, rows in data['meals'].items()}
+    return data
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Recompute the derived fields of every stored user profile.
+
+Usage:
+    python3 recompute_profiles.py [data_dir] [--workers N] [--chunk 500] [--dry-run]
+
+Run this after changing CalorieCalculator (activity multipliers, deficits,
+safety floors, KCAL_PER_KG). The fields users entered (weight, height, age,
+gender, activity level, rate and goal weight) are kept; bmr, tdee,
+daily_target, ideal_weight_tdee and the goal plan are recomputed with
+compute_batch, one chunk of users at a time. Goal dates keep counting from
+the day the plan was made (the old goal date less the old days to goal),
+or from today for profiles without one.
+
+Chunks of files are spread over a process pool. Profiles are written back
+through the app's storage settings (CALORIES_STORAGE, CALORIES_SERIALIZER
+and CALORIES_DATA_LAYOUT) as a set_profile event under the file lock, so
+JSON files are replaced atomically and journal users get one journal line.
+A profile the user changes while the job runs is left alone and counted as
+a conflict, and profiles that are already current are not rewritten, so
+the job can simply be run again.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterable, List, Optional
+
+from calories_app import CalorieCalculator, CalorieTracker
+from data_layout import LAYOUTS, get_layout
+from storage import create_storage
+
+# Fields entered by the user; everything else in a profile is derived from them
+INPUT_FIELDS = ('weight', 'height', 'age', 'gender', 'activity_level', 'weight_loss_rate', 'ideal_weight')
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 50
+COUNTS = ('profiles', 'updated', 'unchanged', 'no_profile', 'conflicts', 'failed')
+
+
+def _inputs(profile: Optional[Dict]) -> Optional[tuple]:
+    if not profile:
+        return None
+    return tuple(profile.get(field) for field in INPUT_FIELDS)
+
+
+def _plan_start(profile: Dict, today: datetime) -> datetime:
+    """Day the stored goal estimate counts from."""
+    goal_date, days = profile.get('estimated_goal_date'), profile.get('estimated_days_to_goal')
+    if goal_date and days:
+        try:
+            return datetime.strptime(goal_date, '%Y-%m-%d') - timedelta(days=int(days))
+        except (TypeError, ValueError):
+            pass
+    return today
+
+
+def _row(profile: Dict) -> tuple:
+    """compute_batch inputs for one profile: weight, height, age, ideal weight and the three codes."""
+    try:
+        return ((float(profile['weight']), float(profile['height']), int(profile['age']),
+                 float(profile['ideal_weight']))
+                + CalorieCalculator.encode_profile(profile['gender'], profile['activity_level'],
+                                                   profile['weight_loss_rate']))
+    except (KeyError, TypeError, AttributeError, ValueError) as e:
+        raise ValueError(f"Invalid profile ({type(e).__name__}: {e})")
+
+
+def recompute(profiles: List[Dict], today: Optional[datetime] = None, rows: Optional[List[tuple]] = None) -> List[Dict]:
+    """
+    Return each profile with its derived fields recomputed.
+
+    Args:
+        profiles: Stored profiles
+        today: Start date for profiles without a goal estimate (now by default)
+        rows: The profiles' _row() values, if already computed
+
+    Raises:
+        ValueError: If a profile is missing an input field or has a bad value
+    """
+    today = today or datetime.now()
+    if rows is None:
+        rows = [_row(profile) for profile in profiles]
+    columns = [list(column) for column in zip(*rows)] or [[] for _ in range(7)]
+    weights, heights, ages, ideals, genders, activities, rates = columns
+    batch = CalorieCalculator.compute_batch(weights, heights, ages, genders, activities, rates, ideal_weights=ideals)
+    results = []
+    for i, profile in enumerate(profiles):
+        tdee = batch['tdee'][i]
+        plan = CalorieCalculator.goal_plan(tdee, weights[i], ideals[i], profile['gender'],
+                                           profile['weight_loss_rate'], _plan_start(profile, today))
+        del plan['raw_target']
+        results.append(dict(profile, bmr=round(batch['bmr'][i], 1), tdee=round(tdee, 1),
+                            ideal_weight_tdee=round(batch['ideal_tdee'][i], 1), **plan))
+    return results
+
+
+def _fail(result: Dict, path: str, error: Exception):
+    result['failed'] += 1
+    if len(result['errors']) < MAX_REPORTED_ERRORS:
+        result['errors'].append({'path': path, 'error': str(error)})
+
+
+def process_chunk(paths: List[str], storage_kind: str = 'json', serializer: str = 'json',
+                  dry_run: bool = False, today: Optional[datetime] = None) -> Dict:
+    """
+    Recompute and write back the profiles in one chunk of data files.
+
+    Returns:
+        Counts for the chunk (see COUNTS) and up to MAX_REPORTED_ERRORS errors
+    """
+    result = dict.fromkeys(COUNTS, 0)
+    result['errors'] = []
+    trackers, profiles, rows = [], [], []
+    for path in paths:
+        try:
+            tracker = CalorieTracker(path, create_storage(storage_kind, path, serializer=serializer, read_only=dry_run))
+        except (OSError, ValueError) as e:
+            _fail(result, path, e)
+            continue
+        profile = tracker.data.get('user_profile')
+        if not profile:
+            result['no_profile'] += 1
+            continue
+        # Validate here so one bad profile does not fail the whole chunk
+        try:
+            rows.append(_row(profile))
+        except ValueError as e:
+            _fail(result, path, e)
+            continue
+        trackers.append(tracker)
+        profiles.append(profile)
+
+    result['profiles'] = len(profiles)
+    for tracker, old, new in zip(trackers, profiles, recompute(profiles, today, rows)):
+        if new == old:
+            result['unchanged'] += 1
+            continue
+        if dry_run:
+            result['updated'] += 1
+            continue
+        expected = _inputs(old)
+        try:
+            written = tracker.apply({'op': 'set_profile', 'profile': new},
+                                    check=lambda data: _inputs(data.get('user_profile')) == expected)
+        except OSError as e:
+            _fail(result, tracker.data_file, e)
+            continue
+        result['updated' if written else 'conflicts'] += 1
+    return result
+
+
+def _chunks(items: Iterable, size: int) -> Iterable[List]:
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run(data_dir: str, layout: str = 'flat', storage_kind: str = 'json', serializer: str = 'json',
+        workers: Optional[int] = None, chunk_size: int = CHUNK_SIZE, dry_run: bool = False) -> Dict:
+    """
+    Recompute every profile under data_dir on a pool of worker processes.
+
+    Returns:
+        Totals (see COUNTS), up to MAX_REPORTED_ERRORS errors, elapsed
+        seconds and profiles per second
+    """
+    if storage_kind == 'sqlite':
+        raise ValueError("Profiles in SQLite are not stored as files; run this before migrating")
+    workers = workers or os.cpu_count() or 1
+    paths = (path for _, path in get_layout(layout, data_dir).iter_users())
+    totals = dict.fromkeys(COUNTS, 0)
+    totals['errors'] = []
+
+    def collect(future):
+        chunk_result = future.result()
+        for key in COUNTS:
+            totals[key] += chunk_result[key]
+        totals['errors'].extend(chunk_result['errors'][:MAX_REPORTED_ERRORS - len(totals['errors'])])
+
+    start = time.perf_counter()
+    today = datetime.now()
+    with ProcessPoolExecutor(workers) as executor:
+        # Keep a couple of chunks per worker in flight rather than queueing every file
+        pending = set()
+        for chunk in _chunks(paths, chunk_size):
+            pending.add(executor.submit(process_chunk, chunk, storage_kind, serializer, dry_run, today))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+        for future in pending:
+            collect(future)
+    elapsed = time.perf_counter() - start
+    totals['seconds'] = round(elapsed, 3)
+    totals['profiles_per_second'] = round(totals['profiles'] / elapsed, 1) if elapsed else 0.0
+    return totals
+
+
+def main(argv: Optional[List[str]] = None):
+    """Entry point for the recompute job."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('data_dir', nargs='?', default=os.environ.get('CALORIES_DATA_DIR', 'data'))
+    parser.add_argument('--layout', choices=LAYOUTS, default=os.environ.get('CALORIES_DATA_LAYOUT', 'flat'))
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--chunk', type=int, default=CHUNK_SIZE, help='files per task')
+    parser.add_argument('--dry-run', action='store_true', help='count stale profiles without writing')
+    args = parser.parse_args(argv)
+
+    try:
+        result = run(args.data_dir, args.layout, os.environ.get('CALORIES_STORAGE', 'json'),
+                     os.environ.get('CALORIES_SERIALIZER', 'json'), args.workers, args.chunk, args.dry_run)
+    except ValueError as e:
+        parser.error(str(e))
+    verb = 'Would update' if args.dry_run else 'Updated'
+    print(f"✓ Checked {result['profiles']} profiles in {result['seconds']}s "
+          f"({result['profiles_per_second']} profiles/s)")
+    print(f"  {verb} {result['updated']}, unchanged {result['unchanged']}, "
+          f"conflicts {result['conflicts']}, without a profile {result['no_profile']}")
+    for error in result['errors']:
+        print(f"  ✗ {error['path']}: {error['error']}")
+    if result['failed']:
+        if result['failed'] > len(result['errors']):
+            print(f"  ... {result['failed'] - len(result['errors'])} more failures")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Serializers for tracker data files.
+
+    json           indented JSON (the original, human-readable format)
+    compact        JSON without whitespace, about half the size
+    binary         marshal-encoded document behind a magic header; several
+                   times faster to load and about a third of the size of
+                   indented JSON
+    packed         compact JSON of the dictionary-encoded document (see
+                   packing.py): meal items as rows referencing a per-file
+                   string table; the smallest, and about as fast to load
+                   as compact
+    packed-binary  the dictionary-encoded document in the binary format;
+                   smaller than binary but slower to load
+
+Files are detected by their first bytes when loading, so a data directory can
+hold a mix of formats while users are migrated.
+"""
+
+import json
+import marshal
+from typing import Dict
+
+from models import to_document, to_json
+from packing import pack_document, unpack_document
+
+
+class Serializer:
+    """Convert a tracker document to and from bytes."""
+
+    name = ''
+
+    def dumps(self, data: Dict) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, content: bytes) -> Dict:
+        raise NotImplementedError
+
+
+class JsonSerializer(Serializer):
+    """JSON, optionally indented."""
+
+    def __init__(self, indent: int = 2):
+        self.indent = indent
+        self.name = 'json' if indent else 'compact'
+
+    def dumps(self, data: Dict) -> bytes:
+        if self.indent:
+            return json.dumps(data, indent=self.indent, default=to_json).encode('utf-8')
+        return json.dumps(data, separators=(',', ':'), default=to_json).encode('utf-8')
+
+    def loads(self, content: bytes) -> Dict:
+        return json.loads(content)
+
+
+class BinarySerializer(Serializer):
+    """
+    marshal encoding (C-implemented, stdlib only) with a 5-byte header.
+
+    The marshal format version is pinned so files stay readable by newer
+    Pythons. marshal is not safe against maliciously crafted input, which is
+    fine for data files written by the app itself but means these files
+    should never be accepted from users.
+    """
+
+    name = 'binary'
+    MAGIC = b'CALB'
+    FORMAT_VERSION = 1
+    MARSHAL_VERSION = 4
+
+    def dumps(self, data: Dict) -> bytes:
+        return self.MAGIC + bytes([self.FORMAT_VERSION]) + marshal.dumps(to_document(data), self.MARSHAL_VERSION)
+
+    def loads(self, content: bytes) -> Dict:
+        if content[:4] != self.MAGIC or content[4] != self.FORMAT_VERSION:
+            raise ValueError("Not a binary tracker file")
+        data = marshal.loads(content[5:])
+        if not isinstance(data, dict):
+            raise ValueError("Binary tracker file does not contain a document")
+        return data
+
+
+class PackedSerializer(Serializer):
+    """Dictionary-encoded document (see packing.py) written with another serializer."""
+
+    def __init__(self, inner: Serializer, name: str):
+        self.inner = inner
+        self.name = name
+
+    def dumps(self, data: Dict) -> bytes:
+        return self.inner.dumps(pack_document(data))
+
+    def loads(self, content: bytes) -> Dict:
+        return unpack_document(self.inner.loads(content))
+
+
+SERIALIZERS = {
+    'json': JsonSerializer(indent=2),
+    'compact': JsonSerializer(indent=0),
+    'binary': BinarySerializer(),
+}
+SERIALIZERS['packed'] = PackedSerializer(SERIALIZERS['compact'], 'packed')
+SERIALIZERS['packed-binary'] = PackedSerializer(SERIALIZERS['binary'], 'packed-binary')
+
+
+def get_serializer(name: str) -> Serializer:
+    """Look up a serializer by name ('json', 'compact', 'binary', 'packed' or 'packed-binary')."""
+    try:
+        return SERIALIZERS[name or 'json']
+    except KeyError:
+        raise ValueError(f"Unknown serializer: {name}")
+
+
+def detect_serializer(content: bytes) -> Serializer:
+    """Pick the serializer that can read content, based on its header."""
+    if content.startswith(BinarySerializer.MAGIC):
+        return SERIALIZERS['binary']
+    return SERIALIZERS['json']
+
+
+def loads(content: bytes) -> Dict:
+    """Decode a data file in any supported format."""
+    # Packed documents are recognised by their keys, whatever they were written with
+    return unpack_document(detect_serializer(content).loads(content))
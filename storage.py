@@ -0,0 +1,746 @@
+#!/usr/bin/env python3
+"""
+Storage backends for CalorieTracker.
+
+Every backend loads and saves the same document shape:
+
+    {'user_profile': {...} or None, 'meals': {'YYYY-MM-DD': [meal, ...]}}
+
+plus an optional 'daily_totals' index ({'YYYY-MM-DD': {'calories', 'meals',
+'items'}}) that apply_event keeps up to date; see sync_daily_totals.
+
+Mutations are described as events (see apply_event) so that backends which
+can persist a single change cheaply, such as the append-only journal, do
+not have to rewrite the whole document.
+"""
+
+import atexit
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import weakref
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import serializers
+from models import to_json
+from serializers import Serializer
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+
+def default_data() -> Dict:
+    """Return the document used for a user with no saved data."""
+    return {
+        'user_profile': None,
+        'meals': {}  # Date -> list of meals
+    }
+
+
+def day_totals(meals: List[Dict]) -> Dict:
+    """Compute the totals entry for one day's meals."""
+    return {
+        'calories': round(sum(meal['total_calories'] for meal in meals), 1),
+        'meals': len(meals),
+        'items': sum(len(meal['items']) for meal in meals)
+    }
+
+
+def sync_daily_totals(data: Dict) -> Dict:
+    """
+    Make data['daily_totals'] agree with data['meals'].
+
+    Only days whose meal count does not match (or that have no entry) are
+    recomputed, so documents saved with an up-to-date index cost one pass
+    over the dates, not over every meal.
+
+    Returns:
+        The totals index
+    """
+    totals = data.setdefault('daily_totals', {})
+    meals = data['meals']
+    for date, day_meals in meals.items():
+        entry = totals.get(date)
+        if entry is None or entry['meals'] != len(day_meals):
+            totals[date] = day_totals(day_meals)
+    for date in [date for date in totals if date not in meals]:
+        del totals[date]
+    return totals
+
+
+def _adjust_totals(data: Dict, date: str, meal: Dict, sign: int):
+    totals = data.get('daily_totals')
+    if totals is None:
+        return  # no index on this document (sync_daily_totals builds it)
+    entry = totals.setdefault(date, {'calories': 0, 'meals': 0, 'items': 0})
+    entry['calories'] = round(entry['calories'] + sign * meal['total_calories'], 1)
+    entry['meals'] += sign
+    entry['items'] += sign * len(meal['items'])
+
+
+def apply_event(data: Dict, event: Dict) -> bool:
+    """
+    Apply a mutation event to a tracker document in place.
+
+    Events:
+        {'op': 'add_meal', 'date': 'YYYY-MM-DD', 'meal': {...}}
+        {'op': 'add_meals', 'meals': [['YYYY-MM-DD', {...}], ...]}
+        {'op': 'delete_meal', 'date': 'YYYY-MM-DD', 'index': int}
+        {'op': 'set_profile', 'profile': {...}}
+        {'op': 'archive_days', 'generation': int, 'days': {'YYYY-MM-DD': count, ...}}
+
+    archive_days drops the first `count` meals of each day, which have been
+    written to the user's archive (see archive.py); it is ignored if the
+    document has already applied that generation of the archive.
+
+    The daily totals index, if the document has one, is updated in step.
+
+    Returns:
+        True if the document changed
+    """
+    op = event['op']
+    if op == 'add_meal':
+        data['meals'].setdefault(event['date'], []).append(event['meal'])
+        _adjust_totals(data, event['date'], event['meal'], 1)
+        return True
+    if op == 'add_meals':
+        for date, meal in event['meals']:
+            data['meals'].setdefault(date, []).append(meal)
+            _adjust_totals(data, date, meal, 1)
+        return bool(event['meals'])
+    if op == 'delete_meal':
+        meals = data['meals'].get(event['date'])
+        index = event['index']
+        if meals is None or not 0 <= index < len(meals):
+            return False
+        _adjust_totals(data, event['date'], meals.pop(index), -1)
+        return True
+    if op == 'set_profile':
+        data['user_profile'] = event['profile']
+        return True
+    if op == 'archive_days':
+        if event['generation'] <= data.get('archive_generation', 0):
+            return False
+        for date, count in event['days'].items():
+            meals = data['meals'].get(date, [])
+            for meal in meals[:count]:
+                _adjust_totals(data, date, meal, -1)
+            del meals[:count]
+            if not meals:
+                data['meals'].pop(date, None)
+                data.get('daily_totals', {}).pop(date, None)
+        data['archive_generation'] = event['generation']
+        return True
+    raise ValueError(f"Unknown event op: {op}")
+
+
+def atomic_write(path: str, content: bytes, fsync: bool = True):
+    """
+    Replace path with content without ever leaving a partially written file.
+
+    The content goes to a temporary file in the same directory, which is
+    flushed (and fsynced) before being renamed over path. Readers see either
+    the old or the new document, even if the process dies mid-write.
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        # Persist the rename itself
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class TrackerStorage:
+    """Interface for CalorieTracker persistence."""
+
+    # Lock shared with CalorieTracker when a backend writes from another thread
+    lock = None
+    # Whether load() returns top-level document keys other than the profile
+    # and meals (such as 'archive_generation') as they were saved
+    keeps_extra_keys = True
+    # Whether unreadable files raise ValueError instead of being moved aside
+    read_only = False
+
+    def load(self) -> Dict:
+        """Load the user's document (default_data() if there is none)."""
+        raise NotImplementedError
+
+    def save(self, data: Dict):
+        """
+        Persist the whole document.
+
+        The profile and meals may be models records rather than dicts; encode
+        with models.to_json (or convert with models.to_document).
+        """
+        raise NotImplementedError
+
+    def record(self, data: Dict, event: Dict):
+        """
+        Persist a mutation that has already been applied to data.
+
+        Backends that cannot store individual events fall back to a full save.
+        """
+        self.save(data)
+
+    def version(self) -> Optional[Hashable]:
+        """
+        Return a token that changes whenever the stored document changes.
+
+        Used to tell whether an in-memory copy is still current without
+        reloading it. None means the backend cannot tell (never cache).
+        """
+        return None
+
+    def locked(self) -> ContextManager:
+        """
+        Hold an exclusive cross-process lock on this user's data.
+
+        CalorieTracker takes it around reload-if-stale, apply and write, so
+        concurrent workers serialize their mutations instead of overwriting
+        each other's. Backends whose writes are already atomic per event
+        need no lock.
+        """
+        return nullcontext()
+
+
+# Per lock path: [thread lock, how many times the holding thread has entered it]
+_thread_locks: Dict[str, list] = {}
+_thread_locks_guard = threading.Lock()
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Exclusive advisory lock on path (created if missing).
+
+    flock() serializes processes; a per-path threading.RLock serializes
+    threads of this process, which would otherwise need one descriptor each.
+    The lock is reentrant, so a load() under CalorieTracker's lock can take
+    it again, e.g. to move a corrupt file aside.
+    """
+    with _thread_locks_guard:
+        held = _thread_locks.setdefault(path, [threading.RLock(), 0])
+    with held[0]:
+        held[1] += 1
+        try:
+            if fcntl is None or held[1] > 1:
+                yield
+                return
+            with open(path, 'a') as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        finally:
+            held[1] -= 1
+
+
+def file_version(path: str) -> Optional[Tuple[int, int, int]]:
+    """Return (mtime_ns, size, inode) for path, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class JsonFileStorage(TrackerStorage):
+    """
+    One document file per user, rewritten atomically on every change.
+
+    Files are written with the given serializer (indented JSON by default)
+    and read in whichever supported format they are in, so changing the
+    serializer converts users gradually as they next save.
+
+    A file that cannot be parsed is moved aside to '<path>.corrupt', under
+    the file lock, rather than being silently overwritten by the next save.
+    Read-only callers (dry runs, migrations) pass read_only=True and get a
+    ValueError instead, leaving the file where it is.
+    """
+
+    def __init__(self, path: str, fsync: bool = True, serializer: Optional[Serializer] = None,
+                 read_only: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self.serializer = serializer or serializers.get_serializer('json')
+        self.read_only = read_only
+
+    def version(self) -> Optional[Hashable]:
+        return ('file', file_version(self.path))
+
+    def locked(self) -> ContextManager:
+        return file_lock(f"{self.path}.lock")
+
+    def _read(self) -> Optional[Dict]:
+        """The stored document (default_data() if there is none), or None if it cannot be parsed."""
+        try:
+            with open(self.path, 'rb') as f:
+                content = f.read()
+        except IOError:
+            return default_data()
+        if not content.strip():
+            return default_data()
+        try:
+            return serializers.loads(content)
+        except (ValueError, EOFError, TypeError):
+            # JSONDecodeError and marshal errors
+            return None
+
+    def load(self) -> Dict:
+        data = self._read()
+        if data is None:
+            if self.read_only:
+                raise ValueError(f"{self.path} cannot be parsed")
+            with self.locked():
+                # Another worker may have replaced the file since; only move aside what is still unreadable
+                data = self._read()
+                if data is None:
+                    os.replace(self.path, f"{self.path}.corrupt")
+                    data = default_data()
+        return data
+
+    def save(self, data: Dict):
+        atomic_write(self.path, self.serializer.dumps(data), fsync=self.fsync)
+
+
+class JournalStorage(JsonFileStorage):
+    """
+    JSON snapshot plus an append-only journal of events.
+
+    Each mutation appends one line to '<path>.journal', so logging or deleting
+    a meal costs the same however long the user's history is. Once the
+    journal holds compact_every events it is folded into the snapshot.
+
+    Events carry a sequence number and the snapshot stores the last one it
+    includes, so a crash between writing the snapshot and truncating the
+    journal cannot apply an event twice. A line torn by a crash is skipped,
+    and the next event is written on a line of its own.
+    """
+
+    SEQ_KEY = 'journal_seq'
+
+    def __init__(self, path: str, compact_every: int = 500, fsync: bool = True,
+                 serializer: Optional[Serializer] = None, read_only: bool = False):
+        super().__init__(path, fsync, serializer, read_only)
+        self.journal_path = f"{path}.journal"
+        self.compact_every = compact_every
+        self.seq = 0
+        self.pending = 0
+
+    def version(self) -> Optional[Hashable]:
+        return ('journal', file_version(self.path), file_version(self.journal_path))
+
+    def load(self) -> Dict:
+        data = super().load()
+        snapshot_seq = data.pop(self.SEQ_KEY, 0)
+        self.seq = snapshot_seq
+        self.pending = 0
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn write from a crash; record() starts the next event on a new line
+                    if event['seq'] <= snapshot_seq:
+                        continue
+                    apply_event(data, event)
+                    self.seq = event['seq']
+                    self.pending += 1
+        return data
+
+    def save(self, data: Dict):
+        """Write a full snapshot and empty the journal."""
+        snapshot = dict(data)
+        snapshot[self.SEQ_KEY] = self.seq
+        super().save(snapshot)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.pending = 0
+
+    def record(self, data: Dict, event: Dict):
+        self.seq += 1
+        if event['op'] == 'add_meals':
+            # A bulk import is cheaper to store as a snapshot than as one huge journal line
+            self.save(data)
+            return
+        line = json.dumps(dict(event, seq=self.seq), separators=(',', ':'), default=to_json) + '\n'
+        with open(self.journal_path, 'ab+') as f:
+            end = f.seek(0, os.SEEK_END)
+            if end:
+                f.seek(end - 1)
+                if f.read(1) != b'\n':
+                    line = '\n' + line  # do not run on from a torn line
+            f.write(line.encode('utf-8'))
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self.pending += 1
+        if self.compact_every and self.pending >= self.compact_every:
+            self.save(data)
+
+
+class SQLiteStorage(TrackerStorage):
+    """
+    All users in one SQLite database, one row per meal.
+
+    The database runs in WAL mode so readers do not block the writer, and
+    meals are indexed on (user_id, date) so single-day and date-range reads
+    do not touch the rest of a user's history. Connections are opened once
+    per thread and reused; sqlite3 caches the prepared statements on each.
+    Every write bumps the user's generation counter, which serves as the
+    version token. locked() holds the database write lock (BEGIN IMMEDIATE),
+    so a reload, an index-based delete and its write are not interleaved with
+    another worker's.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS profiles (
+            user_id TEXT PRIMARY KEY,
+            profile TEXT,
+            generation INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS meals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            meal TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_meals_user_date ON meals (user_id, date, id);
+    """
+
+    _local = threading.local()
+    keeps_extra_keys = False
+
+    def __init__(self, db_path: str, user_id: str):
+        self.db_path = db_path
+        self.user_id = user_id
+
+    @classmethod
+    def connect(cls, db_path: str) -> sqlite3.Connection:
+        """Return this thread's connection to db_path, creating the schema on first use."""
+        connections = cls._local.__dict__.setdefault('connections', {})
+        conn = connections.get(db_path)
+        if conn is None:
+            conn = sqlite3.connect(db_path, timeout=30, cached_statements=64)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(cls.SCHEMA)
+            connections[db_path] = conn
+        return conn
+
+    @classmethod
+    def disconnect(cls, db_path: str):
+        """Close this thread's connection to db_path, if any."""
+        conn = cls._local.__dict__.get('connections', {}).pop(db_path, None)
+        if conn is not None:
+            conn.close()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return self.connect(self.db_path)
+
+    @contextmanager
+    def locked(self):
+        conn = self.conn
+        if conn.in_transaction:
+            # This thread's connection already holds the lock (connections are shared per thread)
+            yield
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        # Commit only now, so the caller reads the version its own write produced
+        conn.commit()
+
+    @contextmanager
+    def _writing(self):
+        """Run one write in the open locked() transaction, or in a transaction of its own."""
+        conn = self.conn
+        if conn.in_transaction:
+            yield
+            return
+        with conn:
+            yield
+
+    def version(self) -> Optional[Hashable]:
+        row = self.conn.execute('SELECT generation FROM profiles WHERE user_id = ?', (self.user_id,)).fetchone()
+        return ('sqlite', row[0] if row is not None else None)
+
+    def load(self) -> Dict:
+        data = default_data()
+        row = self.conn.execute('SELECT profile FROM profiles WHERE user_id = ?', (self.user_id,)).fetchone()
+        if row is not None and row[0] is not None:
+            data['user_profile'] = json.loads(row[0])
+        rows = self.conn.execute('SELECT date, meal FROM meals WHERE user_id = ? ORDER BY date, id', (self.user_id,))
+        for date, meal in rows:
+            data['meals'].setdefault(date, []).append(json.loads(meal))
+        return data
+
+    def meals_between(self, start: str, end: str) -> Dict[str, List[Dict]]:
+        """Return meals dated start..end inclusive ('YYYY-MM-DD'), using the date index."""
+        meals: Dict[str, List[Dict]] = {}
+        rows = self.conn.execute(
+            'SELECT date, meal FROM meals WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY date, id',
+            (self.user_id, start, end))
+        for date, meal in rows:
+            meals.setdefault(date, []).append(json.loads(meal))
+        return meals
+
+    def save(self, data: Dict):
+        with self._writing():
+            self._write_user(self.conn, self.user_id, data)
+
+    @staticmethod
+    def _write_user(conn: sqlite3.Connection, user_id: str, data: Dict):
+        profile = data.get('user_profile')
+        SQLiteStorage._write_profile(conn, user_id, profile)
+        conn.execute('DELETE FROM meals WHERE user_id = ?', (user_id,))
+        conn.executemany('INSERT INTO meals (user_id, date, meal) VALUES (?, ?, ?)',
+                         ((user_id, date, json.dumps(meal, default=to_json))
+                          for date, meals in data.get('meals', {}).items() for meal in meals))
+
+    @staticmethod
+    def _write_profile(conn: sqlite3.Connection, user_id: str, profile: Optional[Dict]):
+        conn.execute(
+            'INSERT INTO profiles (user_id, profile, generation) VALUES (?, ?, 1) '
+            'ON CONFLICT (user_id) DO UPDATE SET profile = excluded.profile, generation = generation + 1',
+            (user_id, json.dumps(profile, default=to_json) if profile is not None else None))
+
+    @staticmethod
+    def _bump_generation(conn: sqlite3.Connection, user_id: str):
+        conn.execute(
+            'INSERT INTO profiles (user_id, profile, generation) VALUES (?, NULL, 1) '
+            'ON CONFLICT (user_id) DO UPDATE SET generation = generation + 1',
+            (user_id,))
+
+    def record(self, data: Dict, event: Dict):
+        op = event['op']
+        with self._writing():
+            if op == 'add_meal':
+                self.conn.execute('INSERT INTO meals (user_id, date, meal) VALUES (?, ?, ?)',
+                                  (self.user_id, event['date'], json.dumps(event['meal'], default=to_json)))
+                self._bump_generation(self.conn, self.user_id)
+            elif op == 'add_meals':
+                self.conn.executemany('INSERT INTO meals (user_id, date, meal) VALUES (?, ?, ?)',
+                                      ((self.user_id, date, json.dumps(meal, default=to_json)) for date, meal in event['meals']))
+                self._bump_generation(self.conn, self.user_id)
+            elif op == 'delete_meal':
+                self.conn.execute(
+                    'DELETE FROM meals WHERE id = (SELECT id FROM meals WHERE user_id = ? AND date = ? '
+                    'ORDER BY id LIMIT 1 OFFSET ?)',
+                    (self.user_id, event['date'], event['index']))
+                self._bump_generation(self.conn, self.user_id)
+            elif op == 'set_profile':
+                self._write_profile(self.conn, self.user_id, event['profile'])
+            else:
+                self._write_user(self.conn, self.user_id, data)
+
+    @classmethod
+    def import_users(cls, db_path: str, users: Iterable[Tuple[str, Dict]]) -> int:
+        """
+        Bulk-load (user_id, document) pairs in a single transaction.
+
+        Existing rows for the same users are replaced.
+
+        Returns:
+            Number of users imported
+        """
+        conn = cls.connect(db_path)
+        count = 0
+        with conn:
+            for user_id, data in users:
+                cls._write_user(conn, user_id, data)
+                count += 1
+        return count
+
+
+class WriteBehindStorage(TrackerStorage):
+    """
+    Coalesce bursts of writes into one delayed save of the wrapped backend.
+
+    The first mutation schedules a flush after `delay` seconds; further
+    mutations in that window only replace the pending document, so N quick
+    changes cost one write (and one fsync). Pending writes are flushed at
+    interpreter exit. The trade-off is that up to `delay` seconds of changes
+    can be lost if the process is killed.
+
+    If another process wrote the data since it was loaded, the flush reloads
+    it under the backend lock and replays the pending events on top, so
+    neither side's changes are lost.
+
+    Use shared() so that every tracker for the same user goes through one
+    instance and never reads the file while changes are still pending.
+    """
+
+    _instances = weakref.WeakSet()
+    _shared = weakref.WeakValueDictionary()
+    _shared_lock = threading.Lock()
+
+    def __init__(self, inner: TrackerStorage, delay: float = 0.5):
+        self.inner = inner
+        self.delay = delay
+        self.lock = threading.RLock()
+        self._data: Optional[Dict] = None
+        self._events: Optional[List[Dict]] = None  # None after a full save(): nothing to replay
+        self._timer: Optional[threading.Timer] = None
+        self._writes = 0
+        self._external = 0
+        self._base_version = inner.version()  # disk state the pending changes apply to
+        self._seen_version = self._base_version  # last disk state reported by version()
+        WriteBehindStorage._instances.add(self)
+
+    @classmethod
+    def shared(cls, key: Hashable, make_inner, delay: float) -> 'WriteBehindStorage':
+        """Return the live instance for key, creating it with make_inner() if needed."""
+        with cls._shared_lock:
+            storage = cls._shared.get(key)
+            if storage is None:
+                storage = cls(make_inner(), delay)
+                cls._shared[key] = storage
+            return storage
+
+    @property
+    def keeps_extra_keys(self) -> bool:
+        return self.inner.keeps_extra_keys
+
+    @property
+    def read_only(self) -> bool:
+        return self.inner.read_only
+
+    @property
+    def dirty(self) -> bool:
+        return self._data is not None
+
+    def load(self) -> Dict:
+        with self.lock:
+            self.flush()
+            with self.inner.locked():
+                self._base_version = self._seen_version = self.inner.version()
+                return self.inner.load()
+
+    def save(self, data: Dict):
+        with self.lock:
+            self._data = data
+            self._events = None
+            self._schedule()
+
+    def record(self, data: Dict, event: Dict):
+        with self.lock:
+            if self._data is None:
+                self._events = []
+            self._data = data
+            if self._events is not None:
+                self._events.append(event)
+            self._schedule()
+
+    def _schedule(self):
+        self._writes += 1
+        if self._timer is None:
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write the pending changes now, if there are any."""
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._data is None:
+                return
+            with self.inner.locked():
+                if self._events is not None and self.inner.version() != self._base_version:
+                    merged = self.inner.load()
+                    for event in self._events:
+                        apply_event(merged, event)
+                    self.inner.save(merged)
+                    self._external += 1  # in-memory copies are now behind the merged result
+                else:
+                    self.inner.save(self._data)
+                self._data = None
+                self._events = None
+                self._base_version = self._seen_version = self.inner.version()
+
+    def version(self) -> Optional[Hashable]:
+        """Changes on our own writes (flushed or not) and on writes by anyone else."""
+        with self.lock:
+            disk = self.inner.version()
+            if disk is None:
+                return None
+            if disk != self._seen_version:
+                self._seen_version = disk
+                self._external += 1
+            return ('write_behind', self._writes, self._external)
+
+    @classmethod
+    def flush_all(cls):
+        """Flush every instance with pending writes."""
+        for storage in list(cls._instances):
+            storage.flush()
+
+
+atexit.register(WriteBehindStorage.flush_all)
+
+
+def create_storage(kind: str, data_file: str, user_id: Optional[str] = None,
+                   db_path: Optional[str] = None, write_behind: float = 0,
+                   serializer: str = 'json', read_only: bool = False) -> TrackerStorage:
+    """
+    Build a storage backend by name.
+
+    Args:
+        kind: 'json' (default), 'journal' or 'sqlite'
+        data_file: Path of the user's data file
+        user_id: User key (required for 'sqlite')
+        db_path: SQLite database path (required for 'sqlite')
+        write_behind: If positive, coalesce writes over this many seconds
+        serializer: File format for 'json' and 'journal' snapshots
+            ('json', 'compact' or 'binary'; any format is read)
+        read_only: Raise ValueError for an unreadable file instead of moving
+            it aside ('json' and 'journal'; for dry runs)
+    """
+    if write_behind > 0:
+        return WriteBehindStorage.shared((kind, data_file, user_id, db_path),
+                                         lambda: _create_backend(kind, data_file, user_id, db_path, serializer,
+                                                                 read_only),
+                                         write_behind)
+    return _create_backend(kind, data_file, user_id, db_path, serializer, read_only)
+
+
+def _create_backend(kind: str, data_file: str, user_id: Optional[str], db_path: Optional[str],
+                    serializer: str, read_only: bool = False) -> TrackerStorage:
+    if kind == 'journal':
+        return JournalStorage(data_file, serializer=serializers.get_serializer(serializer), read_only=read_only)
+    if kind == 'sqlite':
+        if user_id is None or db_path is None:
+            raise ValueError("SQLite storage needs a user_id and db_path")
+        return SQLiteStorage(db_path, user_id)
+    if kind in ('json', '', None):
+        return JsonFileStorage(data_file, serializer=serializers.get_serializer(serializer), read_only=read_only)
+    raise ValueError(f"Unknown storage backend: {kind}")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the meal history analytics
+"""
+
+import unittest
+import random
+from datetime import date, timedelta
+from analytics import MealAnalytics
+
+
+def totals_for(calories_by_date):
+    """Build a daily totals index from {date: calories}."""
+    return {d: {'calories': c, 'meals': 1, 'items': 1} for d, c in calories_by_date.items()}
+
+
+class TestMealAnalytics(unittest.TestCase):
+    """Test range queries against straightforward recomputation."""
+    
+    def setUp(self):
+        """Build a year of history with some gaps."""
+        rng = random.Random(7)
+        start = date(2024, 1, 1)
+        self.history = {}
+        for offset in range(366):
+            if rng.random() < 0.85:
+                day = (start + timedelta(days=offset)).isoformat()
+                self.history[day] = round(rng.uniform(1200, 2600), 1)
+        self.analytics = MealAnalytics(totals_for(self.history), target=1800)
+    
+    def expected(self, start, end):
+        """Recompute a window the slow way."""
+        values = [c for d, c in self.history.items() if start <= d <= end]
+        return values
+    
+    def test_summary_matches_recomputation(self):
+        """Test sum/avg/min/max/over-target for random windows."""
+        rng = random.Random(3)
+        days = sorted(self.history)
+        for _ in range(200):
+            a, b = sorted(rng.sample(range(len(days)), 2))
+            start, end = days[a], days[b]
+            values = self.expected(start, end)
+            summary = self.analytics.summary(start, end)
+            self.assertEqual(summary['logged_days'], len(values))
+            self.assertAlmostEqual(summary['total'], sum(values), places=1)
+            self.assertAlmostEqual(summary['average'], sum(values) / len(values), places=0)
+            self.assertEqual(summary['min'], min(values))
+            self.assertEqual(summary['max'], max(values))
+            self.assertEqual(summary['days_over_target'], sum(1 for v in values if v > 1800))
+    
+    def test_empty_window(self):
+        """Test a window with no logged days."""
+        summary = self.analytics.summary('2030-01-01', '2030-12-31')
+        self.assertEqual(summary['logged_days'], 0)
+        self.assertEqual(summary['total'], 0)
+        self.assertIsNone(summary['average'])
+    
+    def test_trend(self):
+        """Test that a steady daily increase gives its slope."""
+        history = {(date(2024, 3, 1) + timedelta(days=i)).isoformat(): 1500 + 10 * i for i in range(30)}
+        analytics = MealAnalytics(totals_for(history))
+        self.assertAlmostEqual(analytics.summary()['trend'], 10)
+        self.assertIsNone(analytics.summary()['days_over_target'])
+    
+    def test_periods(self):
+        """Test weekly and monthly buckets."""
+        months = self.analytics.periods('month')
+        self.assertEqual(len(months), 12)
+        self.assertEqual(sum(m['logged_days'] for m in months), len(self.history))
+        weeks = self.analytics.periods('week', '2024-01-01', '2024-01-31')
+        self.assertEqual(weeks[0]['start'], '2024-01-01')  # a Monday
+        self.assertEqual(len(weeks), 5)
+    
+    def test_periods_are_clipped_to_history(self):
+        """Test that huge or open-ended windows only cover logged days, up to date.max."""
+        weeks = self.analytics.periods('week', '0001-01-01', '9999-12-31')
+        self.assertEqual(weeks, self.analytics.periods('week'))
+        self.assertLessEqual(len(weeks), 53)
+        late = MealAnalytics(totals_for({'9999-12-30': 1500.0}))
+        self.assertEqual([p['end'] for p in late.periods('month', end='9999-12-31')], ['9999-12-31'])
+        self.assertEqual(len(late.periods('week', '0001-01-01')), 1)
+    
+    def test_streaks(self):
+        """Test current and longest on-target streaks."""
+        history = {
+            '2024-01-01': 1700, '2024-01-02': 1750, '2024-01-03': 1600,  # 3 on target
+            '2024-01-04': 2100,                                          # over
+            '2024-01-05': 1500, '2024-01-07': 1500, '2024-01-08': 1600,  # gap on the 6th
+        }
+        analytics = MealAnalytics(totals_for(history), target=1800)
+        self.assertEqual(analytics.streaks('2024-01-09'), {'current': 2, 'longest': 3})
+        self.assertEqual(analytics.streaks('2024-01-20'), {'current': 0, 'longest': 3})
+
+
+if __name__ == '__main__':
+    unittest.main()
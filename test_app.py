@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Tests for the Flask web app
+"""
+
+import unittest
+import asyncio
+import threading
+import io
+import json
+import os
+import tempfile
+import app as web
+from data_layout import ShardedLayout
+import metrics
+from asgi import AsgiApp
+
+
+class AppTestCase(unittest.TestCase):
+    """Run each test against a fresh data directory."""
+    
+    PROFILE = {
+        'weight': 80,
+        'height': 180,
+        'age': 30,
+        'gender': 'male',
+        'activity_level': 'moderate',
+        'weight_loss_rate': 'moderate',
+        'ideal_weight': 70
+    }
+    
+    def setUp(self):
+        """Switch into a temporary directory (the app stores data under ./data)."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.old_cwd = os.getcwd()
+        os.chdir(self.temp_dir.name)
+        web.app.config['TESTING'] = True
+        web.tracker_cache.clear()
+        self.client = web.app.test_client()
+    
+    def tearDown(self):
+        """Restore the working directory and remove test data."""
+        os.chdir(self.old_cwd)
+        self.temp_dir.cleanup()
+    
+    def set_up_profile(self):
+        """Create a profile through the setup form."""
+        return self.client.post('/setup', data=self.PROFILE)
+    
+    def log_meal(self, name, foods):
+        """Log a meal of (food, amount, unit) tuples through the form."""
+        return self.client.post('/log-meal', data={
+            'meal_name': name,
+            'food[]': [f[0] for f in foods],
+            'amount[]': [f[1] for f in foods],
+            'unit[]': [f[2] for f in foods],
+        })
+
+
+class TestTrackerCache(AppTestCase):
+    """Test the per-process tracker cache in get_tracker."""
+    
+    def test_reuses_tracker_until_file_changes(self):
+        """Test that trackers are reused while the data file is unchanged."""
+        self.set_up_profile()
+        with web.app.test_request_context():
+            first = web.get_tracker()
+            self.assertIs(web.get_tracker(), first)
+            
+            # Another process rewrites the file
+            other = web.CalorieTracker(first.data_file)
+            other.add_meal({'meal_name': 'snack', 'timestamp': '2024-01-01 10:00:00',
+                            'items': [], 'total_calories': 100}, '2024-01-01')
+            
+            reloaded = web.get_tracker()
+            self.assertIsNot(reloaded, first)
+            self.assertIn('2024-01-01', reloaded.data['meals'])
+    
+    def test_writes_keep_cached_tracker_current(self):
+        """Test that the app's own writes do not invalidate the cache."""
+        self.set_up_profile()
+        self.log_meal('lunch', [('banana', '1', 'piece')])
+        with web.app.test_request_context():
+            tracker = web.get_tracker()
+            self.assertTrue(tracker.is_current())
+            self.assertEqual(len(next(iter(tracker.data['meals'].values()))), 1)
+    
+    def test_sharded_layout(self):
+        """Test that users are stored under hashed subdirectories when sharded."""
+        web.app.config['DATA_LAYOUT'] = 'sharded'
+        self.addCleanup(web.app.config.__setitem__, 'DATA_LAYOUT', 'flat')
+        self.set_up_profile()
+        path = ShardedLayout('data').path_for('default')
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(os.path.exists('data/calorie_data_default.json'))
+        self.assertEqual(self.client.get('/dashboard').status_code, 200)
+
+
+class TestDashboard(AppTestCase):
+    """Test the dashboard page."""
+    
+    def test_shows_logged_meals_and_totals(self):
+        """Test that logged meals and the running total are rendered."""
+        self.set_up_profile()
+        self.log_meal('lunch', [('banana', '1', 'piece'), ('rice', '1', 'bowl')])
+        response = self.client.get('/dashboard')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'lunch', response.data)
+        self.assertIn(b'banana', response.data)
+        # 44.5 + 390 kcal
+        self.assertIn(b'434', response.data)
+
+
+
+class TestAnalyticsApi(AppTestCase):
+    """Test the analytics JSON endpoints."""
+    
+    def test_summary_and_validation(self):
+        """Test that today's meal shows up in the summary and bad dates are rejected."""
+        self.set_up_profile()
+        self.log_meal('lunch', [('rice', '200', 'g')])
+        summary = self.client.get('/api/analytics/summary').get_json()
+        self.assertEqual(summary['logged_days'], 1)
+        self.assertEqual(summary['total'], 260)
+        self.assertEqual(summary['days_over_target'], 0)
+        self.assertEqual(self.client.get('/api/analytics/streaks').get_json()['current'], 1)
+        self.assertEqual(self.client.get('/api/analytics/summary?start=2024-13-01').status_code, 400)
+        self.assertEqual(self.client.get('/api/analytics/periods?period=year').status_code, 400)
+    
+    def test_period_ranges_are_bounded(self):
+        """Test that malformed dates are rejected and extreme ranges stay small."""
+        self.set_up_profile()
+        self.log_meal('lunch', [('rice', '200', 'g')])
+        self.assertEqual(self.client.get('/api/analytics/periods?start=2024-1-5').status_code, 400)
+        self.assertEqual(self.client.get('/api/analytics/periods?end=99999-01-01').status_code, 400)
+        for period in ('week', 'month'):
+            response = self.client.get(f'/api/analytics/periods?period={period}&start=0001-01-01&end=9999-12-31')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.get_json()), 1)
+
+
+
+class TestBatchEstimate(AppTestCase):
+    """Test the batch food estimation endpoint."""
+    
+    def test_results_in_order_with_item_errors(self):
+        """Test that bad items get errors without failing the rest of the batch."""
+        response = self.client.post('/api/food-estimate/batch', json=[
+            {'food': 'rice', 'amount': 200, 'unit': 'g'},
+            {'food': ''},
+            {'food': 'banana', 'amount': 'lots', 'unit': 'piece'},
+            {'food': 'apple', 'amount': 1, 'unit': 'piece'},
+            'pizza',
+        ])
+        results = response.get_json()['results']
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[0]['calories'], 260)
+        self.assertIn('error', results[1])
+        self.assertIn('error', results[2])
+        self.assertEqual(results[3]['calories'], 26)
+        self.assertEqual(results[3]['amount_display'], '1 piece')
+        self.assertIn('error', results[4])
+    
+    def test_rejects_non_list(self):
+        """Test that the body must be a list (or {'items': [...]})."""
+        self.assertEqual(self.client.post('/api/food-estimate/batch', json={'food': 'rice'}).status_code, 400)
+        response = self.client.post('/api/food-estimate/batch', json={'items': [{'food': 'rice'}]})
+        self.assertEqual(response.get_json()['results'][0]['calories'], 130)
+
+
+class TestFoodSuggest(AppTestCase):
+    """Test the typeahead endpoint."""
+    
+    def test_suggestions(self):
+        """Test that completions are returned best first and limit is validated."""
+        data = self.client.get('/api/food-suggest?q=ch&limit=2').get_json()
+        self.assertEqual([s['food'] for s in data['suggestions']], ['chicken breast', 'cheese'])
+        self.assertEqual(self.client.get('/api/food-suggest?q=ch&limit=x').status_code, 400)
+
+
+class TestMealImportExport(AppTestCase):
+    """Test the bulk import and export endpoints."""
+    
+    def test_import_then_export(self):
+        """Test that an uploaded CSV is imported and streamed back out."""
+        self.set_up_profile()
+        upload = b"date,meal_name,food,amount,unit\n2024-01-01,Lunch,rice,200,g\n2024-01-01,Lunch,apple,1,piece\n"
+        response = self.client.post('/api/meals/import', data={'file': (io.BytesIO(upload), 'meals.csv')},
+                                    content_type='multipart/form-data')
+        self.assertEqual(response.get_json()['meals'], 1)
+        
+        exported = self.client.get('/api/meals/export?format=jsonl').get_data(as_text=True)
+        self.assertEqual(len(exported.splitlines()), 1)
+        self.assertIn('"date": "2024-01-01"', exported)
+        self.assertEqual(self.client.get('/api/meals/export?format=xml').status_code, 400)
+        self.assertEqual(self.client.post('/api/meals/import').status_code, 400)
+
+
+
+class TestInstrumentation(AppTestCase):
+    """Test request metrics, spans and sampled profiling."""
+    
+    def tearDown(self):
+        """Turn instrumentation back off."""
+        metrics.enable(False)
+        web.app.config['PROFILE_SAMPLE_RATE'] = 0
+        super().tearDown()
+    
+    def test_disabled_by_default(self):
+        """Test that /metrics is not served unless enabled."""
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertNotIn('Server-Timing', self.client.get('/').headers)
+    
+    def test_metrics_and_server_timing(self):
+        """Test that route latencies and code spans are exported."""
+        web.enable_instrumentation()
+        self.set_up_profile()
+        self.log_meal('lunch', [('rice', '200', 'g')])
+        response = self.client.get('/dashboard')
+        timing = response.headers['Server-Timing']
+        for name in ('get_tracker', 'render_template', 'total'):
+            self.assertIn(f'{name};dur=', timing)
+        
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('calories_requests_total{route="/dashboard",method="GET",status="200"}', text)
+        self.assertIn('calories_request_duration_seconds_count{route="/log-meal",method="POST"}', text)
+        for span in ('load_data', 'apply_event', 'save_event', 'estimate_calories', 'render_template'):
+            self.assertIn(f'calories_span_seconds_count{{span="{span}"}}', text)
+    
+    def test_sampled_profile_dump(self):
+        """Test that a sampled request leaves a cProfile dump."""
+        web.app.config['PROFILE_SAMPLE_RATE'] = 1
+        self.client.get('/api/food-estimate?food=rice')
+        dumps = os.listdir(web.app.config['PROFILE_DIR'])
+        self.assertEqual(len(dumps), 1)
+        self.assertTrue(dumps[0].endswith('-GET-api_food_estimate.prof'))
+
+
+class TestAsgi(AppTestCase):
+    """Test the ASGI wrapper around the Flask app."""
+    
+    def call(self, method, path, body=b'', headers=()):
+        """Run one request through the ASGI app; return (status, headers, body)."""
+        asgi_app = AsgiApp(web.app, max_workers=2)
+        path, _, query = path.partition('?')
+        scope = {'type': 'http', 'http_version': '1.1', 'method': method, 'path': path,
+                 'query_string': query.encode(), 'headers': [(b'host', b'localhost')] + list(headers)}
+        # Deliver the body in two parts to exercise more_body
+        messages = [{'type': 'http.request', 'body': body[:3], 'more_body': True},
+                    {'type': 'http.request', 'body': body[3:], 'more_body': False}]
+        sent = []
+        
+        async def receive():
+            return messages.pop(0)
+        
+        async def send(message):
+            sent.append(message)
+        
+        asyncio.run(asgi_app(scope, receive, send))
+        start = sent[0]
+        self.assertEqual(start['type'], 'http.response.start')
+        self.assertFalse(sent[-1].get('more_body', False))
+        return start['status'], dict(start['headers']), b''.join(m.get('body', b'') for m in sent[1:])
+    
+    def test_get_and_post(self):
+        """Test that status, headers, query strings and request bodies pass through."""
+        status, headers, _ = self.call('GET', '/')
+        self.assertEqual(status, 302)
+        self.assertIn(b'/setup', headers[b'location'])
+        
+        status, _, body = self.call('GET', '/api/food-estimate?food=rice&amount=200')
+        self.assertEqual((status, json.loads(body)['calories']), (200, 260))
+        
+        payload = json.dumps([{'food': 'banana'}]).encode()
+        status, _, body = self.call('POST', '/api/food-estimate/batch', payload,
+                                    [(b'content-type', b'application/json'),
+                                     (b'content-length', str(len(payload)).encode())])
+        self.assertEqual(json.loads(body)['results'][0]['calories'], 89)
+    
+    def test_streamed_response(self):
+        """Test that a streamed export arrives complete."""
+        self.set_up_profile()
+        self.log_meal('lunch', [('rice', '200', 'g')])
+        cookie = self.client.get_cookie('session')
+        headers = [(b'cookie', f'session={cookie.value}'.encode())] if cookie else []
+        status, _, body = self.call('GET', '/api/meals/export?format=jsonl', headers=headers)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['total_calories'], 260)
+    
+    def test_requests_run_concurrently(self):
+        """Test that requests get their own threads rather than queueing on one."""
+        barrier = threading.Barrier(2, timeout=5)
+        
+        def wsgi_app(environ, start_response):
+            barrier.wait()  # raises if the other request cannot run at the same time
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'ok']
+        
+        asgi_app = AsgiApp(wsgi_app, max_workers=2)
+        scope = {'type': 'http', 'http_version': '1.1', 'method': 'GET', 'path': '/', 'query_string': b'',
+                 'headers': []}
+        statuses = []
+        
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+        
+        async def main():
+            await asyncio.gather(asgi_app(scope, receive, send), asgi_app(scope, receive, send))
+        
+        asyncio.run(main())
+        self.assertEqual(statuses, [200, 200])
+
+
+if __name__ == '__main__':
+    unittest.main()
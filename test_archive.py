@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the columnar archive of older meal days
+"""
+
+import unittest
+import json
+import os
+import tempfile
+from datetime import datetime
+from analytics import get_analytics
+from archive import ColdArchive, archive_path, decode, encode
+from archive_history import run as archive_all
+from calories_app import CalorieTracker
+from data_layout import FlatLayout
+from meal_io import iter_export
+from migrate_to_sqlite import migrate
+from models import to_dict
+from storage import SQLiteStorage, create_storage
+
+
+def meal_on(date, name='Lunch', calories=260.0, **extra):
+    """A stored meal on date as a plain dict."""
+    meal = {
+        'meal_name': name,
+        'timestamp': f'{date} 12:30:05',
+        'items': [{'food': 'rice', 'calories': calories, 'amount_g': 200.0, 'amount_display': '200 g',
+                   'match': 'fuzzy', 'matched_to': 'rice', 'distance': 1},
+                  {'food': 'tea', 'calories': 0.0, 'amount_g': 250.0, 'amount_display': '1 cup',
+                   'match': 'exact'}],
+        'total_calories': calories
+    }
+    meal.update(extra)
+    return meal
+
+
+class TestColumns(unittest.TestCase):
+    """Test the columnar encoding."""
+    
+    def test_round_trip_is_lossless(self):
+        """Test that regular and irregular meals come back equal."""
+        days = {
+            '2024-01-01': [meal_on('2024-01-01'), meal_on('2024-01-01', 'Snack', 95.5)],
+            '2024-01-03': [meal_on('2024-01-03', note='leftovers'),
+                           meal_on('2024-01-03', timestamp='2024-01-04 00:30:00'),
+                           meal_on('2024-01-03', timestamp='noon'),
+                           meal_on('2024-01-03', items=[{'food': 'tea', 'calories': 1, 'brand': 'x'}])],
+        }
+        with tempfile.TemporaryDirectory() as temp_dir:
+            archive = ColdArchive(os.path.join(temp_dir, 'calorie_data_test.json.archive'))
+            archive.write(days, 1, {})
+            restored = dict(ColdArchive(archive.path).iter_days())
+            totals = archive.daily_totals()
+            ranged = [date for date, _ in archive.iter_days('2024-01-02', '2024-01-31')]
+        self.assertEqual({date: [to_dict(meal) for meal in meals] for date, meals in restored.items()}, days)
+        self.assertEqual(totals['2024-01-01'], {'calories': 355.5, 'meals': 2, 'items': 4})
+        self.assertEqual(ranged, ['2024-01-03'])
+    
+    def test_ints_stay_ints(self):
+        """Test that int calories and amounts come back as ints, not equal floats."""
+        meal = meal_on('2024-01-01', calories=130)
+        meal['items'][1]['amount_g'] = 250
+        days = {'2024-01-01': [meal]}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            archive = ColdArchive(os.path.join(temp_dir, 'calorie_data_test.json.archive'))
+            archive.write(days, 1, {})
+            restored = to_dict(next(archive.iter_days())[1][0])
+            totals = archive.daily_totals()
+        self.assertEqual(decode(encode(days))['irregular'], {})
+        self.assertEqual(restored, meal)
+        self.assertEqual([type(restored['total_calories']), type(restored['items'][0]['calories']),
+                          type(restored['items'][0]['amount_g']), type(restored['items'][1]['amount_g'])],
+                         [int, int, float, int])
+        self.assertIsInstance(totals['2024-01-01']['calories'], int)
+    
+    def test_archive_without_int_flags(self):
+        """Test that a body written before the int flags reads as all floats."""
+        body = encode({'2024-01-01': [meal_on('2024-01-01', calories=130)]})
+        for name in ('day_int', 'meal_int', 'item_int'):
+            del body[name]
+        columns = decode(body)
+        self.assertEqual(list(columns['meal_int']), [0])
+        self.assertEqual(len(columns['item_int']), 2)
+
+
+class TestTrackerArchive(unittest.TestCase):
+    """Test moving old days out of the tracker document."""
+    
+    def setUp(self):
+        """Set up a temporary data directory."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'calorie_data_test.json')
+    
+    def tearDown(self):
+        """Clean up the temporary directory."""
+        self.temp_dir.cleanup()
+    
+    def fill(self, tracker, days=20):
+        tracker.add_meals((f'2024-01-{day:02d}', meal_on(f'2024-01-{day:02d}', calories=100.0 + day))
+                          for day in range(1, days + 1))
+        tracker.add_meal(meal_on('2024-01-05', 'Dinner'), '2024-01-05')
+        return list(tracker.iter_history()), {date: dict(entry) for date, entry in tracker.history_totals().items()}
+    
+    def test_archive_moves_old_days(self):
+        """Test that old days leave the document but not the history, for each file backend."""
+        for kind in ('json', 'journal'):
+            path = f'{self.path}.{kind}'
+            tracker = CalorieTracker(path, create_storage(kind, path))
+            history, totals = self.fill(tracker)
+    
+            self.assertEqual(tracker.archive_history('2024-01-15'), {'days': 14, 'meals': 15})
+            self.assertEqual(min(tracker.data['meals']), '2024-01-15')
+            self.assertEqual(tracker.archive_history('2024-01-15'), {'days': 0, 'meals': 0})
+    
+            reloaded = CalorieTracker(path, create_storage(kind, path))
+            self.assertEqual(sorted(reloaded.data['meals']), sorted(tracker.data['meals']))
+            self.assertEqual(list(reloaded.iter_history()), history)
+            self.assertEqual(reloaded.history_totals(), totals)
+            self.assertEqual(reloaded.consumed_on('2024-01-05'), 365.0)
+            self.assertEqual([date for date, _ in reloaded.iter_history('2024-01-04', '2024-01-05')],
+                             ['2024-01-04', '2024-01-05', '2024-01-05'])
+    
+    def test_meals_logged_on_archived_days(self):
+        """Test that late meals on an archived day are merged, then archived with it."""
+        tracker = CalorieTracker(self.path)
+        self.fill(tracker)
+        tracker.archive_history('2024-01-15')
+        tracker.add_meal(meal_on('2024-01-05', 'Late'), '2024-01-05')
+    
+        self.assertEqual([meal['meal_name'] for date, meal in tracker.iter_history('2024-01-05', '2024-01-05')],
+                         ['Lunch', 'Dinner', 'Late'])
+        self.assertEqual(tracker.daily_totals('2024-01-05')['meals'], 3)
+        self.assertEqual(tracker.archive_history('2024-01-15'), {'days': 1, 'meals': 1})
+        self.assertEqual(len(dict(tracker.archive.iter_days())['2024-01-05']), 3)
+        self.assertEqual(tracker.archive.header()['generation'], 2)
+    
+    def test_interrupted_move_is_completed(self):
+        """Test that an archive written without the document update is not counted twice."""
+        tracker = CalorieTracker(self.path)
+        history, totals = self.fill(tracker)
+        old = {date: meals for date, meals in tracker.data['meals'].items() if date < '2024-01-15'}
+        # The process died after writing the archive
+        tracker.archive.write(old, 1, {date: len(meals) for date, meals in old.items()})
+    
+        reloaded = CalorieTracker(self.path)
+        self.assertFalse(tracker.is_current())
+        self.assertEqual(min(reloaded.data['meals']), '2024-01-15')
+        self.assertEqual(list(reloaded.iter_history()), history)
+        self.assertEqual(reloaded.history_totals(), totals)
+        self.assertEqual(reloaded.archive_history('2024-01-16'), {'days': 1, 'meals': 1})
+        self.assertEqual(list(CalorieTracker(self.path).iter_history()), history)
+    
+    def test_history_readers_include_archive(self):
+        """Test that analytics and export cover archived days."""
+        tracker = CalorieTracker(self.path)
+        self.fill(tracker)
+        tracker.archive_history('2024-01-15')
+    
+        self.assertEqual(get_analytics(tracker).summary()['logged_days'], 20)
+        lines = ''.join(iter_export(tracker, 'jsonl', '2024-01-01', '2024-01-31')).splitlines()
+        self.assertEqual(len(lines), 21)
+        self.assertEqual(json.loads(lines[0])['date'], '2024-01-01')
+    
+    def test_corrupt_archive_is_kept(self):
+        """Test that an unreadable archive is moved aside instead of failing loads."""
+        with open(archive_path(self.path), 'wb') as f:
+            f.write(b'garbage')
+        tracker = CalorieTracker(self.path)
+        self.assertEqual(tracker.history_totals(), {})
+        self.assertTrue(os.path.exists(f'{archive_path(self.path)}.corrupt'))
+    
+    def test_read_only_callers_leave_corrupt_archive(self):
+        """Test that the dry run and the migration report an unreadable archive without moving it."""
+        layout = FlatLayout(self.temp_dir.name)
+        self.fill(CalorieTracker(layout.path_for('a')))
+        with open(archive_path(layout.path_for('a')), 'wb') as f:
+            f.write(b'garbage')
+    
+        dry = archive_all(self.temp_dir.name, dry_run=True)
+        self.assertEqual((dry['users'], dry['failed']), (1, 1))
+        with self.assertRaises(ValueError):
+            migrate(self.temp_dir.name, os.path.join(self.temp_dir.name, 'calories.db'))
+        self.assertFalse(os.path.exists(f'{archive_path(layout.path_for("a"))}.corrupt'))
+        with open(archive_path(layout.path_for('a')), 'rb') as f:
+            self.assertEqual(f.read(), b'garbage')
+    
+    def test_sqlite_restores_archive(self):
+        """Test that SQLite users have no archive and migration brings archived days back."""
+        tracker = CalorieTracker(self.path)
+        history, _ = self.fill(tracker)
+        tracker.archive_history('2024-01-15')
+    
+        db_path = os.path.join(self.temp_dir.name, 'calories.db')
+        self.assertEqual(migrate(self.temp_dir.name, db_path), 1)
+        migrated = CalorieTracker(self.path, SQLiteStorage(db_path, 'test'))
+        SQLiteStorage.disconnect(db_path)
+        self.assertIsNone(migrated.archive)
+        self.assertEqual(list(migrated.iter_history()), history)
+        with self.assertRaises(ValueError):
+            migrated.archive_history('2024-01-15')
+    
+    def test_archive_job(self):
+        """Test the fleet-wide archive job over a data directory."""
+        layout = FlatLayout(self.temp_dir.name)
+        self.fill(CalorieTracker(layout.path_for('a')))
+        CalorieTracker(layout.path_for('b')).add_meal(meal_on('2024-01-20'), '2024-01-20')
+        # Not an ISO date, so neither the dry run nor the real run moves it
+        CalorieTracker(layout.path_for('b')).add_meal(meal_on('2023-1-1'), '2023-1-1')
+    
+        today = datetime(2024, 1, 25)
+        dry = archive_all(self.temp_dir.name, older_than=10, dry_run=True, today=today)
+        self.assertEqual((dry['users'], dry['users_archived'], dry['days'], dry['meals']), (2, 1, 14, 15))
+        result = archive_all(self.temp_dir.name, older_than=10, today=today)
+        self.assertEqual((result['users_archived'], result['days'], result['meals'], result['failed']),
+                         (1, 14, 15, 0))
+        self.assertEqual(archive_all(self.temp_dir.name, older_than=10, today=today)['days'], 0)
+        with self.assertRaises(ValueError):
+            archive_all(self.temp_dir.name, storage_kind='sqlite')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,13 @@ import unittest
 import json
 import os
 import tempfile
+import random
+from array import array
+from datetime import datetime
 from calories_app import CalorieCalculator, FoodDatabase, CalorieTracker
+from caching import LRUCache
+from food_catalogue import DictCatalogue, MmapCatalogue, RankedNames, write_catalogue
+from food_index import FoodIndex, FuzzyIndex, PrefixIndex, edit_distance
 
 
 class TestCalorieCalculator(unittest.TestCase):
@@ -49,6 +55,65 @@ class TestCalorieCalculator(unittest.TestCase):
         tdee = 1300  # Very low TDEE
         target = CalorieCalculator.calculate_target_calories(tdee, 'fast')
         self.assertGreaterEqual(target, 1200)  # Minimum safe calories
+    
+    def test_compute_batch_matches_scalar(self):
+        """Test that batch results are identical to the scalar path."""
+        profiles = [
+            (80, 180, 30, 'male', 'moderate', 'moderate', 72),
+            (60, 165, 25, 'female', 'sedentary', 'fast', 55),
+            (95.5, 172.3, 47, 'Male', 'very_active', 'slow', 80),
+            (52, 158, 22, 'female', 'unknown', 'unknown', 47),
+        ]
+        codes = [CalorieCalculator.encode_profile(p[3], p[4], p[5]) for p in profiles]
+        result = CalorieCalculator.compute_batch(
+            array('d', [p[0] for p in profiles]),
+            array('d', [p[1] for p in profiles]),
+            array('i', [p[2] for p in profiles]),
+            array('b', [c[0] for c in codes]),
+            array('b', [c[1] for c in codes]),
+            array('b', [c[2] for c in codes]),
+            ideal_weights=array('d', [p[6] for p in profiles]),
+        )
+        
+        for i, (weight, height, age, gender, activity, rate, ideal) in enumerate(profiles):
+            bmr = CalorieCalculator.calculate_bmr(weight, height, age, gender)
+            tdee = CalorieCalculator.calculate_tdee(bmr, activity)
+            target = CalorieCalculator.calculate_target_calories(tdee, rate)
+            ideal_tdee = CalorieCalculator.calculate_ideal_weight_tdee(weight, ideal, height, age, gender, activity)
+            self.assertEqual(result['bmr'][i], bmr)
+            self.assertEqual(result['tdee'][i], tdee)
+            self.assertEqual(result['target'][i], target)
+            self.assertEqual(result['ideal_tdee'][i], ideal_tdee)
+    
+    def test_compute_batch_unknown_codes(self):
+        """Test that unknown profile strings fall back exactly as the scalar methods do."""
+        codes = CalorieCalculator.encode_profile('other', 'couch', 'whenever')
+        self.assertEqual(codes, (0, -1, -1))
+        result = CalorieCalculator.compute_batch([90], [185], [35], *([c] for c in codes))
+        bmr = CalorieCalculator.calculate_bmr(90, 185, 35, 'other')
+        self.assertEqual(result['tdee'][0], bmr * 1.2)
+        self.assertEqual(result['target'][0], CalorieCalculator.calculate_target_calories(bmr * 1.2, 'whenever'))
+        self.assertAlmostEqual(result['target'][0], bmr * 1.2 - 550 / 7)
+    
+    def test_compute_batch_length_mismatch(self):
+        """Test that mismatched column lengths are rejected."""
+        with self.assertRaises(ValueError):
+            CalorieCalculator.compute_batch([80, 60], [180], [30, 25], [1, 0], [2, 0], [1, 1])
+    
+    def test_goal_plan(self):
+        """Test the gender-aware floor and the goal date estimate."""
+        start = datetime(2024, 1, 1)
+        plan = CalorieCalculator.goal_plan(2500, 80, 70, 'male', 'moderate', start)
+        self.assertEqual(plan['daily_target'], 1950)
+        self.assertFalse(plan['safety_floor_applied'])
+        self.assertEqual(plan['estimated_days_to_goal'], 140)
+        self.assertEqual(plan['estimated_goal_date'], '2024-05-20')
+        
+        floored = CalorieCalculator.goal_plan(1600, 60, 55, 'male', 'fast', start)
+        self.assertEqual(floored['daily_target'], 1500)
+        self.assertTrue(floored['safety_floor_applied'])
+        self.assertEqual(floored['actual_daily_deficit'], 100)
+        self.assertIsNone(CalorieCalculator.goal_plan(2000, 60, 65, 'female', 'slow')['estimated_goal_date'])
 
 
 class TestFoodDatabase(unittest.TestCase):
@@ -86,6 +151,283 @@ class TestFoodDatabase(unittest.TestCase):
         result1 = FoodDatabase.estimate_calories('BANANA', 100)
         result2 = FoodDatabase.estimate_calories('banana', 100)
         self.assertEqual(result1['calories'], result2['calories'])
+    
+    def test_estimate_batch(self):
+        """Test that batch results match single estimates and keep their order."""
+        results = FoodDatabase.estimate_batch([
+            {'food': 'banana', 'amount': 2, 'unit': 'piece'},
+            {'amount': 100},
+            {'food': 'rice'}
+        ])
+        self.assertEqual(results[0], FoodDatabase.estimate_calories('banana', 100, '2 piece'))
+        self.assertEqual(results[1], {'error': 'Food name required'})
+        self.assertEqual(results[2]['calories'], 130)
+
+
+class TestFoodIndex(unittest.TestCase):
+    """Test the FoodIndex partial-match lookups."""
+    
+    def linear_match(self, names, query):
+        """Reference implementation: the original linear partial-match scan."""
+        for key in names:
+            if key in query or query in key:
+                return key
+        return None
+    
+    def test_matches_linear_scan(self):
+        """Test that the index agrees with a linear scan, including tie-breaking."""
+        names = list(FoodDatabase.FOOD_CALORIES) + ['ice', 'cream cheese', 'tea latte', 'a']
+        index = FoodIndex(names)
+        queries = ['grilled chicken breast', 'chicken', 'green tea', 'ice cream cheese',
+                   'cheesecake', 'latte', 'steak', 'xyz', 'ban', 'c', '']
+        for query in queries:
+            self.assertEqual(index.partial(query), self.linear_match(names, query), query)
+    
+    def test_earliest_entry_wins(self):
+        """Test that the first catalogue entry wins when several names qualify."""
+        index = FoodIndex(['cream', 'ice cream', 'ice'])
+        self.assertEqual(index.partial('ice cream sandwich'), 'cream')
+        self.assertEqual(index.partial('ic'), 'ice cream')
+    
+    def test_no_match(self):
+        """Test that unrelated queries return None."""
+        index = FoodIndex(['banana', 'apple'])
+        self.assertIsNone(index.partial('quinoa'))
+    
+    def test_database_index_tracks_catalogue(self):
+        """Test that FoodDatabase rebuilds its index when FOOD_CALORIES grows."""
+        FoodDatabase.get_index()
+        FoodDatabase.FOOD_CALORIES['zucchini'] = 17
+        try:
+            result = FoodDatabase.estimate_calories('grilled zucchini', 100)
+            self.assertEqual(result['matched_to'], 'zucchini')
+        finally:
+            del FoodDatabase.FOOD_CALORIES['zucchini']
+            FoodDatabase.rebuild_index()
+
+
+class TestFuzzyIndex(unittest.TestCase):
+    """Test the misspelling tier."""
+    
+    def levenshtein(self, a, b):
+        """Reference edit distance without a bound."""
+        row = list(range(len(b) + 1))
+        for i, ca in enumerate(a, 1):
+            prev, row[0] = row[0], i
+            for j, cb in enumerate(b, 1):
+                prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (ca != cb))
+        return row[-1]
+    
+    def test_edit_distance(self):
+        """Test the bounded distance against the reference."""
+        for a, b in [('banana', 'bannana'), ('kitten', 'sitting'), ('', 'abc'), ('tea', 'tae'), ('rice', 'rice')]:
+            expected = self.levenshtein(a, b)
+            self.assertEqual(edit_distance(a, b, 5), expected)
+            self.assertEqual(edit_distance(a, b, 1), min(expected, 2))
+    
+    def test_matches_brute_force(self):
+        """Test that search returns the closest, earliest name a full scan would."""
+        names = list(FoodDatabase.FOOD_CALORIES) + ['banan', 'rice cake', 'grapes']
+        index = FuzzyIndex(names)
+        for query in ['bannana', 'chiken breast', 'brocoli', 'grap', 'rics', 'tae', 'pizzza', 'xyzzy', 'ot']:
+            bound = index.allowed_distance(query)
+            scored = [(self.levenshtein(query, name), rank) for rank, name in enumerate(names)]
+            distance, rank = min(scored)
+            expected = (names[rank], distance) if bound and distance <= bound else None
+            self.assertEqual(index.search(query), expected, query)
+    
+    def test_estimate_uses_fuzzy_tier(self):
+        """Test that misspellings resolve to the catalogue food with a distance."""
+        result = FoodDatabase.estimate_calories('Bannana', 200)
+        self.assertEqual(result['match'], 'fuzzy')
+        self.assertEqual(result['matched_to'], 'banana')
+        self.assertEqual(result['distance'], 1)
+        self.assertEqual(result['calories'], 178)
+        self.assertNotIn('distance', FoodDatabase.estimate_calories('banana', 100))
+    
+    def test_short_queries_are_not_corrected(self):
+        """Test that short words are not turned into a different food."""
+        index = FuzzyIndex(FoodDatabase.FOOD_CALORIES)
+        self.assertIsNone(index.search('beer'))
+        self.assertEqual(index.search('pizzza'), ('pizza', 1))
+        self.assertEqual(index.allowed_distance('brocoli'), 1)
+        self.assertEqual(index.allowed_distance('chiken breast'), 2)
+        self.assertEqual(FoodDatabase.estimate_calories('beer', 100)['match'], 'generic_estimate')
+
+
+class TestPrefixIndex(unittest.TestCase):
+    """Test typeahead completion."""
+    
+    def brute_force(self, names, query, limit):
+        """Reference ranking: whole-name prefixes, then later-word prefixes, by catalogue order."""
+        starts = [n for n in names if n.startswith(query)]
+        words = [n for n in names if n not in starts and any(w.startswith(query) for w in n.split()[1:])]
+        return (starts + words)[:limit]
+    
+    def test_matches_brute_force(self):
+        """Test ranking against a linear scan."""
+        names = list(FoodDatabase.FOOD_CALORIES) + ['cream cheese', 'green tea', 'iced tea latte', 'tea cake']
+        index = PrefixIndex(names)
+        for query in ['c', 'ch', 'chi', 'tea', 'te', 'cream', 'ice c', 'x', 'B']:
+            for limit in (1, 3, 10):
+                expected = self.brute_force(names, query.lower(), limit)
+                self.assertEqual([name for name, _ in index.complete(query, limit)], expected, query)
+                # Second call is served from the short-prefix cache
+                self.assertEqual([name for name, _ in index.complete(query, limit)], expected, query)
+    
+    def test_wide_ranges(self):
+        """Test uncached queries whose prefix covers most of a larger catalogue."""
+        rng = random.Random(7)
+        words = ['chicken', 'cheese', 'chips', 'chia', 'cherry', 'cake', 'corn']
+        names = list(dict.fromkeys(' '.join(rng.sample(words, rng.randint(1, 3))) for _ in range(400)))
+        index = PrefixIndex(names, cache_size=1)
+        for query in ['chic', 'chee', 'cherr', 'cake', 'corn']:
+            for limit in (1, 5, 50):
+                expected = self.brute_force(names, query, limit)
+                self.assertEqual([name for name, _ in index.complete(query, limit)], expected, query)
+    
+    def test_aliases(self):
+        """Test that aliases complete to their catalogue name."""
+        index = PrefixIndex(['chips', 'eggs'], {'crisps': 'chips', 'egg': 'eggs', 'fries': 'missing'})
+        self.assertEqual(index.complete('cri'), [('chips', 'crisps')])
+        self.assertEqual(index.complete('egg'), [('eggs', None)])
+        self.assertEqual(index.complete('fri'), [])
+    
+    def test_database_suggest(self):
+        """Test FoodDatabase.suggest results."""
+        suggestions = FoodDatabase.suggest('Yoghu')
+        self.assertEqual(suggestions, [{'food': 'yogurt', 'calories_per_100g': 59, 'alias': 'yoghurt'}])
+        self.assertEqual(FoodDatabase.suggest(''), [])
+
+
+class TestEstimateCache(unittest.TestCase):
+    """Test the LRU cache and its use in FoodDatabase."""
+    
+    def setUp(self):
+        """Start each test with an empty cache."""
+        FoodDatabase.estimate_cache.clear()
+        FoodDatabase.estimate_cache.reset_stats()
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first."""
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (1, 1, 1))
+        cache.resize(1)
+        self.assertEqual(len(cache), 1)
+        self.assertIn('c', cache)
+    
+    def test_cache_is_independent_of_amount(self):
+        """Test that repeat lookups hit the cache whatever the amount."""
+        first = FoodDatabase.estimate_calories('Banana ', 100)
+        second = FoodDatabase.estimate_calories('banana', 250, '2.5 serving')
+        self.assertEqual(first['calories'], 89)
+        self.assertEqual(second['calories'], 222.5)
+        self.assertEqual(second['amount_display'], '2.5 serving')
+        stats = FoodDatabase.cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+    
+    def test_cached_results_match_uncached(self):
+        """Test that cached approximate and generic results keep their fields."""
+        for food in ['grilled chicken breast', 'unknown exotic food']:
+            uncached = FoodDatabase.estimate_calories(food, 120)
+            cached = FoodDatabase.estimate_calories(food, 120)
+            self.assertEqual(cached, uncached)
+    
+    def test_invalidated_when_catalogue_changes(self):
+        """Test that adding a food drops stale cached results."""
+        self.assertEqual(FoodDatabase.estimate_calories('kiwi', 100)['match'], 'generic_estimate')
+        FoodDatabase.FOOD_CALORIES['kiwi'] = 61
+        try:
+            self.assertEqual(FoodDatabase.estimate_calories('kiwi', 100)['match'], 'exact')
+        finally:
+            del FoodDatabase.FOOD_CALORIES['kiwi']
+            FoodDatabase.rebuild_index()
+    
+    def test_invalidated_when_calories_change(self):
+        """Test that changing a food's calories in place drops stale cached results."""
+        catalogue = FoodDatabase.catalogue
+        original = catalogue.get('banana')
+        self.assertEqual(FoodDatabase.estimate_calories('banana', 100)['calories'], original)
+        catalogue.set('banana', original + 10)
+        try:
+            self.assertEqual(FoodDatabase.estimate_calories('banana', 100)['calories'], original + 10)
+        finally:
+            catalogue.set('banana', original)
+
+
+class TestFoodCatalogue(unittest.TestCase):
+    """Test the memory-mapped catalogue backend."""
+    
+    def setUp(self):
+        """Write a catalogue file from the built-in foods plus a few extras."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'foods.fcat')
+        foods = list(FoodDatabase.FOOD_CALORIES.items()) + [('Crème Brûlée', 300), ('zucchini', 17.5)]
+        write_catalogue(self.path, foods, FoodDatabase.FOOD_ALIASES)
+        self.catalogue = MmapCatalogue(self.path)
+    
+    def tearDown(self):
+        """Restore the default catalogue and remove the file."""
+        FoodDatabase.use_catalogue(DictCatalogue(FoodDatabase.FOOD_CALORIES))
+        self.catalogue.close()
+        self.temp_dir.cleanup()
+    
+    def test_lookup(self):
+        """Test exact lookups against the sorted string table."""
+        self.assertEqual(len(self.catalogue), len(FoodDatabase.FOOD_CALORIES) + 2)
+        self.assertEqual(self.catalogue.get('banana'), 89)
+        self.assertEqual(self.catalogue.get('zucchini'), 17.5)
+        self.assertEqual(self.catalogue.get('crème brûlée'), 300)
+        self.assertIsNone(self.catalogue.get('bananas'))
+        self.assertNotIn('', self.catalogue)
+    
+    def test_names_keep_catalogue_order(self):
+        """Test that names are returned in their original order."""
+        names = list(self.catalogue.names())
+        self.assertEqual(names[:len(FoodDatabase.FOOD_CALORIES)], list(FoodDatabase.FOOD_CALORIES))
+        self.assertEqual(names[-1], 'zucchini')
+    
+    def test_estimates_match_dict_backend(self):
+        """Test that estimates are the same with either backend."""
+        queries = ['chicken breast', 'grilled chicken breast', 'iced tea', 'unknown exotic food']
+        expected = [FoodDatabase.estimate_calories(q, 150) for q in queries]
+        FoodDatabase.load_catalogue(self.path)
+        self.assertEqual([FoodDatabase.estimate_calories(q, 150) for q in queries], expected)
+        self.assertEqual(FoodDatabase.estimate_calories('zucchini', 100)['calories'], 17.5)
+    
+    def test_indexes_are_read_from_the_file(self):
+        """Test that the stored search indexes answer like ones built in memory."""
+        names = list(self.catalogue.names())
+        food, fuzzy = self.catalogue.food_index(), self.catalogue.fuzzy_index()
+        prefix = self.catalogue.prefix_index(FoodDatabase.FOOD_ALIASES)
+        built = FoodIndex(names), FuzzyIndex(names), PrefixIndex(names, FoodDatabase.FOOD_ALIASES)
+        self.assertIsNotNone(food.postings.get('ban'))
+        for query in ['grilled chicken breast', 'iced tea', 'brûlée', 'nana', 'xyz']:
+            self.assertEqual(food.partial(query), built[0].partial(query), query)
+        for query in ['bananna', 'chiken breast', 'creme brulee', 'zuchini', 'qqqqqq']:
+            self.assertEqual(fuzzy.search(query), built[1].search(query), query)
+        for query in ['c', 'ch', 'chi', 'bre', 'yog', 'crè', 'zz']:
+            self.assertEqual(prefix.complete(query, 5), built[2].complete(query, 5), query)
+        self.assertIsNone(self.catalogue.prefix_index({'other': 'banana'}))
+        
+        FoodDatabase.load_catalogue(self.path)
+        self.assertIsInstance(FoodDatabase.get_index().ranks, RankedNames)
+        self.assertEqual(FoodDatabase.suggest('yoghu')[0]['food'], 'yogurt')
+    
+    def test_rejects_older_format(self):
+        """Test that a file from an older format version asks to be rebuilt."""
+        with open(self.path, 'r+b') as f:
+            f.seek(4)
+            f.write(bytes([MmapCatalogue.VERSION - 1]))
+        with self.assertRaisesRegex(ValueError, 'rebuild'):
+            MmapCatalogue(self.path)
 
 
 class TestCalorieTracker(unittest.TestCase):
@@ -145,6 +487,49 @@ class TestCalorieTracker(unittest.TestCase):
         self.assertIn('daily_target', profile)
         self.assertGreater(profile['tdee'], profile['bmr'])
         self.assertLess(profile['daily_target'], profile['tdee'])
+    
+    def make_meal(self, *foods):
+        """Build a meal entry from (food, grams) pairs."""
+        items = [FoodDatabase.estimate_calories(food, grams) for food, grams in foods]
+        return {
+            'meal_name': 'meal',
+            'timestamp': '2024-01-01 12:00:00',
+            'items': items,
+            'total_calories': round(sum(item['calories'] for item in items), 1)
+        }
+    
+    def test_daily_totals_track_adds_and_deletes(self):
+        """Test that the daily totals index is updated incrementally."""
+        self.tracker.add_meal(self.make_meal(('eggs', 100), ('bread', 50)), '2024-01-01')
+        self.tracker.add_meal(self.make_meal(('banana', 120)), '2024-01-01')
+        self.tracker.add_meal(self.make_meal(('rice', 200)), '2024-01-02')
+        self.assertEqual(self.tracker.daily_totals('2024-01-01'), {'calories': 394.3, 'meals': 2, 'items': 3})
+        
+        self.tracker.remove_meal('2024-01-01', 0)
+        self.assertEqual(self.tracker.daily_totals('2024-01-01'), {'calories': 106.8, 'meals': 1, 'items': 1})
+        self.assertEqual(self.tracker.consumed_on('2024-01-02'), 260)
+        self.assertEqual(self.tracker.consumed_on('2023-12-31'), 0)
+        
+        reloaded = CalorieTracker(self.temp_file.name)
+        self.assertEqual(reloaded.data['daily_totals'], self.tracker.data['daily_totals'])
+    
+    def test_daily_totals_resync_after_direct_edits(self):
+        """Test that totals are rebuilt on load when meals were edited directly."""
+        self.tracker.data['meals']['2024-01-01'] = [self.make_meal(('apple', 100)), self.make_meal(('milk', 200))]
+        self.tracker.save_data()
+        
+        reloaded = CalorieTracker(self.temp_file.name)
+        self.assertEqual(reloaded.daily_totals('2024-01-01'), {'calories': 136, 'meals': 2, 'items': 2})
+    
+    def test_apply_precondition(self):
+        """Test that an event is dropped when its check fails against fresh data."""
+        self.tracker.set_profile({'weight': 80})
+        CalorieTracker(self.temp_file.name).set_profile({'weight': 75})
+        
+        event = {'op': 'set_profile', 'profile': {'weight': 80, 'tdee': 2500}}
+        self.assertFalse(self.tracker.apply(event, check=lambda data: data['user_profile']['weight'] == 80))
+        self.assertEqual(CalorieTracker(self.temp_file.name).data['user_profile'], {'weight': 75})
+        self.assertTrue(self.tracker.apply(event, check=lambda data: data['user_profile']['weight'] == 75))
 
 
 class TestIntegration(unittest.TestCase):
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Unit tests for bulk meal import and export
+"""
+
+import unittest
+import io
+import json
+import os
+import tempfile
+from calories_app import CalorieTracker
+from meal_io import export_meals, import_meals
+from models import to_json
+from storage import JournalStorage, SQLiteStorage
+from test_storage import CountingStorage
+
+CSV_EXPORT = """date,meal_name,food,amount,unit,time
+2024-01-01,Breakfast,banana,1,piece,08:00
+2024-01-01,Breakfast,coffee,1,cup,08:00
+2024-01-01,Lunch,rice,200,g,12:30
+not-a-date,Lunch,rice,200,g,12:30
+2024-01-02,Breakfast,,1,piece,08:00
+2024-01-02,Dinner,chicken breast,150,,19:00
+"""
+
+
+class TestImport(unittest.TestCase):
+    """Test CSV and JSONL imports."""
+    
+    def test_csv_groups_rows_into_meals(self):
+        """Test that consecutive rows form meals, bad rows are skipped and one write is made."""
+        storage = CountingStorage()
+        tracker = CalorieTracker('import', storage)
+        result = import_meals(tracker, io.StringIO(CSV_EXPORT), 'csv')
+        
+        self.assertEqual((result['meals'], result['items'], result['skipped']), (3, 4, 2))
+        self.assertEqual([e['line'] for e in result['errors']], [5, 6])
+        self.assertEqual(storage.saves, 1)
+        
+        breakfast, lunch = tracker.data['meals']['2024-01-01']
+        self.assertEqual(breakfast['timestamp'], '2024-01-01 08:00:00')
+        self.assertEqual([item['food'] for item in breakfast['items']], ['banana', 'coffee'])
+        self.assertEqual(lunch['total_calories'], 260)
+        dinner = tracker.data['meals']['2024-01-02'][0]
+        self.assertEqual(dinner['items'][0]['calories'], 247.5)
+        self.assertEqual(tracker.daily_totals('2024-01-01')['meals'], 2)
+    
+    def test_missing_columns(self):
+        """Test that a CSV without the required columns is rejected."""
+        tracker = CalorieTracker('import', CountingStorage())
+        with self.assertRaises(ValueError):
+            import_meals(tracker, io.StringIO("date,food\n2024-01-01,rice\n"), 'csv')
+    
+    def test_jsonl_round_trip(self):
+        """Test that a JSONL export imports back to the same meals."""
+        source = CalorieTracker('source', CountingStorage())
+        import_meals(source, io.StringIO(CSV_EXPORT), 'csv')
+        exported = io.StringIO()
+        export_meals(source, exported, 'jsonl')
+        self.assertEqual(len(exported.getvalue().splitlines()), 3)
+        
+        copy = CalorieTracker('copy', CountingStorage())
+        result = import_meals(copy, io.StringIO(exported.getvalue() + "{broken\n"), 'jsonl')
+        self.assertEqual((result['meals'], result['skipped']), (3, 1))
+        self.assertEqual(copy.data['daily_totals'], source.data['daily_totals'])
+    
+    def test_csv_export_reimports(self):
+        """Test that a CSV export imports back to the same totals."""
+        source = CalorieTracker('source', CountingStorage())
+        import_meals(source, io.StringIO(CSV_EXPORT), 'csv')
+        exported = io.StringIO()
+        export_meals(source, exported, 'csv', start='2024-01-02')
+        self.assertEqual(len(exported.getvalue().splitlines()), 2)
+        
+        copy = CalorieTracker('copy', CountingStorage())
+        import_meals(copy, io.StringIO(exported.getvalue()), 'csv')
+        self.assertEqual(copy.data['daily_totals'], {'2024-01-02': source.data['daily_totals']['2024-01-02']})
+
+
+class TestBulkEvents(unittest.TestCase):
+    """Test that backends persist bulk imports."""
+    
+    def setUp(self):
+        """Set up a temporary directory."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        """Clean up temporary files."""
+        self.temp_dir.cleanup()
+    
+    def test_journal_and_sqlite(self):
+        """Test that an import reloads identically from the journal and SQLite backends."""
+        path = os.path.join(self.temp_dir.name, 'user.json')
+        db_path = os.path.join(self.temp_dir.name, 'calories.db')
+        for make_storage in (lambda: JournalStorage(path), lambda: SQLiteStorage(db_path, 'user')):
+            tracker = CalorieTracker(path, make_storage())
+            tracker.add_meal({'meal_name': 'Snack', 'timestamp': '2024-01-01 10:00:00',
+                              'items': [], 'total_calories': 0}, '2024-01-01')
+            import_meals(tracker, io.StringIO(CSV_EXPORT), 'csv')
+            reloaded = CalorieTracker(path, make_storage())
+            self.assertEqual(json.dumps(reloaded.data['meals'], sort_keys=True, default=to_json),
+                             json.dumps(tracker.data['meals'], sort_keys=True, default=to_json))
+            self.assertEqual(len(reloaded.data['meals']['2024-01-01']), 3)
+        SQLiteStorage.disconnect(db_path)
+        self.assertFalse(os.path.exists(path + '.journal'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the instrumentation helpers
+"""
+
+import unittest
+import metrics
+from metrics import Counter, Histogram, Registry
+
+
+class Sample:
+    """Class with methods to instrument."""
+    
+    @staticmethod
+    def double(x):
+        return 2 * x
+    
+    def triple(self, x):
+        return 3 * x
+
+
+class TestMetrics(unittest.TestCase):
+    """Test counters, histograms and spans."""
+    
+    def tearDown(self):
+        """Leave instrumentation off for other tests."""
+        metrics.enable(False)
+        metrics.finish_request()
+    
+    def test_prometheus_rendering(self):
+        """Test the text exposition of counters and cumulative histogram buckets."""
+        registry = Registry()
+        counter = registry.counter('hits', 'Hit count', ['route'])
+        histogram = registry.histogram('latency_seconds', 'Latency', ['route'], buckets=(0.1, 1.0))
+        counter.inc(('/a',))
+        counter.inc(('/a',), 2)
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value, ('/a',))
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE hits counter', lines)
+        self.assertIn('hits_total{route="/a"} 3', lines)
+        self.assertIn('latency_seconds_bucket{route="/a",le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{route="/a",le="1.0"} 3', lines)
+        self.assertIn('latency_seconds_bucket{route="/a",le="+Inf"} 4', lines)
+        self.assertIn('latency_seconds_count{route="/a"} 4', lines)
+        self.assertIn('latency_seconds_sum{route="/a"} 4.05', lines)
+    
+    def test_label_escaping(self):
+        """Test that quotes and backslashes in label values are escaped."""
+        counter = Counter('c', 'doc', ['path'])
+        counter.inc(('a"b\\c',))
+        self.assertEqual(list(counter.samples()), ['c_total{path="a\\"b\\\\c"} 1'])
+    
+    def test_spans_only_when_enabled(self):
+        """Test that spans are recorded per request once enabled."""
+        before = metrics.SPAN_SECONDS.count(('unit_test',))
+        with metrics.span('unit_test'):
+            pass
+        self.assertEqual(metrics.SPAN_SECONDS.count(('unit_test',)), before)
+        
+        metrics.enable()
+        metrics.start_request()
+        with metrics.span('unit_test'):
+            pass
+        spans = metrics.finish_request()
+        self.assertEqual([name for name, _ in spans], ['unit_test'])
+        self.assertEqual(metrics.SPAN_SECONDS.count(('unit_test',)), before + 1)
+    
+    def test_instrument_keeps_method_kind(self):
+        """Test that static and instance methods still work once wrapped, and are wrapped once."""
+        metrics.instrument(Sample, 'double', 'sample_double')
+        metrics.instrument(Sample, 'double', 'sample_double')
+        metrics.instrument(Sample, 'triple')
+        metrics.enable()
+        self.assertEqual(Sample.double(2), 4)
+        self.assertEqual(Sample().triple(2), 6)
+        self.assertEqual(metrics.SPAN_SECONDS.count(('sample_double',)), 1)
+        self.assertEqual(metrics.SPAN_SECONDS.count(('triple',)), 1)
+    
+    def test_histogram_without_labels(self):
+        """Test an unlabelled histogram."""
+        histogram = Histogram('h', 'doc', buckets=(1,))
+        histogram.observe(2)
+        self.assertEqual(list(histogram.samples())[-1], 'h_count 1')
+
+
+if __name__ == '__main__':
+    unittest.main()
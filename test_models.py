@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the slotted tracker document records
+"""
+
+import unittest
+import json
+import os
+import tempfile
+from calories_app import CalorieTracker
+from models import FoodItem, Meal, UserProfile, event_records, from_document, to_document, to_json
+from serializers import get_serializer
+
+
+def meal_dict(**extra):
+    """A stored meal as a plain dict."""
+    meal = {
+        'meal_name': 'Lunch',
+        'timestamp': '2024-01-01 12:00:00',
+        'items': [{'food': 'rice', 'calories': 260.0, 'amount_g': 200.0, 'amount_display': '200 g',
+                   'match': 'fuzzy', 'matched_to': 'rice', 'distance': 1}],
+        'total_calories': 260.0
+    }
+    meal.update(extra)
+    return meal
+
+
+class TestRecords(unittest.TestCase):
+    """Test conversion and the dict protocol."""
+    
+    def test_round_trip_is_lossless(self):
+        """Test that known, missing and unknown keys survive conversion."""
+        source = meal_dict(note='leftovers')
+        source['items'].append({'food': 'tea', 'calories': 1, 'brand': 'x'})
+        meal = Meal.from_dict(source)
+        self.assertIsInstance(meal.items[0], FoodItem)
+        self.assertEqual(meal.to_dict(), source)
+        self.assertNotIn('matched_to', meal.items[1])
+        self.assertEqual(meal.items[1]['brand'], 'x')
+        self.assertEqual(json.loads(json.dumps(meal, default=to_json)), source)
+    
+    def test_dict_protocol(self):
+        """Test read access the way dict-based code and templates use it."""
+        meal = Meal.from_dict(meal_dict())
+        self.assertEqual(meal['total_calories'], 260.0)
+        self.assertEqual(meal.get('missing', 'x'), 'x')
+        self.assertIn('items', meal)
+        self.assertEqual(dict(meal)['meal_name'], 'Lunch')
+        self.assertEqual(meal, meal_dict())
+        self.assertEqual(meal_dict(), meal)
+        with self.assertRaises(KeyError):
+            meal['note']
+        self.assertFalse(UserProfile.from_dict({}))
+        self.assertEqual(len(UserProfile(weight=80, created='2024-01-01')), 2)
+    
+    def test_repeated_strings_are_shared(self):
+        """Test that categorical strings are interned."""
+        first, second = (FoodItem.from_dict(json.loads('{"food": "chicken breast", "match": "exact"}'))
+                         for _ in range(2))
+        self.assertIs(first.food, second.food)
+    
+    def test_documents_and_events(self):
+        """Test whole-document conversion and mutation events."""
+        document = from_document({'user_profile': {'weight': 80}, 'meals': {'2024-01-01': [meal_dict()]}})
+        self.assertIsInstance(document['user_profile'], UserProfile)
+        self.assertIsInstance(document['meals']['2024-01-01'][0], Meal)
+        plain = to_document(document)
+        self.assertIs(type(plain['meals']['2024-01-01'][0]), dict)
+        self.assertEqual(get_serializer('binary').loads(get_serializer('binary').dumps(document)), plain)
+        
+        event = {'op': 'add_meal', 'date': '2024-01-01', 'meal': meal_dict()}
+        self.assertIsInstance(event_records(event)['meal'], Meal)
+        self.assertIs(type(event['meal']), dict)
+
+
+class TestTrackerRecords(unittest.TestCase):
+    """Test that the tracker holds records and writes plain documents."""
+    
+    def setUp(self):
+        """Set up a temporary data file."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'calorie_data_test.json')
+    
+    def tearDown(self):
+        """Clean up the temporary directory."""
+        self.temp_dir.cleanup()
+    
+    def test_tracker_round_trip(self):
+        """Test that the file written from records matches the dict input."""
+        tracker = CalorieTracker(self.path)
+        tracker.set_profile({'weight': 80, 'daily_target': 1800})
+        tracker.add_meal(meal_dict(), '2024-01-01')
+        self.assertIsInstance(tracker.data['meals']['2024-01-01'][0], Meal)
+        self.assertIsInstance(tracker.data['user_profile'], UserProfile)
+        
+        with open(self.path) as f:
+            stored = json.load(f)
+        self.assertEqual(stored['meals']['2024-01-01'], [meal_dict()])
+        self.assertEqual(CalorieTracker(self.path).data['meals'], tracker.data['meals'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,687 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the CalorieTracker storage backends
+"""
+
+import unittest
+import json
+import os
+import tempfile
+import time
+import threading
+from multiprocessing import Process
+from calories_app import CalorieCalculator, CalorieTracker
+from data_layout import FlatLayout, ShardedLayout
+from migrate_layout import migrate as migrate_layout
+from models import from_document, to_json
+from packing import pack_document, unpack_document
+from migrate_to_sqlite import migrate
+from recompute_profiles import process_chunk, recompute, run as recompute_all
+from serializers import BinarySerializer, get_serializer
+from storage import (JsonFileStorage, JournalStorage, SQLiteStorage, TrackerStorage, WriteBehindStorage,
+                     apply_event, create_storage)
+
+
+def make_meal(name, calories):
+    """Build a minimal meal entry."""
+    return {
+        'meal_name': name,
+        'timestamp': '2024-01-01 12:00:00',
+        'items': [{'food': name, 'calories': calories, 'amount_g': 100,
+                   'amount_display': '100g', 'match': 'generic_estimate'}],
+        'total_calories': calories
+    }
+
+
+def log_meals(path, backend, count):
+    """Worker process body: log count meals for the shared user."""
+    tracker = CalorieTracker(path, create_storage(backend, path))
+    for i in range(count):
+        tracker.add_meal(make_meal(f'{os.getpid()}-{i}', 100), '2024-01-01')
+
+
+def delete_first_meals(db_path, count, out_path):
+    """Worker process body: delete the first meal count times, writing down which one each time."""
+    tracker = CalorieTracker('alice', SQLiteStorage(db_path, 'alice'))
+    seen = []
+    for _ in range(count):
+        tracker.apply({'op': 'delete_meal', 'date': '2024-01-01', 'index': 0},
+                      check=lambda data: seen.append(data['meals']['2024-01-01'][0]['meal_name']) is None)
+    with open(out_path, 'w') as f:
+        json.dump(seen, f)
+
+
+class TestApplyEvent(unittest.TestCase):
+    """Test the shared mutation events."""
+    
+    def test_add_delete_and_profile(self):
+        """Test that each event type updates the document."""
+        data = {'user_profile': None, 'meals': {}}
+        self.assertTrue(apply_event(data, {'op': 'add_meal', 'date': '2024-01-01', 'meal': make_meal('a', 100)}))
+        self.assertTrue(apply_event(data, {'op': 'add_meal', 'date': '2024-01-01', 'meal': make_meal('b', 200)}))
+        self.assertTrue(apply_event(data, {'op': 'delete_meal', 'date': '2024-01-01', 'index': 0}))
+        self.assertFalse(apply_event(data, {'op': 'delete_meal', 'date': '2024-01-01', 'index': 5}))
+        self.assertTrue(apply_event(data, {'op': 'set_profile', 'profile': {'daily_target': 1800}}))
+        self.assertEqual([m['meal_name'] for m in data['meals']['2024-01-01']], ['b'])
+        self.assertEqual(data['user_profile']['daily_target'], 1800)
+    
+    def test_unknown_op(self):
+        """Test that unknown events are rejected."""
+        with self.assertRaises(ValueError):
+            apply_event({'user_profile': None, 'meals': {}}, {'op': 'rename'})
+
+
+
+class CountingStorage(TrackerStorage):
+    """In-memory backend that counts full saves."""
+    
+    def __init__(self):
+        self.saved = None
+        self.saves = 0
+    
+    def load(self):
+        return json.loads(self.saved) if self.saved else {'user_profile': None, 'meals': {}}
+    
+    def save(self, data):
+        self.saved = json.dumps(data, default=to_json)
+        self.saves += 1
+    
+    def version(self):
+        return self.saves
+
+
+class TestAtomicWrites(unittest.TestCase):
+    """Test crash-safe saving and write coalescing."""
+    
+    def setUp(self):
+        """Set up a temporary data directory."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'calorie_data_test.json')
+    
+    def tearDown(self):
+        """Clean up the temporary directory."""
+        self.temp_dir.cleanup()
+    
+    def test_save_replaces_file_without_leftovers(self):
+        """Test that saves go through a temporary file that is renamed into place."""
+        tracker = CalorieTracker(self.path)
+        tracker.set_profile({'daily_target': 1800})
+        inode = os.stat(self.path).st_ino
+        tracker.add_meal(make_meal('breakfast', 300), '2024-01-01')
+        
+        self.assertNotEqual(os.stat(self.path).st_ino, inode)
+        self.assertEqual([name for name in os.listdir(self.temp_dir.name) if name.endswith('.tmp')], [])
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), tracker.data)
+    
+    def test_corrupt_file_is_kept(self):
+        """Test that an unreadable file is moved aside instead of overwritten."""
+        with open(self.path, 'w') as f:
+            f.write('{"user_profile": {"weight": 7')
+        tracker = CalorieTracker(self.path)
+        self.assertEqual(tracker.data['meals'], {})
+        self.assertTrue(os.path.exists(self.path + '.corrupt'))
+    
+    def test_corrupt_file_found_on_reload(self):
+        """Test that a file corrupted under a loaded tracker is moved aside under the (held) lock."""
+        tracker = CalorieTracker(self.path)
+        tracker.add_meal(make_meal('breakfast', 300), '2024-01-01')
+        with open(self.path, 'w') as f:
+            f.write('{"meals": ')
+        tracker.add_meal(make_meal('lunch', 500), '2024-01-02')
+        self.assertTrue(os.path.exists(self.path + '.corrupt'))
+        self.assertEqual(list(CalorieTracker(self.path).data['meals']), ['2024-01-02'])
+    
+    def test_read_only_leaves_corrupt_file(self):
+        """Test that read-only storage reports an unreadable file without moving it."""
+        with open(self.path, 'w') as f:
+            f.write('{"user_profile": {"weight": 7')
+        for kind in ('json', 'journal'):
+            with self.assertRaises(ValueError):
+                create_storage(kind, self.path, read_only=True).load()
+        self.assertFalse(os.path.exists(self.path + '.corrupt'))
+    
+    def test_write_behind_coalesces(self):
+        """Test that several mutations in one window produce a single save."""
+        inner = CountingStorage()
+        tracker = CalorieTracker(self.path, WriteBehindStorage(inner, delay=60))
+        for i in range(5):
+            tracker.add_meal(make_meal(f'meal{i}', 100), '2024-01-01')
+        self.assertEqual(inner.saves, 0)
+        self.assertTrue(tracker.is_current())
+        
+        tracker.storage.flush()
+        self.assertEqual(inner.saves, 1)
+        self.assertEqual(len(inner.load()['meals']['2024-01-01']), 5)
+        self.assertTrue(tracker.is_current())
+    
+    def test_write_behind_flushes_after_delay(self):
+        """Test that pending writes reach disk once the window ends."""
+        tracker = CalorieTracker(self.path, create_storage('json', self.path, write_behind=0.05))
+        tracker.add_meal(make_meal('breakfast', 300), '2024-01-01')
+        deadline = time.time() + 5
+        while tracker.storage.dirty and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(CalorieTracker(self.path).data, tracker.data)
+    
+    def test_shared_instance_flushes_before_reload(self):
+        """Test that a second tracker for the same user sees pending writes."""
+        first = CalorieTracker(self.path, create_storage('json', self.path, write_behind=60))
+        first.add_meal(make_meal('breakfast', 300), '2024-01-01')
+        second = CalorieTracker(self.path, create_storage('json', self.path, write_behind=60))
+        self.assertIs(second.storage, first.storage)
+        self.assertEqual(second.data, first.data)
+        self.assertFalse(first.storage.dirty)
+
+
+class TestSerializers(unittest.TestCase):
+    """Test the pluggable file formats."""
+    
+    def setUp(self):
+        """Set up a temporary data directory."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'calorie_data_test.json')
+    
+    def tearDown(self):
+        """Clean up the temporary directory."""
+        self.temp_dir.cleanup()
+    
+    def test_round_trip(self):
+        """Test that every format reloads to the same document."""
+        for name in ('json', 'compact', 'binary', 'packed', 'packed-binary'):
+            tracker = CalorieTracker(self.path, create_storage('json', self.path, serializer=name))
+            tracker.set_profile({'weight': 70.5, 'daily_target': 1800, 'safety_floor_applied': False,
+                                 'estimated_goal_date': None})
+            tracker.add_meal(make_meal('café crème', 120.5), '2024-01-01')
+            self.assertEqual(CalorieTracker(self.path).data, tracker.data, name)
+    
+    def test_binary_is_smaller_and_detected(self):
+        """Test that binary files are detected on load and mixed formats coexist."""
+        json_tracker = CalorieTracker(self.path)
+        for i in range(20):
+            json_tracker.add_meal(make_meal(f'meal{i}', 100), '2024-01-01')
+        json_size = os.path.getsize(self.path)
+        
+        binary = CalorieTracker(self.path, create_storage('json', self.path, serializer='binary'))
+        self.assertEqual(binary.data, json_tracker.data)
+        binary.save_data()
+        with open(self.path, 'rb') as f:
+            self.assertTrue(f.read().startswith(BinarySerializer.MAGIC))
+        self.assertLess(os.path.getsize(self.path), json_size / 2)
+        self.assertEqual(CalorieTracker(self.path).data, json_tracker.data)
+    
+    def test_packed_documents_are_lossless(self):
+        """Test that meals and items of any shape survive dictionary encoding."""
+        fuzzy = dict(make_meal('rice', 130)['items'][0], match='fuzzy', matched_to='rice', distance=1)
+        odd_item = {'food': 'tea', 'calories': 1, 'distance': 0}
+        meals = [
+            make_meal('lunch', 500),
+            dict(make_meal('dinner', 700), items=[fuzzy, odd_item]),
+            dict(make_meal('late', 100), timestamp='2024-01-02 00:30:00'),
+            dict(make_meal('pm', 100), timestamp='2024-01-01 12:30 PM'),
+            dict(make_meal('noon', 100), timestamp='noon'),
+            dict(make_meal('noted', 100), note='leftovers'),
+            {'meal_name': 'bare', 'items': []},
+        ]
+        document = {'user_profile': {'weight': 80}, 'meals': {'2024-01-01': meals}, 'journal_seq': 3}
+        
+        packed = pack_document(document)
+        self.assertEqual(packed['strings'].count('lunch'), 1)
+        self.assertEqual(unpack_document(json.loads(json.dumps(packed))), document)
+        self.assertEqual(unpack_document(pack_document(from_document(json.loads(json.dumps(document))))),
+                         document)
+    
+    def test_packed_file_is_smaller(self):
+        """Test that repeated foods are stored once and journals replay over packed snapshots."""
+        tracker = CalorieTracker(self.path)
+        for i in range(50):
+            tracker.add_meal(make_meal('chicken breast', 165), f'2024-01-{i % 28 + 1:02d}')
+        compact_size = len(get_serializer('compact').dumps(tracker.data))
+        
+        path = os.path.join(self.temp_dir.name, 'calorie_data_packed.json')
+        packed = CalorieTracker(path, JournalStorage(path, serializer=get_serializer('packed')))
+        packed.add_meals(list((date, meal) for date, meals in tracker.data['meals'].items() for meal in meals))
+        packed.add_meal(make_meal('soup', 90), '2024-02-01')
+        with open(path, 'rb') as f:
+            content = f.read()
+        self.assertEqual(content.count(b'chicken breast'), 1)
+        self.assertLess(len(content), compact_size / 2)
+        self.assertEqual(CalorieTracker(path, JournalStorage(path)).data['meals'], packed.data['meals'])
+    
+    def test_corrupt_binary_file_is_kept(self):
+        """Test that a truncated binary file is moved aside."""
+        content = get_serializer('binary').dumps({'user_profile': None, 'meals': {'2024-01-01': []}})
+        with open(self.path, 'wb') as f:
+            f.write(content[:-3])
+        self.assertEqual(CalorieTracker(self.path).data['meals'], {})
+        self.assertTrue(os.path.exists(self.path + '.corrupt'))
+    
+    def test_unknown_serializer(self):
+        """Test that unknown format names are rejected."""
+        with self.assertRaises(ValueError):
+            get_serializer('yaml')
+
+
+class TestConcurrentWriters(unittest.TestCase):
+    """Test that concurrent workers do not lose each other's meals."""
+    
+    def setUp(self):
+        """Set up a temporary data directory."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'calorie_data_test.json')
+    
+    def tearDown(self):
+        """Clean up the temporary directory."""
+        self.temp_dir.cleanup()
+    
+    def check_no_lost_updates(self, backend):
+        """Run four writer processes and count the stored meals."""
+        workers = [Process(target=log_meals, args=(self.path, backend, 15)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        stored = CalorieTracker(self.path, create_storage(backend, self.path)).data['meals']['2024-01-01']
+        self.assertEqual(len(stored), 60)
+    
+    def test_json_file(self):
+        """Test concurrent writers with plain JSON files."""
+        self.check_no_lost_updates('json')
+    
+    def test_journal(self):
+        """Test concurrent writers with the journal backend."""
+        self.check_no_lost_updates('journal')
+    
+    def test_stale_tracker_merges(self):
+        """Test that a stale in-memory tracker reloads before mutating."""
+        first = CalorieTracker(self.path)
+        second = CalorieTracker(self.path)
+        first.add_meal(make_meal('breakfast', 300), '2024-01-01')
+        second.add_meal(make_meal('lunch', 500), '2024-01-01')
+        names = [m['meal_name'] for m in CalorieTracker(self.path).data['meals']['2024-01-01']]
+        self.assertEqual(names, ['breakfast', 'lunch'])
+    
+    def test_write_behind_merges_external_writes(self):
+        """Test that a delayed flush replays its events on top of newer data."""
+        buffered = CalorieTracker(self.path, WriteBehindStorage(JsonFileStorage(self.path), delay=60))
+        buffered.add_meal(make_meal('breakfast', 300), '2024-01-01')
+        CalorieTracker(self.path).add_meal(make_meal('lunch', 500), '2024-01-01')
+        buffered.storage.flush()
+        names = sorted(m['meal_name'] for m in CalorieTracker(self.path).data['meals']['2024-01-01'])
+        self.assertEqual(names, ['breakfast', 'lunch'])
+        self.assertFalse(buffered.is_current())
+
+
+class TestJournalStorage(unittest.TestCase):
+    """Test the append-only journal backend."""
+    
+    def setUp(self):
+        """Set up a temporary data directory."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'calorie_data_test.json')
+    
+    def tearDown(self):
+        """Clean up the temporary directory."""
+        self.temp_dir.cleanup()
+    
+    def test_mutations_append_without_snapshot(self):
+        """Test that meal changes only touch the journal."""
+        tracker = CalorieTracker(self.path, JournalStorage(self.path))
+        tracker.set_profile({'daily_target': 1800})
+        tracker.add_meal(make_meal('breakfast', 300), '2024-01-01')
+        tracker.add_meal(make_meal('lunch', 600), '2024-01-01')
+        tracker.remove_meal('2024-01-01', 0)
+        
+        self.assertFalse(os.path.exists(self.path))
+        with open(self.path + '.journal') as f:
+            self.assertEqual(len(f.readlines()), 4)
+        
+        reloaded = CalorieTracker(self.path, JournalStorage(self.path))
+        self.assertEqual(reloaded.data, tracker.data)
+    
+    def test_compaction(self):
+        """Test that the journal is folded into the snapshot."""
+        tracker = CalorieTracker(self.path, JournalStorage(self.path, compact_every=3))
+        for i in range(4):
+            tracker.add_meal(make_meal(f'meal{i}', 100), '2024-01-01')
+        
+        with open(self.path + '.journal') as f:
+            self.assertEqual(len(f.readlines()), 1)
+        reloaded = CalorieTracker(self.path, JournalStorage(self.path))
+        self.assertEqual(len(reloaded.data['meals']['2024-01-01']), 4)
+        self.assertNotIn(JournalStorage.SEQ_KEY, reloaded.data)
+    
+    def test_replay_skips_events_in_snapshot(self):
+        """Test recovery from a crash between snapshot write and journal removal."""
+        storage = JournalStorage(self.path)
+        tracker = CalorieTracker(self.path, storage)
+        tracker.add_meal(make_meal('breakfast', 300), '2024-01-01')
+        with open(self.path + '.journal') as f:
+            journal = f.read()
+        tracker.save_data()
+        with open(self.path + '.journal', 'w') as f:
+            f.write(journal)
+        
+        reloaded = CalorieTracker(self.path, JournalStorage(self.path))
+        self.assertEqual(len(reloaded.data['meals']['2024-01-01']), 1)
+    
+    def test_torn_last_line_is_ignored(self):
+        """Test that a partially written event does not break loading."""
+        tracker = CalorieTracker(self.path, JournalStorage(self.path))
+        tracker.add_meal(make_meal('breakfast', 300), '2024-01-01')
+        with open(self.path + '.journal', 'a') as f:
+            f.write('{"op": "add_meal", "da')
+        
+        reloaded = CalorieTracker(self.path, JournalStorage(self.path))
+        self.assertEqual(len(reloaded.data['meals']['2024-01-01']), 1)
+    
+    def test_events_after_torn_line_are_kept(self):
+        """Test that events appended after a torn line survive a reload."""
+        CalorieTracker(self.path, JournalStorage(self.path)).add_meal(make_meal('a', 100), '2024-01-01')
+        with open(self.path + '.journal', 'a') as f:
+            f.write('{"op":"add_meal","da')
+        tracker = CalorieTracker(self.path, JournalStorage(self.path))
+        tracker.add_meal(make_meal('b', 200), '2024-01-01')
+        tracker.add_meal(make_meal('c', 300), '2024-01-01')
+        
+        reloaded = CalorieTracker(self.path, JournalStorage(self.path))
+        self.assertEqual([m['meal_name'] for m in reloaded.data['meals']['2024-01-01']], ['a', 'b', 'c'])
+        self.assertEqual(reloaded.data, tracker.data)
+    
+    def test_reads_plain_json_file(self):
+        """Test switching an existing JSON user to the journal backend."""
+        tracker = CalorieTracker(self.path)
+        tracker.add_meal(make_meal('breakfast', 300), '2024-01-01')
+        self.assertIsInstance(tracker.storage, JsonFileStorage)
+        
+        reloaded = CalorieTracker(self.path, create_storage('journal', self.path))
+        self.assertEqual(reloaded.data, tracker.data)
+
+
+
+
+class TestStorageVersion(unittest.TestCase):
+    """Test the version tokens used to detect stale in-memory trackers."""
+    
+    def setUp(self):
+        """Set up a temporary data directory."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'calorie_data_test.json')
+        self.db_path = os.path.join(self.temp_dir.name, 'calories.db')
+    
+    def tearDown(self):
+        """Clean up the temporary directory."""
+        SQLiteStorage.disconnect(self.db_path)
+        self.temp_dir.cleanup()
+    
+    def check_staleness(self, make_storage):
+        """A tracker is current until another writer changes storage."""
+        first = CalorieTracker(self.path, make_storage())
+        first.add_meal(make_meal('breakfast', 300), '2024-01-01')
+        self.assertTrue(first.is_current())
+        
+        second = CalorieTracker(self.path, make_storage())
+        self.assertTrue(second.is_current())
+        second.add_meal(make_meal('lunch', 500), '2024-01-01')
+        self.assertFalse(first.is_current())
+        self.assertTrue(second.is_current())
+    
+    def test_json_file(self):
+        """Test staleness detection for plain JSON files."""
+        self.check_staleness(lambda: JsonFileStorage(self.path))
+    
+    def test_journal(self):
+        """Test staleness detection for the journal backend."""
+        self.check_staleness(lambda: JournalStorage(self.path))
+    
+    def test_sqlite(self):
+        """Test staleness detection for the SQLite backend."""
+        self.check_staleness(lambda: SQLiteStorage(self.db_path, 'alice'))
+
+
+class TestSQLiteStorage(unittest.TestCase):
+    """Test the SQLite backend and JSON migration."""
+    
+    def setUp(self):
+        """Set up a temporary database."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'calories.db')
+    
+    def tearDown(self):
+        """Close connections and clean up."""
+        SQLiteStorage.disconnect(self.db_path)
+        self.temp_dir.cleanup()
+    
+    def test_round_trip_and_events(self):
+        """Test that event writes reload to the same document."""
+        tracker = CalorieTracker('alice', SQLiteStorage(self.db_path, 'alice'))
+        tracker.set_profile({'daily_target': 1800})
+        tracker.add_meal(make_meal('breakfast', 300), '2024-01-02')
+        tracker.add_meal(make_meal('lunch', 600), '2024-01-02')
+        tracker.add_meal(make_meal('dinner', 700), '2024-01-01')
+        tracker.remove_meal('2024-01-02', 0)
+        
+        reloaded = CalorieTracker('alice', SQLiteStorage(self.db_path, 'alice'))
+        self.assertEqual(reloaded.data['user_profile'], {'daily_target': 1800})
+        self.assertEqual([m['meal_name'] for m in reloaded.data['meals']['2024-01-02']], ['lunch'])
+        self.assertEqual(reloaded.data['meals']['2024-01-01'][0], make_meal('dinner', 700))
+    
+    def test_users_are_isolated(self):
+        """Test that users sharing a database do not see each other's data."""
+        CalorieTracker('alice', SQLiteStorage(self.db_path, 'alice')).add_meal(make_meal('a', 1), '2024-01-01')
+        bob = CalorieTracker('bob', SQLiteStorage(self.db_path, 'bob'))
+        self.assertIsNone(bob.data['user_profile'])
+        self.assertEqual(bob.data['meals'], {})
+    
+    def test_meals_between(self):
+        """Test date range queries."""
+        storage = SQLiteStorage(self.db_path, 'alice')
+        tracker = CalorieTracker('alice', storage)
+        for day in range(1, 6):
+            tracker.add_meal(make_meal(f'day{day}', 100), f'2024-01-0{day}')
+        self.assertEqual(sorted(storage.meals_between('2024-01-02', '2024-01-04')),
+                         ['2024-01-02', '2024-01-03', '2024-01-04'])
+    
+    def test_concurrent_deletes(self):
+        """Test that index-based deletes from several processes each remove the meal they saw."""
+        CalorieTracker('alice', SQLiteStorage(self.db_path, 'alice')).add_meals(
+            ('2024-01-01', make_meal(f'meal{i}', 100)) for i in range(40))
+        outputs = [os.path.join(self.temp_dir.name, f'deleted{n}.json') for n in range(4)]
+        workers = [Process(target=delete_first_meals, args=(self.db_path, 10, out)) for out in outputs]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        deleted = []
+        for out in outputs:
+            with open(out) as f:
+                deleted.extend(json.load(f))
+        self.assertEqual(sorted(deleted), sorted(f'meal{i}' for i in range(40)))
+        self.assertEqual(SQLiteStorage(self.db_path, 'alice').load()['meals'], {})
+    
+    def test_write_waiting_on_the_lock_makes_tracker_stale(self):
+        """Test that a write queued behind ours is not mistaken for our own version."""
+        class SlowRecord(SQLiteStorage):
+            def record(self, data, event):
+                super().record(data, event)
+                time.sleep(0.2)  # widen the gap before the tracker reads the version
+        
+        first = CalorieTracker('alice', SlowRecord(self.db_path, 'alice'))
+        first.add_meals(('2024-01-01', make_meal(f'meal{i}', 100)) for i in range(3))
+        other = threading.Thread(target=lambda: CalorieTracker('alice', SQLiteStorage(self.db_path, 'alice'))
+                                 .remove_meal('2024-01-01', 0))
+        
+        def start_other(data):
+            other.start()
+            time.sleep(0.1)  # let it block on the write lock
+            return True
+        
+        first.apply({'op': 'delete_meal', 'date': '2024-01-01', 'index': 0}, check=start_other)
+        other.join()
+        self.assertFalse(first.is_current())
+        self.assertTrue(first.remove_meal('2024-01-01', 0))
+        self.assertEqual(SQLiteStorage(self.db_path, 'alice').load()['meals'], {})
+    
+    def test_migrate_json_files(self):
+        """Test bulk import of existing JSON files."""
+        for user_id in ('alice', 'bob'):
+            path = os.path.join(self.temp_dir.name, f'calorie_data_{user_id}.json')
+            tracker = CalorieTracker(path)
+            tracker.set_profile({'daily_target': 1500})
+            tracker.add_meal(make_meal(user_id, 400), '2024-01-01')
+        
+        self.assertEqual(migrate(self.temp_dir.name, self.db_path), 2)
+        bob = SQLiteStorage(self.db_path, 'bob').load()
+        self.assertEqual(bob['meals']['2024-01-01'][0]['meal_name'], 'bob')
+        self.assertEqual(bob['user_profile'], {'daily_target': 1500})
+    
+    def test_migrate_sharded_files(self):
+        """Test importing users from the sharded layout."""
+        layout = ShardedLayout(self.temp_dir.name)
+        for user_id in ('alice', 'bob'):
+            path = layout.path_for(user_id)
+            os.makedirs(os.path.dirname(path))
+            CalorieTracker(path).add_meal(make_meal(user_id, 400), '2024-01-01')
+        
+        self.assertEqual(migrate(self.temp_dir.name, self.db_path, 'sharded'), 2)
+        self.assertEqual(SQLiteStorage(self.db_path, 'alice').load()['meals']['2024-01-01'][0]['meal_name'], 'alice')
+
+
+class TestDataLayout(unittest.TestCase):
+    """Test the flat and sharded data directory layouts."""
+    
+    def setUp(self):
+        """Set up a temporary data directory."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = self.temp_dir.name
+    
+    def tearDown(self):
+        """Clean up the temporary directory."""
+        self.temp_dir.cleanup()
+    
+    def test_sharded_paths(self):
+        """Test that users are placed two hashed hex levels down."""
+        layout = ShardedLayout(self.data_dir)
+        path = layout.path_for('alice')
+        self.assertEqual(path, layout.path_for('alice'))
+        shard = os.path.relpath(os.path.dirname(path), self.data_dir).split(os.sep)
+        self.assertEqual([len(part) for part in shard], [2, 2])
+        self.assertEqual(os.path.basename(path), 'calorie_data_alice.json')
+        self.assertNotEqual(layout.shard('alice'), layout.shard('bob'))
+    
+    def test_iter_users_skips_other_files(self):
+        """Test listing users in both layouts."""
+        flat = FlatLayout(self.data_dir)
+        for user_id in ('b', 'a'):
+            CalorieTracker(flat.path_for(user_id)).set_profile({'daily_target': 1500})
+        open(os.path.join(self.data_dir, 'calories.db'), 'w').close()
+        os.makedirs(os.path.join(self.data_dir, 'ab', 'cd'))
+        self.assertEqual([user_id for user_id, _ in flat.iter_users()], ['a', 'b'])
+        self.assertEqual(list(ShardedLayout(self.data_dir).iter_users()), [])
+        self.assertEqual(list(FlatLayout(os.path.join(self.data_dir, 'missing')).iter_users()), [])
+    
+    def test_migrate_moves_files_and_journals(self):
+        """Test moving users from flat to sharded and back."""
+        flat, sharded = FlatLayout(self.data_dir), ShardedLayout(self.data_dir)
+        users = [f'user{n}' for n in range(20)]
+        for user_id in users:
+            path = flat.path_for(user_id)
+            tracker = CalorieTracker(path, JournalStorage(path))
+            tracker.set_profile({'daily_target': 1500})
+            tracker.add_meal(make_meal(user_id, 300), '2024-01-01')
+        
+        result = migrate_layout(self.data_dir, 'sharded', 'flat', workers=4)
+        self.assertEqual((result['moved'], result['failed']), (20, 0))
+        self.assertEqual(list(flat.iter_users()), [])
+        self.assertEqual(sorted(user_id for user_id, _ in sharded.iter_users()), sorted(users))
+        path = sharded.path_for('user3')
+        self.assertTrue(os.path.exists(f'{path}.journal'))
+        self.assertEqual(JournalStorage(path).load()['meals']['2024-01-01'][0]['meal_name'], 'user3')
+        
+        result = migrate_layout(self.data_dir, 'flat', 'sharded', workers=4)
+        self.assertEqual(result['moved'], 20)
+        self.assertEqual(len(list(flat.iter_users())), 20)
+    
+    def test_migrate_reports_conflicts(self):
+        """Test that an existing destination file is not overwritten."""
+        flat, sharded = FlatLayout(self.data_dir), ShardedLayout(self.data_dir)
+        CalorieTracker(flat.path_for('alice')).set_profile({'daily_target': 1500})
+        os.makedirs(os.path.dirname(sharded.path_for('alice')))
+        CalorieTracker(sharded.path_for('alice')).set_profile({'daily_target': 2000})
+        
+        result = migrate_layout(self.data_dir, 'sharded', 'flat')
+        self.assertEqual((result['moved'], result['failed']), (0, 1))
+        self.assertEqual(result['errors'][0]['user_id'], 'alice')
+        self.assertTrue(os.path.exists(flat.path_for('alice')))
+
+
+class TestRecomputeProfiles(unittest.TestCase):
+    """Test the fleet-wide profile recompute job."""
+    
+    PROFILE = {'weight': 80.0, 'height': 180.0, 'age': 30, 'gender': 'male', 'activity_level': 'moderate',
+               'weight_loss_rate': 'moderate', 'ideal_weight': 70.0}
+    
+    def setUp(self):
+        """Set up a temporary data directory."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.layout = FlatLayout(self.temp_dir.name)
+    
+    def tearDown(self):
+        """Clean up the temporary directory."""
+        self.temp_dir.cleanup()
+    
+    def save_profile(self, user_id, profile):
+        CalorieTracker(self.layout.path_for(user_id)).set_profile(profile)
+    
+    def load_profile(self, user_id):
+        return CalorieTracker(self.layout.path_for(user_id)).data['user_profile']
+    
+    def test_recompute_matches_scalar_path(self):
+        """Test that batch recomputation agrees with the scalar calculator."""
+        profile = recompute([self.PROFILE])[0]
+        bmr = CalorieCalculator.calculate_bmr(80, 180, 30, 'male')
+        tdee = CalorieCalculator.calculate_tdee(bmr, 'moderate')
+        self.assertEqual(profile['bmr'], round(bmr, 1))
+        self.assertEqual(profile['tdee'], round(tdee, 1))
+        self.assertEqual(profile['daily_target'], CalorieCalculator.goal_plan(tdee, 80, 70, 'male', 'moderate')['daily_target'])
+        self.assertEqual(profile['weight'], 80.0)
+    
+    def test_updates_stale_profiles_only(self):
+        """Test counts and write-back across a mixed directory."""
+        current = recompute([self.PROFILE])[0]
+        self.save_profile('current', current)
+        self.save_profile('stale', dict(current, tdee=1.0, daily_target=1.0))
+        self.save_profile('broken', {'weight': 'heavy'})
+        CalorieTracker(self.layout.path_for('empty')).add_meal(make_meal('lunch', 500), '2024-01-01')
+        
+        result = recompute_all(self.temp_dir.name, workers=2, chunk_size=2)
+        self.assertEqual({key: result[key] for key in ('profiles', 'updated', 'unchanged', 'no_profile', 'failed')},
+                         {'profiles': 2, 'updated': 1, 'unchanged': 1, 'no_profile': 1, 'failed': 1})
+        self.assertIn('broken', result['errors'][0]['path'])
+        self.assertEqual(self.load_profile('stale'), current)
+        self.assertEqual(recompute_all(self.temp_dir.name, workers=1)['updated'], 0)
+    
+    def test_keeps_plan_start_date(self):
+        """Test that goal dates keep counting from the original plan date."""
+        stale = dict(recompute([self.PROFILE])[0], estimated_goal_date='2024-03-01', estimated_days_to_goal=60)
+        self.save_profile('alice', stale)
+        process_chunk([self.layout.path_for('alice')])
+        profile = self.load_profile('alice')
+        self.assertEqual(profile['estimated_goal_date'], '2024-05-20')
+    
+    def test_dry_run_writes_nothing(self):
+        """Test that a dry run only counts stale profiles."""
+        stale = dict(recompute([self.PROFILE])[0], tdee=1.0)
+        self.save_profile('alice', stale)
+        self.assertEqual(process_chunk([self.layout.path_for('alice')], dry_run=True)['updated'], 1)
+        self.assertEqual(self.load_profile('alice'), stale)
+        
+        path = self.layout.path_for('bob')
+        with open(path, 'w') as f:
+            f.write('{"user_profile": ')
+        self.assertEqual(process_chunk([path], dry_run=True)['failed'], 1)
+        self.assertFalse(os.path.exists(path + '.corrupt'))
+
+
+if __name__ == '__main__':
+    unittest.main()